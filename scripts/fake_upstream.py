@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Fake Perplexity Upstream
+Local stand-in for /rest/sse/perplexity_ask with configurable latency and size
+
+Speaks the same SSE framing PerplexityFixed parses: a series of
+"event: message" events whose blocks carry the answer so far, a final event
+with the FINAL step, then "event: end_of_stream". Latency, answer size and
+error rate can be set per mode, so the proxy can be load tested without
+touching perplexity.ai.
+
+Usage:
+    python scripts/fake_upstream.py --port 8790 --latency 0.2,pro=0.8 --words 300
+    PERPLEXITY_UPSTREAM_URL=http://127.0.0.1:8790 python src/perplexity_api_server.py
+
+Per-mode values are given as "default,mode=value,...", e.g. "0.1,pro=0.5".
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# model_preference sent by PerplexityFixed -> mode
+MODEL_MODES = {
+    'turbo': 'auto',
+    'pplx_pro': 'pro',
+    'pplx_reasoning': 'reasoning',
+    'pplx_alpha': 'deep research',
+}
+
+WORDS = ('python', 'server', 'latency', 'request', 'stream', 'answer', 'search', 'token',
+         'cache', 'account', 'result', 'network', 'socket', 'thread', 'worker', 'query')
+
+
+def parse_mode_values(spec, cast=float):
+    """Parse "default,mode=value,..." into {None: default, mode: value}"""
+    values = {}
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '=' in part:
+            mode, value = part.split('=', 1)
+            values[mode.strip()] = cast(value)
+        else:
+            values[None] = cast(part)
+    return values
+
+
+def mode_value(values, mode, default):
+    return values.get(mode, values.get(None, default))
+
+
+def make_answer(words, seed=None):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for _ in range(words)) + '.'
+
+
+def rewrite_answer(answer):
+    """Final answer that differs from the streamed text (as when Perplexity edits its draft)"""
+    return answer[:1].upper() + answer[1:] + ' [1]'
+
+
+def sse_events(answer, chunks, final=None):
+    """
+    The SSE event payloads for one answer, split into `chunks` growing snapshots
+
+    The FINAL step carries `final` (default: the answer itself).
+    """
+    words = answer.split(' ')
+    chunks = max(1, min(chunks, len(words)))
+    for i in range(1, chunks + 1):
+        snapshot = ' '.join(words[:len(words) * i // chunks])
+        yield 'event: message\r\ndata: ' + json.dumps({'blocks': [{'text': snapshot}]})
+
+    steps = [{'step_type': 'FINAL', 'content': {'answer': json.dumps({'answer': final or answer})}}]
+    yield 'event: message\r\ndata: ' + json.dumps({'text': json.dumps(steps)})
+    yield 'event: end_of_stream\r\ndata: {}'
+
+
+class FakeUpstream:
+    def __init__(self, latency='0.1', words='200', chunks='10', chunk_interval='0.01',
+                 error_rate='0', rewrite_final=False, host='127.0.0.1', port=0):
+        """
+        Initialize the fake upstream (call start() to serve)
+
+        Args:
+            latency: Seconds before the first event, per mode
+            words: Answer length in words, per mode
+            chunks: Number of streamed snapshots, per mode
+            chunk_interval: Seconds between snapshots, per mode
+            error_rate: Fraction of requests answered with HTTP 429, per mode
+            rewrite_final: Send a FINAL answer that differs from the last snapshot
+            host, port: Address to bind (port 0 picks a free one)
+        """
+        self.latency = parse_mode_values(latency)
+        self.words = parse_mode_values(words, int)
+        self.chunks = parse_mode_values(chunks, int)
+        self.chunk_interval = parse_mode_values(chunk_interval)
+        self.error_rate = parse_mode_values(error_rate)
+        self.rewrite_final = rewrite_final
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-upstream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                if self.path != '/rest/sse/perplexity_ask':
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    params = json.loads(self.rfile.read(length) or b'{}').get('params', {})
+                except ValueError:
+                    params = {}
+                mode = MODEL_MODES.get(params.get('model_preference'), 'auto')
+                with upstream._lock:
+                    upstream.requests += 1
+
+                if random.random() < mode_value(upstream.error_rate, mode, 0):
+                    self.send_response(429)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                time.sleep(mode_value(upstream.latency, mode, 0.1))
+                answer = make_answer(mode_value(upstream.words, mode, 200))
+                interval = mode_value(upstream.chunk_interval, mode, 0.01)
+                final = rewrite_answer(answer) if upstream.rewrite_final else None
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                try:
+                    for i, event in enumerate(sse_events(answer, mode_value(upstream.chunks, mode, 10), final)):
+                        if i and interval:
+                            time.sleep(interval)
+                        self._write_chunk((event + '\r\n\r\n').encode('utf-8'))
+                    self._write_chunk(b'')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a fake perplexity_ask SSE endpoint')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--latency', default='0.1', help='Seconds to first event ("0.1,pro=0.5")')
+    parser.add_argument('--words', default='200', help='Answer length in words ("200,pro=600")')
+    parser.add_argument('--chunks', default='10', help='Streamed snapshots per answer')
+    parser.add_argument('--chunk-interval', default='0.01', help='Seconds between snapshots')
+    parser.add_argument('--error-rate', default='0', help='Fraction of requests answered with 429')
+    parser.add_argument('--rewrite-final', action='store_true',
+                        help='Send a final answer that differs from the last streamed snapshot')
+    args = parser.parse_args(argv)
+
+    upstream = FakeUpstream(args.latency, args.words, args.chunks, args.chunk_interval,
+                            args.error_rate, args.rewrite_final, host=args.host, port=args.port)
+    print(f"🧪 Fake upstream at {upstream.url}", file=sys.stderr)
+    try:
+        upstream.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+End-to-End Load Test
+Sweeps concurrency and mode mixes against the real server and a fake upstream
+
+Starts scripts/fake_upstream.py in-process, launches
+src/perplexity_api_server.py as a subprocess pointed at it (with a throwaway
+API key store), then for every (concurrency, mode mix) combination keeps
+that many /chat/completions requests in flight for a fixed time. Reports
+throughput, p50/p95/p99 latency, error rate, and the server process's CPU
+and RSS, and writes everything as JSON so runs can be compared across commits.
+
+Usage:
+    python scripts/load_test.py --concurrency 1,8,32 \\
+        --mix auto=1 --mix auto=0.6,pro=0.3,reasoning=0.1 \\
+        --duration 20 --latency 0.2,pro=0.6 --words 300 \\
+        --output results/load-$(git rev-parse --short HEAD).json \\
+        --baseline results/load-main.json
+
+CPU and RSS are read from /proc (Linux); elsewhere they are reported as null.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from key_store import KeyStore
+from fake_upstream import FakeUpstream
+from replay_requests import send_request, summarize
+
+PROJECT_ROOT = Path(__file__).parent.parent
+SERVER_SCRIPT = PROJECT_ROOT / 'src' / 'perplexity_api_server.py'
+
+MODE_MODELS = {
+    'auto': 'sonar',
+    'pro': 'sonar-pro',
+    'reasoning': 'sonar-reasoning',
+    'deep research': 'sonar-deep-research',
+}
+
+
+def parse_mix(spec):
+    """Parse "auto=0.7,pro=0.3" into normalized [(mode, weight), ...]"""
+    mix = []
+    for part in spec.split(','):
+        mode, _, weight = part.partition('=')
+        mode = mode.strip()
+        if mode not in MODE_MODELS:
+            raise ValueError(f"Unknown mode in mix: {mode}")
+        mix.append((mode, float(weight or 1)))
+    total = sum(w for _, w in mix)
+    return [(mode, w / total) for mode, w in mix]
+
+
+class ProcessSampler:
+    """Sample a process's CPU time and RSS from /proc in the background"""
+
+    def __init__(self, pid, interval=0.25):
+        self.pid = pid
+        self.interval = interval
+        self.clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+        self._stop = threading.Event()
+        self._thread = None
+        self.rss_samples = []
+        self.cpu_start = None
+        self.wall_start = None
+
+    def cpu_seconds(self):
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.clock_ticks  # utime + stime
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_mb(self):
+        try:
+            with open(f'/proc/{self.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def start(self):
+        self.rss_samples = []
+        self.cpu_start = self.cpu_seconds()
+        self.wall_start = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = self.rss_mb()
+            if rss is not None:
+                self.rss_samples.append(rss)
+
+    def stop(self):
+        """Stop sampling and return {'cpu_percent', 'rss_mb': {start, peak, end}}"""
+        self._stop.set()
+        self._thread.join()
+        cpu_end = self.cpu_seconds()
+        wall = time.time() - self.wall_start
+        rss = self.rss_samples or [self.rss_mb()]
+        cpu_percent = None
+        if self.cpu_start is not None and cpu_end is not None and wall > 0:
+            cpu_percent = round((cpu_end - self.cpu_start) / wall * 100, 1)
+        return {
+            'cpu_percent': cpu_percent,
+            'rss_mb': None if rss[0] is None else {
+                'start': round(rss[0], 1), 'peak': round(max(rss), 1), 'end': round(rss[-1], 1)
+            },
+        }
+
+
+def start_server(port, upstream_url, keys_db, extra_env=None):
+    """Launch the API server against the fake upstream and wait for /health"""
+    env = {k: v for k, v in os.environ.items() if not k.startswith('PERPLEXITY_COOKIE')}
+    env.update({
+        'PORT': str(port),
+        'PERPLEXITY_UPSTREAM_URL': upstream_url,
+        'API_KEYS_DB': str(keys_db),
+        'API_KEYS_FILE': str(Path(keys_db).with_suffix('.json')),
+        'PROVIDERS': 'perplexity',
+        'PYTHONUNBUFFERED': '1',
+    })
+    env.pop('REQUEST_LOG_PATH', None)
+    env.update(extra_env or {})
+
+    proc = subprocess.Popen([sys.executable, str(SERVER_SCRIPT)], env=env, cwd=str(PROJECT_ROOT),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=1):
+                return proc
+        except Exception:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Server did not become healthy within 30s")
+
+
+def run_level(target, api_key, concurrency, mix, duration, stream=False, seed=0, timeout=120):
+    """
+    Keep `concurrency` requests in flight for `duration` seconds
+
+    Returns:
+        (results, wall_time) where results is a list of (status, elapsed)
+    """
+    results = []
+    lock = threading.Lock()
+    deadline = time.time() + duration
+    modes = [mode for mode, _ in mix]
+    weights = [weight for _, weight in mix]
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        n = 0
+        while time.time() < deadline:
+            mode = rng.choices(modes, weights)[0]
+            record = {
+                'method': 'POST',
+                'path': '/chat/completions',
+                'body': {
+                    'model': MODE_MODELS[mode],
+                    'messages': [{'role': 'user', 'content': f'load test question {index}-{n}'}],
+                    'stream': stream,
+                },
+            }
+            status, elapsed = send_request(target, record, api_key=api_key, timeout=timeout)
+            n += 1
+            with lock:
+                results.append((status, elapsed))
+
+    start = time.time()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.time() - start
+
+
+def level_report(concurrency, mix_spec, results, wall_time, resources):
+    summary = summarize(results, wall_time)
+    errors = sum(count for status, count in summary['statuses'].items() if status != '200')
+    latencies = [elapsed for _, elapsed in results]
+
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        'concurrency': concurrency,
+        'mix': mix_spec,
+        'requests': summary['requests'],
+        'errors': errors,
+        'error_rate': round(errors / summary['requests'], 4) if summary['requests'] else None,
+        'throughput_rps': summary['throughput_rps'],
+        'latency_ms': {
+            'p50': ms(summary['p50']),
+            'p95': ms(summary['p95']),
+            'p99': ms(summary['p99']),
+            'mean': ms(sum(latencies) / len(latencies)) if latencies else None,
+            'max': ms(max(latencies)) if latencies else None,
+        },
+        'statuses': summary['statuses'],
+        **resources,
+    }
+
+
+def compare(results, baseline):
+    """Print throughput / p95 / CPU change per level against a previous run"""
+    previous = {(r['concurrency'], r['mix']): r for r in baseline.get('results', [])}
+    print(f"\n📊 Compared with {baseline.get('meta', {}).get('commit') or 'baseline'}:")
+    for result in results:
+        before = previous.get((result['concurrency'], result['mix']))
+        if not before:
+            continue
+
+        def change(new, old):
+            if new is None or not old:
+                return '   n/a'
+            return f"{(new - old) / old * 100:+6.1f}%"
+
+        print(f"   c={result['concurrency']:<4} {result['mix']:<30} "
+              f"rps {change(result['throughput_rps'], before['throughput_rps'])}  "
+              f"p95 {change(result['latency_ms']['p95'], before['latency_ms']['p95'])}  "
+              f"cpu {change(result['cpu_percent'], before.get('cpu_percent'))}")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(PROJECT_ROOT),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the API server against a fake upstream')
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    parser.add_argument('--mix', action='append', help='Mode mix, e.g. auto=0.7,pro=0.3 (repeatable)')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per level')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of warm-up before the sweep')
+    parser.add_argument('--stream', action='store_true', help='Use streaming /chat/completions')
+    parser.add_argument('--latency', default='0.1', help='Upstream seconds to first event ("0.1,pro=0.5")')
+    parser.add_argument('--words', default='200', help='Upstream answer length in words')
+    parser.add_argument('--chunks', default='10', help='Upstream streamed snapshots per answer')
+    parser.add_argument('--chunk-interval', default='0.01', help='Upstream seconds between snapshots')
+    parser.add_argument('--error-rate', default='0', help='Fraction of upstream requests answered with 429')
+    parser.add_argument('--port', type=int, default=8799, help='Port for the server under test')
+    parser.add_argument('--output', help='Write JSON results here (default: stdout)')
+    parser.add_argument('--baseline', help='Previous results JSON to compare against')
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    mixes = args.mix or ['auto=1']
+    for spec in mixes:
+        parse_mix(spec)  # validate before starting anything
+
+    upstream = FakeUpstream(args.latency, args.words, args.chunks, args.chunk_interval,
+                            args.error_rate).start()
+    workdir = tempfile.TemporaryDirectory(prefix='pplx-load-')
+    keys_db = Path(workdir.name) / 'api_keys.db'
+    store = KeyStore(keys_db)
+    api_key, _ = store.create('load-test')
+    store.close()
+
+    print(f"🧪 Fake upstream at {upstream.url}", file=sys.stderr)
+    server = start_server(args.port, upstream.url, keys_db)
+    target = f'http://127.0.0.1:{args.port}'
+    print(f"🚀 Server under test: {target} (pid {server.pid})", file=sys.stderr)
+
+    results = []
+    try:
+        if args.warmup:
+            run_level(target, api_key, max(levels), parse_mix(mixes[0]), args.warmup, args.stream)
+
+        sampler = ProcessSampler(server.pid)
+        for spec in mixes:
+            mix = parse_mix(spec)
+            for seed, concurrency in enumerate(levels):
+                sampler.start()
+                level_results, wall_time = run_level(target, api_key, concurrency, mix, args.duration,
+                                                     args.stream, seed=seed)
+                report = level_report(concurrency, spec, level_results, wall_time, sampler.stop())
+                results.append(report)
+                print(f"   c={concurrency:<4} {spec:<30} {report['throughput_rps']:>8} rps  "
+                      f"p50 {report['latency_ms']['p50']}ms  p95 {report['latency_ms']['p95']}ms  "
+                      f"p99 {report['latency_ms']['p99']}ms  err {report['error_rate']}  "
+                      f"cpu {report['cpu_percent']}%  rss {(report['rss_mb'] or {}).get('peak')}MB",
+                      file=sys.stderr)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=40)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        upstream.stop()
+        workdir.cleanup()
+
+    output = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.output).write_text(json.dumps(output, indent=2))
+        print(f"💾 Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(output, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
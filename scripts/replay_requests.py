@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Replay a captured request log against a target server
+
+Reads the JSONL written by the server's request log (REQUEST_LOG_PATH) and
+re-sends each request with its original spacing, compressed by --speed, so
+production traffic shapes can be reproduced for capacity testing.
+
+Usage:
+    python scripts/replay_requests.py logs/requests.jsonl \\
+        --target http://localhost:8765 --api-key pplx_... --speed 10
+
+Each request is sent from its own thread at its scheduled time, so a slow
+response never delays the requests that follow it. With --workers N at most
+N requests are in flight; sends past that cap wait for a slot, and the
+longest such wait is reported as send_lag_max.
+"""
+
+import sys
+import json
+import time
+import argparse
+import threading
+import urllib.request
+import urllib.error
+
+
+def load_records(path, paths=None, methods=None):
+    """Load log records, keeping only the selected paths/methods, ordered by ts"""
+    records = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if paths and record.get('path') not in paths:
+                continue
+            if methods and record.get('method') not in methods:
+                continue
+            records.append(record)
+
+    records.sort(key=lambda r: r.get('ts', 0))
+    return records
+
+
+def send_request(target, record, api_key=None, timeout=600):
+    """Send one recorded request, returning (status, elapsed seconds)"""
+    url = target.rstrip('/') + record['path']
+    if record.get('query_string'):
+        url += '?' + record['query_string']
+
+    body = record.get('body')
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    headers = {'Content-Type': 'application/json'} if data is not None else {}
+    if api_key:
+        headers['Authorization'] = f'Bearer {api_key}'
+
+    req = urllib.request.Request(url, data=data, headers=headers, method=record.get('method', 'GET'))
+    start = time.time()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = None
+    return status, time.time() - start
+
+
+def replay(records, target, speed=1.0, api_key=None, max_workers=0, timeout=600):
+    """
+    Replay records against target at `speed`x the original rate
+
+    Args:
+        max_workers: Cap on requests in flight (0 = no cap)
+
+    Returns:
+        Summary dict with counts per status, latency percentiles and send lag
+    """
+    results = []
+    lags = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_workers) if max_workers else None
+
+    def run(record, due):
+        if slots is not None:
+            slots.acquire()
+        try:
+            with lock:
+                lags.append(max(0.0, time.time() - due))
+            status, elapsed = send_request(target, record, api_key=api_key, timeout=timeout)
+            with lock:
+                results.append((status, elapsed))
+        finally:
+            if slots is not None:
+                slots.release()
+
+    if not records:
+        return summarize(results, 0.0)
+
+    first_ts = records[0].get('ts', 0)
+    start = time.time()
+    threads = []
+    for record in records:
+        due = start + (record.get('ts', first_ts) - first_ts) / speed
+        delay = due - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        thread = threading.Thread(target=run, args=(record, due), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+
+    return summarize(results, time.time() - start, lags)
+
+
+def summarize(results, wall_time, lags=None):
+    """Build a summary of replay results (lags: seconds each send started late)"""
+    latencies = sorted(elapsed for _, elapsed in results)
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def percentile(p):
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))
+        return round(latencies[index], 4)
+
+    summary = {
+        'requests': len(results),
+        'wall_time': round(wall_time, 2),
+        'throughput_rps': round(len(results) / wall_time, 2) if wall_time else None,
+        'statuses': statuses,
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'p99': percentile(99),
+    }
+    if lags:
+        summary['send_lag_max'] = round(max(lags), 4)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay a captured request log against a server')
+    parser.add_argument('log', help='JSONL request log to replay')
+    parser.add_argument('--target', default='http://localhost:8765', help='Base URL of the target server')
+    parser.add_argument('--api-key', help='API key to send with every request')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed multiplier (e.g. 10 = 10x faster)')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Only replay these paths (repeatable, default: /chat/completions)')
+    parser.add_argument('--all-paths', action='store_true', help='Replay every logged path')
+    parser.add_argument('--workers', type=int, default=0, help='Max concurrent in-flight requests (0 = no cap)')
+    parser.add_argument('--timeout', type=float, default=600, help='Per-request timeout in seconds')
+    args = parser.parse_args(argv)
+
+    paths = None if args.all_paths else (args.paths or ['/chat/completions'])
+    records = load_records(args.log, paths=paths)
+    print(f"🔁 Replaying {len(records)} requests against {args.target} at {args.speed}x", file=sys.stderr)
+
+    summary = replay(records, args.target, speed=args.speed, api_key=args.api_key,
+                     max_workers=args.workers, timeout=args.timeout)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Multi-Account Upstream Pool
+Routes searches across several Perplexity cookie identities by health score
+
+Each account wraps its own PerplexityFixed client and keeps rolling health
+stats: latency and error rate (exponentially weighted), plus consecutive
+failures. Throttling or auth errors from the SSE stream eject an account
+immediately; repeated generic failures eject it too. Ejections back off
+exponentially, and once an ejection expires the account is re-admitted
+through a single probe request (half-open) before taking full traffic.
+
+Accounts remember the environment variable their cookie came from, so a
+hot-reloaded PERPLEXITY_COOKIE replaces that account and no other.
+
+Usage:
+    from account_pool import AccountPool
+    pool = AccountPool.from_env()
+    answer = pool.search("What is Python?", mode='pro')
+
+Environment:
+    PERPLEXITY_COOKIE      Primary account cookie string
+    PERPLEXITY_COOKIE_<N>  Additional accounts (PERPLEXITY_COOKIE_2, _3, ...)
+"""
+
+import os
+import re
+import time
+import random
+import threading
+
+from perplexity_fixed import (
+    PerplexityFixed, RequestCancelled, UpstreamError, UpstreamThrottled, UpstreamAuthError
+)
+
+PRIMARY_COOKIE = 'PERPLEXITY_COOKIE'
+
+HEALTHY = 'healthy'
+EJECTED = 'ejected'
+PROBING = 'probing'
+
+
+def parse_cookie_string(cookie_str):
+    """Parse "a=1; b=2" into a cookies dict"""
+    cookies = {}
+    for cookie_pair in cookie_str.split(';'):
+        cookie_pair = cookie_pair.strip()
+        if '=' in cookie_pair:
+            name, value = cookie_pair.split('=', 1)
+            cookies[name.strip()] = value.strip()
+    return cookies
+
+
+class Account:
+    """One upstream identity and its rolling health"""
+
+    def __init__(self, name, client, alpha=0.2, source=None):
+        self.name = name
+        self.client = client
+        self.alpha = alpha
+        self.source = source         # env var the cookie came from, if any
+
+        self.state = HEALTHY
+        self.latency = None          # EWMA seconds
+        self.error_rate = 0.0        # EWMA of failures (0..1)
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_error = None
+        self.active = 0
+        self.requests = 0
+
+    def score(self, latency_ref=5.0):
+        """Higher is better: success rate, discounted by latency and current load"""
+        latency = self.latency if self.latency is not None else latency_ref
+        return (1.0 - self.error_rate) / (1.0 + latency / latency_ref) / (1 + self.active)
+
+    def status(self):
+        return {
+            'name': self.name,
+            'state': self.state,
+            'score': round(self.score(), 4),
+            'latency_ewma': round(self.latency, 3) if self.latency is not None else None,
+            'error_rate': round(self.error_rate, 3),
+            'consecutive_failures': self.consecutive_failures,
+            'ejected_for': max(0, round(self.ejected_until - time.time(), 1)) if self.state == EJECTED else 0,
+            'in_flight': self.active,
+            'requests': self.requests,
+            'last_error': self.last_error,
+        }
+
+
+class AccountStream:
+    """
+    Chunks of one streaming search; releases its account exactly once
+
+    The account is acquired (and the upstream request sent) before the
+    caller starts iterating, so release cannot live in a generator's
+    finally: an unstarted generator that is closed or garbage-collected
+    never runs it. Closing (or dropping) the stream counts as a
+    cancellation.
+    """
+
+    def __init__(self, pool, account, start, chunks):
+        self.released = False
+        self.pool = pool
+        self.account = account
+        self.start = start
+        self.chunks = iter(chunks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.released:
+            raise StopIteration
+        try:
+            return next(self.chunks)
+        except StopIteration:
+            self._release()
+            raise
+        except Exception as e:
+            self._release(e)
+            raise
+        except BaseException:
+            self._release(RequestCancelled())
+            raise
+
+    def close(self):
+        if self.released:
+            return
+        close = getattr(self.chunks, 'close', None)
+        try:
+            if close is not None:
+                close()  # closes the upstream response
+        finally:
+            self._release(RequestCancelled())
+
+    def __del__(self):
+        self.close()
+
+    def _release(self, error=None):
+        if not self.released:
+            self.released = True
+            self.pool.release(self.account, elapsed=time.time() - self.start, error=error)
+
+
+class AccountPool:
+    def __init__(self, accounts, eject_after=3, base_ejection=30.0, auth_ejection=300.0,
+                 max_ejection=900.0):
+        """
+        Initialize the pool
+
+        Args:
+            accounts: List of Account objects (at least one)
+            eject_after: Consecutive generic failures before ejection
+            base_ejection: Seconds a throttled/failing account sits out (doubles per repeat)
+            auth_ejection: Seconds an account with rejected cookies sits out
+            max_ejection: Upper bound on any ejection
+        """
+        if not accounts:
+            raise ValueError("AccountPool needs at least one account")
+        self.accounts = list(accounts)
+        self.eject_after = eject_after
+        self.base_ejection = base_ejection
+        self.auth_ejection = auth_ejection
+        self.max_ejection = max_ejection
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_cookie_strings(cls, cookie_strings, client_factory=PerplexityFixed, **kwargs):
+        """Build a pool with one account per cookie string (anonymous if none)"""
+        accounts = [
+            Account(f"account-{i + 1}", client_factory(cookies=parse_cookie_string(c)))
+            for i, c in enumerate(cookie_strings) if c and c.strip()
+        ]
+        if not accounts:
+            accounts = [Account('anonymous', client_factory(cookies=None))]
+        return cls(accounts, **kwargs)
+
+    @classmethod
+    def from_cookie_sources(cls, cookie_sources, client_factory=PerplexityFixed, **kwargs):
+        """Build a pool from {env var: cookie string}, naming accounts after their variable"""
+        accounts = [
+            Account(account_name(source), client_factory(cookies=parse_cookie_string(c)), source=source)
+            for source, c in cookie_sources.items() if c and c.strip()
+        ]
+        if not accounts:
+            accounts = [Account('anonymous', client_factory(cookies=None))]
+        return cls(accounts, **kwargs)
+
+    @classmethod
+    def from_env(cls, environ=None, **kwargs):
+        """Build a pool from PERPLEXITY_COOKIE and PERPLEXITY_COOKIE_<N>"""
+        return cls.from_cookie_sources(cookie_sources_from_env(environ), **kwargs)
+
+    def acquire(self):
+        """
+        Pick the best available account and mark it in flight
+
+        Ejected accounts whose time is up move to PROBING and take one request
+        at a time. If every account is ejected, the one closest to re-admission
+        is used rather than failing outright.
+        """
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for account in self.accounts:
+                if account.state == EJECTED and now >= account.ejected_until:
+                    account.state = PROBING
+                if account.state == HEALTHY or (account.state == PROBING and account.active == 0):
+                    candidates.append(account)
+
+            if candidates:
+                best = max(a.score() for a in candidates)
+                account = random.choice([a for a in candidates if a.score() == best])
+            else:
+                account = min(self.accounts, key=lambda a: (a.ejected_until, a.active))
+
+            account.active += 1
+            account.requests += 1
+            return account
+
+    def release(self, account, elapsed=None, error=None):
+        """Record the outcome of a request on an account"""
+        with self._lock:
+            account.active -= 1
+            if isinstance(error, RequestCancelled):
+                return  # caller went away; says nothing about the account
+
+            alpha = account.alpha
+            if error is None:
+                account.error_rate = (1 - alpha) * account.error_rate
+                if elapsed is not None:
+                    account.latency = elapsed if account.latency is None else (1 - alpha) * account.latency + alpha * elapsed
+                account.consecutive_failures = 0
+                if account.state == PROBING:
+                    print(f"✅ {account.name} re-admitted after probe")
+                account.state = HEALTHY
+                account.ejections = 0
+                return
+
+            account.error_rate = (1 - alpha) * account.error_rate + alpha
+            account.consecutive_failures += 1
+            account.last_error = f"{type(error).__name__}: {error}"
+
+            if isinstance(error, UpstreamAuthError):
+                self._eject(account, self.auth_ejection)
+            elif isinstance(error, UpstreamThrottled):
+                self._eject(account, self.base_ejection * (2 ** account.ejections))
+            elif account.state == PROBING or account.consecutive_failures >= self.eject_after:
+                self._eject(account, self.base_ejection * (2 ** account.ejections))
+
+    def _eject(self, account, seconds):
+        seconds = min(seconds, self.max_ejection)
+        account.state = EJECTED
+        account.ejected_until = time.time() + seconds
+        account.ejections += 1
+        print(f"⚠️  {account.name} ejected for {seconds:.0f}s ({account.last_error})")
+
+    def search(self, query, stream=False, **kwargs):
+        """
+        Run PerplexityFixed.search on the healthiest account
+
+        Accepts the same arguments as PerplexityFixed.search. For streaming
+        searches the outcome is recorded when the generator finishes.
+        """
+        account = self.acquire()
+        start = time.time()
+        try:
+            result = account.client.search(query, stream=stream, **kwargs)
+        except BaseException as e:
+            self.release(account, error=e if isinstance(e, Exception) else RequestCancelled())
+            raise
+
+        if not stream:
+            self.release(account, elapsed=time.time() - start)
+            return result
+        return AccountStream(self, account, start, result)
+
+    def replace_primary(self, client, source=PRIMARY_COOKIE):
+        """
+        Swap the client of the account whose cookie came from source (e.g. after
+        a cookie hot-reload) and reset its health
+
+        Without such an account the new one replaces the anonymous fallback,
+        or joins the pool in front of the other accounts.
+        """
+        with self._lock:
+            for i, account in enumerate(self.accounts):
+                if account.source == source:
+                    self.accounts[i] = Account(account.name, client, alpha=account.alpha, source=source)
+                    return
+            account = Account(account_name(source), client, source=source)
+            if all(a.source is None for a in self.accounts):
+                self.accounts = [account]
+            else:
+                self.accounts.insert(0, account)
+
+    def all_ejected(self):
+        """True while every account is sitting out an ejection (e.g. all throttled)"""
+        now = time.time()
+        with self._lock:
+            return all(a.state == EJECTED and now < a.ejected_until for a in self.accounts)
+
+    def status(self):
+        with self._lock:
+            return [account.status() for account in self.accounts]
+
+
+def account_name(source):
+    """PERPLEXITY_COOKIE -> account-1, PERPLEXITY_COOKIE_<N> -> account-<N>"""
+    match = re.fullmatch(r'PERPLEXITY_COOKIE_(\d+)', source)
+    return f"account-{match.group(1)}" if match else 'account-1'
+
+
+def cookie_sources_from_env(environ=None):
+    """{env var: cookie string}: PERPLEXITY_COOKIE first, then PERPLEXITY_COOKIE_<N> in numeric order"""
+    environ = os.environ if environ is None else environ
+    numbered = []
+    for key, value in environ.items():
+        match = re.fullmatch(r'PERPLEXITY_COOKIE_(\d+)', key)
+        if match:
+            numbered.append((int(match.group(1)), key, value))
+
+    sources = {PRIMARY_COOKIE: environ.get(PRIMARY_COOKIE, '')}
+    sources.update((key, value) for _, key, value in sorted(numbered))
+    return {key: c for key, c in sources.items() if c and c.strip()}
+
+
+def cookie_strings_from_env(environ=None):
+    """PERPLEXITY_COOKIE first, then PERPLEXITY_COOKIE_<N> in numeric order"""
+    return list(cookie_sources_from_env(environ).values())
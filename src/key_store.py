@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+API Key Store
+SQLite-backed key store indexed by key hash
+
+Keys are never stored: each row is identified by the SHA-256 of the key,
+plus a short prefix for display. Verification hashes the presented key and
+looks it up in an in-memory index (hash -> active), so the request hot path
+never touches the disk or waits on admin writes. Admin operations update a
+single row in place, and listing is paginated and filtered in SQL, so they
+stay fast with tens of thousands of keys. Usage counters are applied in
+batches (see usage.py) as one transaction.
+
+A legacy plaintext `.api_keys.json` is imported once (on first start) and
+renamed to `.api_keys.json.migrated` when possible.
+
+Usage:
+    from key_store import KeyStore
+    store = KeyStore('.api_keys.db', legacy_path='.api_keys.json')
+    api_key, record = store.create('My laptop')
+    key_id = store.verify(api_key)        # key id, or None if unknown/disabled
+    page = store.list(limit=50, active=True, name='laptop')
+"""
+
+import json
+import time
+import sqlite3
+import hashlib
+import secrets
+import threading
+from pathlib import Path
+
+KEY_PREFIX_LENGTH = 12
+MAX_PAGE_SIZE = 200
+
+COLUMNS = ('id', 'prefix', 'name', 'created', 'last_used', 'usage_count',
+           'total_input_tokens', 'total_output_tokens', 'active')
+SORTABLE = ('created', 'last_used', 'name', 'usage_count')
+
+
+def hash_key(api_key):
+    """Key id: hex SHA-256 of the key (keys are 256-bit random, so no slow KDF is needed)"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+class KeyStore:
+    def __init__(self, path, legacy_path=None):
+        """
+        Open (or create) the store
+
+        Args:
+            path: SQLite database file
+            legacy_path: Plaintext JSON key file to import once, if it exists
+        """
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript('''
+            CREATE TABLE IF NOT EXISTS api_keys (
+                id TEXT PRIMARY KEY,
+                prefix TEXT NOT NULL,
+                name TEXT NOT NULL,
+                created REAL,
+                last_used REAL,
+                usage_count INTEGER NOT NULL DEFAULT 0,
+                total_input_tokens INTEGER NOT NULL DEFAULT 0,
+                total_output_tokens INTEGER NOT NULL DEFAULT 0,
+                active INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE INDEX IF NOT EXISTS idx_api_keys_created ON api_keys(created);
+            CREATE INDEX IF NOT EXISTS idx_api_keys_last_used ON api_keys(last_used);
+            CREATE INDEX IF NOT EXISTS idx_api_keys_name ON api_keys(name COLLATE NOCASE);
+            CREATE INDEX IF NOT EXISTS idx_api_keys_active ON api_keys(active);
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        ''')
+
+        if legacy_path is not None:
+            self.import_legacy(Path(legacy_path))
+
+        # Hot-path index: key hash -> active
+        self._index = {row['id']: bool(row['active'])
+                       for row in self._db.execute('SELECT id, active FROM api_keys')}
+
+    def verify(self, api_key):
+        """
+        Check a presented key
+
+        The key is hashed before it is compared with anything, so lookup time
+        depends only on the hash of the input, which tells an attacker nothing
+        about stored keys (no byte-by-byte comparison of secrets).
+
+        Returns:
+            The key id if the key exists and is active, else None
+        """
+        if not api_key:
+            return None
+        key_id = hash_key(api_key)
+        return key_id if self._index.get(key_id) else None
+
+    def create(self, name='Unnamed Key', api_key=None):
+        """
+        Create a key
+
+        Returns:
+            (api_key, record) - the only time the full key is available
+        """
+        api_key = api_key or f"pplx_{secrets.token_urlsafe(32)}"
+        record = {
+            'id': hash_key(api_key),
+            'prefix': api_key[:KEY_PREFIX_LENGTH],
+            'name': name,
+            'created': time.time(),
+            'last_used': None,
+            'usage_count': 0,
+            'total_input_tokens': 0,
+            'total_output_tokens': 0,
+            'active': True,
+        }
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO api_keys ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [record[c] for c in COLUMNS]
+            )
+            self._index[record['id']] = True
+        return api_key, record
+
+    def get(self, key_id):
+        with self._lock:
+            row = self._db.execute('SELECT * FROM api_keys WHERE id = ?', (key_id,)).fetchone()
+        return self._record(row) if row else None
+
+    def update(self, key_id, name=None, active=None):
+        """
+        Update one key in place
+
+        Returns:
+            The updated record, or None if the key does not exist
+        """
+        fields = {}
+        if name is not None:
+            fields['name'] = str(name)
+        if active is not None:
+            fields['active'] = 1 if active else 0
+        with self._lock:
+            if fields:
+                assignments = ', '.join(f"{column} = ?" for column in fields)
+                cursor = self._db.execute(f"UPDATE api_keys SET {assignments} WHERE id = ?",
+                                          [*fields.values(), key_id])
+                if cursor.rowcount == 0:
+                    return None
+            record = self.get(key_id)
+            if record is not None:
+                self._index[key_id] = record['active']
+        return record
+
+    def toggle(self, key_id):
+        """Flip a key's active flag; returns the updated record or None"""
+        with self._lock:
+            record = self.get(key_id)
+            if record is None:
+                return None
+            return self.update(key_id, active=not record['active'])
+
+    def delete(self, key_id):
+        """Delete one key; returns False if it did not exist"""
+        with self._lock:
+            cursor = self._db.execute('DELETE FROM api_keys WHERE id = ?', (key_id,))
+            self._index.pop(key_id, None)
+        return cursor.rowcount > 0
+
+    def list(self, offset=0, limit=50, active=None, name=None, used_after=None, used_before=None,
+             sort='created', order='desc'):
+        """
+        One page of keys
+
+        Args:
+            offset, limit: Page window (limit capped at MAX_PAGE_SIZE)
+            active: Only active (True) or inactive (False) keys
+            name: Substring of the key name (case-insensitive for ASCII)
+            used_after, used_before: last_used bounds (unix seconds); never-used keys are excluded
+            sort: created, last_used, name or usage_count
+            order: asc or desc
+
+        Returns:
+            {'keys': [...], 'total': matching keys, 'offset', 'limit', 'next_offset' (None on the last page)}
+        """
+        if sort not in SORTABLE:
+            raise ValueError(f"Cannot sort by {sort!r}")
+        direction = 'ASC' if str(order).lower() == 'asc' else 'DESC'
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        offset = max(0, int(offset))
+
+        clauses, params = [], []
+        if active is not None:
+            clauses.append('active = ?')
+            params.append(1 if active else 0)
+        if name:
+            clauses.append("name LIKE ? ESCAPE '\\'")
+            params.append('%' + name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if used_after is not None:
+            clauses.append('last_used >= ?')
+            params.append(float(used_after))
+        if used_before is not None:
+            clauses.append('last_used < ?')
+            params.append(float(used_before))
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM api_keys {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT * FROM api_keys {where} ORDER BY {sort} {direction}, id LIMIT ? OFFSET ?",
+                [*params, limit, offset]
+            ).fetchall()
+
+        return {
+            'keys': [self._record(row) for row in rows],
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'next_offset': offset + limit if offset + limit < total else None,
+        }
+
+    def apply_usage(self, deltas):
+        """
+        Add batched usage deltas (UsageBuffer's pending dict) in one transaction
+
+        Args:
+            deltas: {key_id: {'usage_count', 'last_used', 'total_input_tokens', 'total_output_tokens'}}
+        """
+        rows = [(d['usage_count'], d['total_input_tokens'], d['total_output_tokens'], d['last_used'], key_id)
+                for key_id, d in deltas.items()]
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._db.executemany('''
+                    UPDATE api_keys SET
+                        usage_count = usage_count + ?,
+                        total_input_tokens = total_input_tokens + ?,
+                        total_output_tokens = total_output_tokens + ?,
+                        last_used = MAX(COALESCE(last_used, 0), COALESCE(?, 0))
+                    WHERE id = ?
+                ''', rows)
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+        return len(rows)
+
+    def counters(self):
+        """All keys' usage counters by id (one scan, used to seed live stats)"""
+        with self._lock:
+            rows = self._db.execute('SELECT * FROM api_keys').fetchall()
+        return {row['id']: self._record(row) for row in rows}
+
+    def import_legacy(self, legacy_path):
+        """Import a plaintext {key: metadata} JSON file once, then rename it out of the way"""
+        if not legacy_path.is_file():
+            return 0
+        with self._lock:
+            imported = self._db.execute("SELECT value FROM store_meta WHERE key = 'legacy_import'").fetchone()
+        if imported:
+            return 0  # never re-import, or deleted keys would come back
+        try:
+            with open(legacy_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Could not read legacy key file {legacy_path}: {e}")
+            return 0
+        if not isinstance(data, dict):
+            data = {}
+
+        rows = []
+        for api_key, meta in data.items():
+            meta = meta if isinstance(meta, dict) else {}
+            rows.append((
+                hash_key(api_key), api_key[:KEY_PREFIX_LENGTH], meta.get('name', 'Unnamed Key'),
+                meta.get('created'), meta.get('last_used'), meta.get('usage_count', 0),
+                meta.get('total_input_tokens', 0), meta.get('total_output_tokens', 0),
+                1 if meta.get('active', True) else 0,
+            ))
+
+        with self._lock:
+            self._db.execute('BEGIN')
+            self._db.executemany(
+                f"INSERT OR IGNORE INTO api_keys ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows
+            )
+            self._db.execute("INSERT OR REPLACE INTO store_meta (key, value) VALUES ('legacy_import', ?)",
+                             (str(time.time()),))
+            self._db.execute('COMMIT')
+
+        print(f"✅ Imported {len(rows)} API key(s) from {legacy_path.name}")
+        try:
+            legacy_path.rename(legacy_path.with_name(legacy_path.name + '.migrated'))
+            print(f"⚠️  Plaintext copy kept as {legacy_path.name}.migrated - delete it once you have checked the import")
+        except OSError:
+            # e.g. a file bind-mounted into a container
+            print(f"⚠️  Could not rename {legacy_path.name}; it still holds plaintext keys - delete it once you have checked the import")
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _record(row):
+        record = dict(row)
+        record['active'] = bool(record['active'])
+        return record
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Server Lifecycle
+In-flight request tracking, client-disconnect detection and graceful shutdown
+
+On SIGTERM/SIGINT the server stops accepting new work (new requests get 503),
+waits for in-flight requests to drain up to a deadline, runs the registered
+shutdown hooks (flush usage counters, close the request log) and only then
+stops the HTTP server.
+
+Usage:
+    from lifecycle import InFlightTracker, install_signal_handlers
+    inflight = InFlightTracker()
+    with inflight.track():
+        ...
+"""
+
+import time
+import signal
+import socket
+import threading
+from contextlib import contextmanager
+
+
+class Draining(Exception):
+    """Raised when new work arrives while the server is shutting down"""
+
+
+class InFlightTracker:
+    def __init__(self):
+        self.draining = False
+        self._active = 0
+        self._cond = threading.Condition()
+
+    @property
+    def active(self):
+        return self._active
+
+    @contextmanager
+    def track(self):
+        """Count a request as in flight (raises Draining during shutdown)"""
+        with self._cond:
+            if self.draining:
+                raise Draining()
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def drain(self, timeout):
+        """
+        Stop accepting work and wait for in-flight requests
+
+        Returns:
+            Number of requests still running when the deadline passed
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            self.draining = True
+            while self._active and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            return self._active
+
+
+def client_disconnected(sock):
+    """
+    Check whether the peer closed a connection, without consuming data
+
+    Args:
+        sock: The client socket (werkzeug exposes it as environ['werkzeug.socket'])
+    """
+    if sock is None:
+        return False
+    try:
+        previous_timeout = sock.gettimeout()
+        sock.settimeout(0)
+        try:
+            return sock.recv(1, socket.MSG_PEEK) == b''
+        finally:
+            sock.settimeout(previous_timeout)
+    except (BlockingIOError, InterruptedError):
+        return False  # still connected, nothing to read
+    except OSError:
+        return True
+
+
+def graceful_shutdown(inflight, stop_server, hooks=(), timeout=30.0):
+    """Drain in-flight requests, run shutdown hooks, then stop the server"""
+    print(f"\n🛑 Shutting down: draining {inflight.active} in-flight request(s) (up to {timeout:.0f}s)")
+    remaining = inflight.drain(timeout)
+    if remaining:
+        print(f"⚠️  {remaining} request(s) still running at deadline")
+    else:
+        print("✅ All in-flight requests drained")
+
+    for hook in hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"❌ Shutdown hook failed: {e}")
+
+    stop_server()
+
+
+def install_signal_handlers(inflight, stop_server, hooks=(), timeout=30.0):
+    """Run graceful_shutdown on SIGTERM/SIGINT (in a thread, so serve_forever can return)"""
+    started = threading.Event()
+
+    def handler(signum, frame):
+        if started.is_set():
+            return
+        started.set()
+        threading.Thread(
+            target=graceful_shutdown,
+            args=(inflight, stop_server, hooks, timeout),
+            name='graceful-shutdown',
+            daemon=True
+        ).start()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Live Dashboard Stats
+In-memory usage counters pushed to dashboards over Server-Sent Events
+
+Counters are loaded from the key store once and then updated incrementally
+as requests are served and keys are managed. A single ticker thread turns
+them into one frame per tick (totals + only the keys that changed since the
+previous frame); every subscriber just waits for the next frame, so the cost
+per tick does not depend on the number of keys or open dashboards.
+
+Usage:
+    from live_stats import LiveStats
+    stats = LiveStats(in_flight=lambda: 0)
+    stats.load(key_store.counters())
+    for event in stats.subscribe():
+        ...  # SSE-formatted strings
+"""
+
+import json
+import time
+import threading
+
+
+class LiveStats:
+    def __init__(self, in_flight=None, tick=1.0, heartbeat=15.0, cost_calculator=None):
+        """
+        Initialize counters and start the ticker thread
+
+        Args:
+            in_flight: Callable returning the current number of in-flight requests
+            tick: Seconds between frames
+            heartbeat: Seconds between keep-alive comments when nothing changes
+            cost_calculator: Callable(input_tokens, output_tokens) -> dict merged into totals
+        """
+        self.in_flight = in_flight or (lambda: 0)
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self.cost_calculator = cost_calculator
+
+        self.keys = {}
+        self.totals = {
+            'keys': 0,
+            'active_keys': 0,
+            'requests': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+        }
+
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._last_totals = None
+        self._stop = threading.Event()
+
+        self._thread = threading.Thread(target=self._run, name='live-stats', daemon=True)
+        self._thread.start()
+
+    def load(self, keys_dict):
+        """Seed counters from the key store (one full scan at startup)"""
+        with self._lock:
+            self.keys = {}
+            for key, meta in keys_dict.items():
+                if isinstance(meta, dict):
+                    self.keys[key] = self._key_counters(meta)
+            self.totals['keys'] = len(self.keys)
+            self.totals['active_keys'] = sum(1 for k in self.keys.values() if k['active'])
+            self.totals['requests'] = sum(k['usage_count'] for k in self.keys.values())
+            self.totals['input_tokens'] = sum(k['total_input_tokens'] for k in self.keys.values())
+            self.totals['output_tokens'] = sum(k['total_output_tokens'] for k in self.keys.values())
+            self._changed.clear()
+
+    def record_request(self, api_key):
+        with self._lock:
+            entry = self.keys.get(api_key)
+            if entry is None:
+                return
+            entry['usage_count'] += 1
+            entry['last_used'] = time.time()
+            self.totals['requests'] += 1
+            self._changed.add(api_key)
+
+    def record_tokens(self, api_key, input_tokens, output_tokens):
+        with self._lock:
+            entry = self.keys.get(api_key)
+            if entry is None:
+                return
+            entry['total_input_tokens'] += input_tokens
+            entry['total_output_tokens'] += output_tokens
+            self.totals['input_tokens'] += input_tokens
+            self.totals['output_tokens'] += output_tokens
+            self._changed.add(api_key)
+
+    def key_added(self, api_key, meta):
+        with self._lock:
+            if api_key in self.keys:
+                return
+            entry = self.keys[api_key] = self._key_counters(meta)
+            self.totals['keys'] += 1
+            self.totals['active_keys'] += 1 if entry['active'] else 0
+            self._changed.add(api_key)
+
+    def key_removed(self, api_key):
+        with self._lock:
+            entry = self.keys.pop(api_key, None)
+            if entry is None:
+                return
+            self.totals['keys'] -= 1
+            self.totals['active_keys'] -= 1 if entry['active'] else 0
+            self._changed.add(api_key)
+
+    def key_toggled(self, api_key, active):
+        with self._lock:
+            entry = self.keys.get(api_key)
+            if entry is None or entry['active'] == active:
+                return
+            entry['active'] = active
+            self.totals['active_keys'] += 1 if active else -1
+            self._changed.add(api_key)
+
+    def snapshot(self):
+        """Current totals (O(1))"""
+        with self._lock:
+            totals = dict(self.totals)
+        totals['in_flight'] = self.in_flight()
+        if self.cost_calculator:
+            totals.update(self.cost_calculator(totals['input_tokens'], totals['output_tokens']))
+        return totals
+
+    def subscribe(self, should_stop=None):
+        """
+        Yield SSE-formatted frames as they are produced
+
+        Args:
+            should_stop: Optional callable; the stream ends when it returns True
+        """
+        # Start every subscriber with the current totals
+        yield self._format({'seq': self._seq, 'ts': time.time(), 'totals': self.snapshot(), 'keys': {}})
+
+        seen = self._seq
+        last_sent = time.time()
+        while not self._stop.is_set():
+            if should_stop and should_stop():
+                return
+            with self._cond:
+                if self._seq == seen:
+                    self._cond.wait(self.tick * 2)
+                frame, seq = self._frame, self._seq
+
+            if seq != seen and frame is not None:
+                seen = seq
+                last_sent = time.time()
+                yield frame
+            elif time.time() - last_sent >= self.heartbeat:
+                last_sent = time.time()
+                yield ': keep-alive\n\n'
+
+    def close(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    @staticmethod
+    def _key_counters(meta):
+        return {
+            'active': meta.get('active', True),
+            'usage_count': meta.get('usage_count', 0),
+            'last_used': meta.get('last_used'),
+            'total_input_tokens': meta.get('total_input_tokens', 0),
+            'total_output_tokens': meta.get('total_output_tokens', 0),
+        }
+
+    @staticmethod
+    def _format(payload):
+        return f"data: {json.dumps(payload)}\n\n"
+
+    def _build_frame(self):
+        """Build the next frame, or None when nothing changed since the last one"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            keys = {k: (dict(self.keys[k]) if k in self.keys else None) for k in changed}
+
+        totals = self.snapshot()
+        if not keys and totals == self._last_totals:
+            return None
+        self._last_totals = totals
+        return {'seq': self._seq + 1, 'ts': time.time(), 'totals': totals, 'keys': keys}
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                payload = self._build_frame()
+            except Exception as e:
+                print(f"❌ Live stats tick failed: {e}")
+                continue
+            if payload is None:
+                continue
+            frame = self._format(payload)
+            with self._cond:
+                self._frame = frame
+                self._seq = payload['seq']
+                self._cond.notify_all()
@@ -24,21 +24,40 @@ Usage:
     - Send POST to /chat/completions with query in messages format
 """
 
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 import sys
 import os
 import time
 import json
 import secrets
-import io
-import zipfile
 from pathlib import Path
 
 # Add current directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from perplexity_fixed import PerplexityFixed
+from account_pool import AccountPool, cookie_sources_from_env, parse_cookie_string
+from providers import ProviderRouter, ProviderTimeout, build_providers
+from pipeline import build_pipeline, estimate_tokens, extract_json_from_text
+from request_log import RequestLogger
+from static_cache import StaticCache
+from tracing import PhaseTimer, sample_stacks
+from usage import UsageBuffer
+from live_stats import LiveStats
+from lifecycle import InFlightTracker, Draining, client_disconnected, install_signal_handlers
+from ws_sessions import QuerySession, QueryRejected
+from key_store import KeyStore, hash_key
+from result_cache import ResultCache
+from prewarm import Prewarmer
+from perplexity_fixed import NO_ANSWER, RequestCancelled, UpstreamError, UpstreamThrottled
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket sessions are optional
+    Sock = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -46,44 +65,45 @@ CORS(app)  # Enable CORS for all routes
 print("✅ Perplexity Proxy Server")
 print("="*80)
 
-# Get cookie from environment if available
-cookie_str = os.environ.get('PERPLEXITY_COOKIE')
-cookies = None
-
-if cookie_str:
-    cookies = {}
-    for cookie_pair in cookie_str.split(';'):
-        cookie_pair = cookie_pair.strip()
-        if '=' in cookie_pair:
-            name, value = cookie_pair.split('=', 1)
-            cookies[name.strip()] = value.strip()
-    print(f"✅ Using cookie authentication for Perplexity")
+# Get cookies from environment if available (PERPLEXITY_COOKIE plus optional
+# PERPLEXITY_COOKIE_2, _3, ... for extra accounts)
+cookie_sources = cookie_sources_from_env()
+cookies = parse_cookie_string(next(iter(cookie_sources.values()))) if cookie_sources else None
+
+if cookie_sources:
+    print(f"✅ Using cookie authentication for Perplexity ({len(cookie_sources)} account(s))")
 else:
     print(f"ℹ️  Running in anonymous mode (no cookie)")
 
-# Create client
-client = PerplexityFixed(cookies=cookies)
-print(f"✅ Perplexity client initialized")
+# Create the account pool (one PerplexityFixed client per cookie identity)
+pool = AccountPool.from_cookie_sources(cookie_sources)
+print(f"✅ Perplexity client pool initialized")
+
+# Providers in preference order; requests are routed by rolling latency and fail over
+router = ProviderRouter(build_providers(os.environ.get('PROVIDERS', 'perplexity'),
+                                        {'pool': pool, 'environ': os.environ}),
+                        max_workers=int(os.environ.get('PROVIDER_MAX_WORKERS', 0)))
+print(f"✅ Providers: {', '.join(p.id for p in router.providers)}")
+
+# Structured request log (enabled by REQUEST_LOG_PATH)
+request_logger = RequestLogger.from_env()
+if request_logger:
+    print(f"✅ Request log: {request_logger.path} (sample rate {request_logger.sample_rate})")
+
+# Dashboard and extension payloads, built once and rebuilt when sources change
+WEB_DIR = Path(__file__).parent.parent / 'web'
+EXTENSION_DIR = Path(__file__).parent.parent / 'extension'
 
-# API keys storage
-API_KEYS_FILE = Path(__file__).parent.parent / '.api_keys.json'
+static_cache = StaticCache()
+static_cache.register_file('dashboard', WEB_DIR / 'index.html', 'text/html; charset=utf-8')
+static_cache.register_zip('extension', EXTENSION_DIR, 'extension', 'perplexity-extension.zip')
+
+# API keys storage (hashed, SQLite); a legacy plaintext key file is imported once
+API_KEYS_DB = Path(os.environ.get('API_KEYS_DB') or Path(__file__).parent.parent / '.api_keys.db')
+API_KEYS_FILE = Path(os.environ.get('API_KEYS_FILE') or Path(__file__).parent.parent / '.api_keys.json')
 ENV_FILE = Path(__file__).parent.parent / '.env'
 
-def load_api_keys():
-    """Load API keys from file"""
-    if API_KEYS_FILE.exists():
-        try:
-            with open(API_KEYS_FILE, 'r') as f:
-                data = json.load(f)
-                return data if isinstance(data, dict) else {}
-        except:
-            return {}
-    return {}
-
-def save_api_keys(keys):
-    """Save API keys to file"""
-    with open(API_KEYS_FILE, 'w') as f:
-        json.dump(keys, f, indent=2)
+key_store = KeyStore(API_KEYS_DB, legacy_path=API_KEYS_FILE)
 
 def load_env_file():
     """Load .env file as dict"""
@@ -116,34 +136,158 @@ def get_api_key_from_request():
         return auth_header
 
 def validate_api_key(api_key):
-    """Check if API key is valid and active"""
-    if not api_key:
-        return False
+    """Check if API key is valid and active; returns the key id (None if not)"""
+    return key_store.verify(api_key)
 
-    keys_dict = load_api_keys()
-    if api_key in keys_dict:
-        key_data = keys_dict[api_key]
-        return key_data.get('active', True)
-    return False
-
-def increment_api_key_usage(api_key):
+def increment_api_key_usage(key_id):
     """Increment usage count and update last_used timestamp"""
-    keys_dict = load_api_keys()
-    if api_key in keys_dict:
-        key_data = keys_dict[api_key]
-        key_data['last_used'] = time.time()
-        key_data['usage_count'] = key_data.get('usage_count', 0) + 1
-        save_api_keys(keys_dict)
-
-def track_api_key_tokens(api_key, input_tokens, output_tokens):
+    usage_buffer.record_request(key_id)
+    live_stats.record_request(key_id)
+
+def track_api_key_tokens(key_id, input_tokens, output_tokens):
     """Track token usage for an API key"""
-    keys_dict = load_api_keys()
-    if api_key in keys_dict:
-        key_data = keys_dict[api_key]
-        key_data['total_input_tokens'] = key_data.get('total_input_tokens', 0) + input_tokens
-        key_data['total_output_tokens'] = key_data.get('total_output_tokens', 0) + output_tokens
-        save_api_keys(keys_dict)
+    usage_buffer.record_tokens(key_id, input_tokens, output_tokens)
+    live_stats.record_tokens(key_id, input_tokens, output_tokens)
+
+# Usage counters are batched in memory and added to the key store in one
+# transaction by a background thread
+usage_buffer = UsageBuffer(apply_usage=key_store.apply_usage,
+                           flush_interval=float(os.environ.get('USAGE_FLUSH_INTERVAL', 2.0)))
+
+# In-flight request tracking for graceful shutdown
+inflight = InFlightTracker()
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 30))
+
+# In-memory counters behind /api/stats/stream and /api/cost-savings
+# (calculate_cost_savings is resolved lazily, it is defined further down)
+live_stats = LiveStats(
+    in_flight=lambda: inflight.active,
+    tick=float(os.environ.get('STATS_TICK_SECONDS', 1.0)),
+    cost_calculator=lambda i, o: {'total_saved': calculate_cost_savings(i, o)['total_saved']}
+)
+live_stats.load(key_store.counters())
+
+# Scheduled prewarming (PREWARM_FILE): recurring queries are refreshed in the
+# background and served from the result cache. Only prewarmed answers are
+# stored, so every other request still goes upstream.
+PREWARM_MAX_INFLIGHT = int(os.environ.get('PREWARM_MAX_INFLIGHT', 4))
+result_cache = ResultCache.from_env()
+
+
+def prewarm_search(query, mode, sources, should_cancel=None):
+    """Raw answer for a scheduled query (request-specific post-processing runs when it is served)"""
+    return router.search(query=query, mode=mode, sources=sources, should_cancel=should_cancel)
+
+
+def prewarm_busy():
+    """Hold prewarming back while callers need the upstream or every account is throttled"""
+    if inflight.draining or pool.all_ejected():
+        return True
+    return PREWARM_MAX_INFLIGHT > 0 and inflight.active >= PREWARM_MAX_INFLIGHT
+
+
+prewarmer = None
+try:
+    prewarmer = Prewarmer.from_env(prewarm_search, result_cache, busy=prewarm_busy)
+except (OSError, ValueError) as e:
+    print(f"⚠️  Prewarming disabled: {e}")
+if prewarmer is not None and result_cache is None:
+    print(f"⚠️  Prewarming disabled: RESULT_CACHE_TTL is 0")
+    prewarmer = None
+if prewarmer is not None:
+    prewarmer.start()
+    print(f"✅ Prewarming {len(prewarmer.entries)} scheduled quer{'y' if len(prewarmer.entries) == 1 else 'ies'}")
+
+
+def cached_answer(query, mode, sources):
+    """Prewarmed raw answer for this question, or None"""
+    if prewarmer is None:
+        return None
+    answer = result_cache.get(ResultCache.key(query, mode, sources))
+    if answer is not None:
+        print(f"⚡ Serving prewarmed answer")
+    return answer
+
+
+def is_admin_request():
+    """Check the X-Admin-Token header against ADMIN_TOKEN (admin routes are off when unset)"""
+    admin_token = os.environ.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token')
+    if not admin_token or not supplied:
+        return False
+    return secrets.compare_digest(supplied, admin_token)
+
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the request log"""
+    g.request_start = time.time()
+
+@app.before_request
+def reject_while_draining():
+    """Stop accepting new work once a graceful shutdown has started"""
+    if inflight.draining and request.path != '/health':
+        return "Error: Server is shutting down", 503, {
+            'Content-Type': 'text/plain; charset=utf-8',
+            'Retry-After': '5',
+            'Connection': 'close'
+        }
+
+@app.after_request
+def add_server_timing(response):
+    """Expose per-request phase timings recorded by the handler"""
+    timer = g.get('timer')
+    if timer is not None:
+        response.headers['Server-Timing'] = timer.header()
+    return response
+
+@app.after_request
+def log_request(response):
+    """
+    Queue a structured record of the request/response (never blocks)
+
+    The record is queued when the response is closed, after the last byte
+    was sent, so streamed responses get their full duration and size.
+    """
+    if request_logger is None or request.path.startswith('/api/request-log'):
+        return response
+
+    api_key = get_api_key_from_request()
+    start = g.get('request_start', time.time())
+    record = {
+        'ts': start,
+        'method': request.method,
+        'path': request.path,
+        'query_string': request.query_string.decode('utf-8', 'replace'),
+        'key_prefix': api_key[:12] if api_key else None,
+        'body': request.get_json(silent=True) if request.is_json else None,
+        'status': response.status_code,
+        'remote_addr': request.remote_addr,
+        'user_agent': request.headers.get('User-Agent'),
+    }
+    sent = [0]
+    if response.is_streamed:
+        response.response = count_bytes(response.response, sent)
 
+    def log_on_close():
+        record['duration_ms'] = round((time.time() - start) * 1000, 2)
+        record['response_bytes'] = sent[0] if response.is_streamed else response.content_length
+        request_logger.log(record)
+
+    response.call_on_close(log_on_close)
+    return response
+
+
+def count_bytes(body, sent):
+    """Pass a streamed body through, adding the bytes sent to sent[0]"""
+    try:
+        for chunk in body:
+            sent[0] += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+    finally:
+        close = getattr(body, 'close', None)
+        if close is not None:
+            close()
 
 
 @app.route('/chat/completions', methods=['POST'])
@@ -152,76 +296,172 @@ def chat_completions():
     Main Perplexity proxy endpoint
     Accepts messages in standard chat format and returns raw Perplexity response
     """
+    try:
+        with inflight.track():
+            return handle_chat_completion()
+    except Draining:
+        return "Error: Server is shutting down", 503, {'Content-Type': 'text/plain; charset=utf-8', 'Retry-After': '5'}
+
+
+def disconnect_checker(interval=0.25):
+    """Build a should_cancel callback that notices when the caller hangs up"""
+    sock = request.environ.get('werkzeug.socket')
+    last_check = [0.0]
+
+    def should_cancel():
+        now = time.time()
+        if now - last_check[0] < interval:
+            return False
+        last_check[0] = now
+        return client_disconnected(sock)
+
+    return should_cancel
+
+
+# Map model names to our modes
+MODEL_MODES = {
+    'sonar': 'auto',
+    'sonar-small': 'auto',
+    'sonar-medium': 'auto',
+    'sonar-pro': 'pro',
+    'sonar-reasoning': 'reasoning',
+    'sonar-reasoning-pro': 'reasoning',
+    'sonar-deep-research': 'deep research',
+    # Also support direct mode names
+    'auto': 'auto',
+    'pro': 'pro',
+    'reasoning': 'reasoning',
+    'deep research': 'deep research'
+}
+
+
+def extract_user_query(messages):
+    """Get the user's query from a chat messages array (first user message)"""
+    for msg in messages or []:
+        if isinstance(msg, dict) and msg.get('role') == 'user':
+            return msg.get('content')
+    return None
+
+
+def upstream_error_status(error):
+    """HTTP status to report for a failed upstream search"""
+    cause = error.__cause__ or error
+    if isinstance(cause, UpstreamThrottled):
+        return 429
+    if isinstance(cause, ProviderTimeout):
+        return 504
+    if isinstance(error, UpstreamError):
+        return 502
+    return 500
+
+
+def handle_chat_completion():
+    """Handle one /chat/completions request (called while tracked as in flight)"""
+    timer = g.timer = PhaseTimer()
+
     # Validate API key
-    api_key = get_api_key_from_request()
-    if not validate_api_key(api_key):
-        return "Error: Invalid API key", 401, {'Content-Type': 'text/plain; charset=utf-8'}
+    with timer.phase('auth'):
+        key_id = validate_api_key(get_api_key_from_request())
+        if not key_id:
+            return "Error: Invalid API key", 401, {'Content-Type': 'text/plain; charset=utf-8'}
 
-    increment_api_key_usage(api_key)
+        increment_api_key_usage(key_id)
 
     try:
         data = request.json
         print(f"\n📥 Incoming request: {data.get('model', 'unknown model')}")
 
-        # Extract parameters
-        messages = data.get('messages', [])
         model = data.get('model', 'sonar')
-
-        # Get the user's query from messages
-        query = None
-        for msg in messages:
-            if msg.get('role') == 'user':
-                query = msg.get('content')
-                break
+        query = extract_user_query(data.get('messages', []))
 
         if not query:
             return "Error: No user message found in messages array", 400, {'Content-Type': 'text/plain; charset=utf-8'}
 
         print(f"🔍 Query: {query[:100]}...")
 
-        # Map model names to our modes
-        mode_mapping = {
-            'sonar': 'auto',
-            'sonar-small': 'auto',
-            'sonar-medium': 'auto',
-            'sonar-pro': 'pro',
-            'sonar-reasoning': 'reasoning',
-            'sonar-reasoning-pro': 'reasoning',
-            'sonar-deep-research': 'deep research',
-            # Also support direct mode names
-            'auto': 'auto',
-            'pro': 'pro',
-            'reasoning': 'reasoning',
-            'deep research': 'deep research'
-        }
-
-        mode = mode_mapping.get(model.lower(), 'auto')
-
-        # Extract source if specified
-        sources = ['web']  # default
-        if 'sources' in data:
-            sources = data['sources']
+        mode = MODEL_MODES.get(model.lower(), 'auto')
+        sources = data.get('sources', ['web'])
 
         print(f"⚙️  Mode: {mode} | Sources: {sources}")
 
+        # Answers are post-processed incrementally as deltas arrive (same stages
+        # for streaming and non-streaming); tokens are counted on the way through
+        json_mode = bool(data.get('json_mode'))
+        strip_citations = bool(data.get('strip_citations'))
+        token_counters = []
+
+        def make_pipeline():
+            pipeline, counter = build_pipeline(json_mode=json_mode, strip_citations=strip_citations)
+            token_counters.append(counter)
+            return pipeline
+
+        prompt_tokens = estimate_tokens(query)
+        cached = cached_answer(query, mode, sources)
+
+        if data.get('stream'):
+            include_usage = bool((data.get('stream_options') or {}).get('include_usage'))
+            if cached is not None:
+                deltas = make_pipeline().process([cached])
+            else:
+                deltas = router.search(
+                    query=query,
+                    mode=mode,
+                    sources=sources,
+                    stream=True,
+                    timer=timer,
+                    should_cancel=disconnect_checker(),
+                    pipeline_factory=make_pipeline
+                )
+            return Response(
+                stream_with_context(stream_chat_completion(deltas, key_id, model, prompt_tokens, token_counters,
+                                                           include_usage=include_usage)),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
         # Perform search using our fixed library
         start_time = time.time()
-        answer = client.search(
-            query=query,
-            mode=mode,
-            sources=sources
-        )
+        if cached is not None:
+            answer = make_pipeline().collect([cached])
+        else:
+            answer = router.search(
+                query=query,
+                mode=mode,
+                sources=sources,
+                timer=timer,
+                should_cancel=disconnect_checker(),
+                pipeline_factory=make_pipeline
+            )
         elapsed = time.time() - start_time
 
         print(f"✅ Response generated in {elapsed:.2f}s")
+        if json_mode:
+            print(f"🔧 JSON extraction applied")
 
         # Track token usage (rough approximation: 1 word ≈ 1.3 tokens)
-        prompt_tokens = int(len(query.split()) * 1.3)
-        completion_tokens = int(len(answer.split()) * 1.3)
-        track_api_key_tokens(api_key, prompt_tokens, completion_tokens)
+        with timer.phase('usage'):
+            completion_tokens = token_counters[-1].tokens if token_counters else estimate_tokens(answer)
+            track_api_key_tokens(key_id, prompt_tokens, completion_tokens)
+
+        # Return exactly what Perplexity gives us, or an OpenAI-style
+        # chat.completion (usage included) to clients that ask for JSON
+        usage = usage_block(prompt_tokens, completion_tokens)
+        if wants_json_body():
+            return jsonify(chat_completion_body(answer or NO_ANSWER, model, usage)), 200, {
+                'X-Usage': json.dumps(usage)
+            }
+        return answer or NO_ANSWER, 200, {
+            'Content-Type': 'text/plain; charset=utf-8',
+            'X-Usage': json.dumps(usage)
+        }
+
+    except RequestCancelled:
+        print(f"🔌 Client disconnected, upstream request cancelled")
+        return "Error: Client disconnected", 499, {'Content-Type': 'text/plain; charset=utf-8'}
 
-        # Return exactly what Perplexity gives us
-        return answer, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    except UpstreamError as e:
+        print(f"❌ Upstream error: {e}")
+        return f"Error: {str(e)}", upstream_error_status(e), {'Content-Type': 'text/plain; charset=utf-8'}
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -231,20 +471,191 @@ def chat_completions():
         return f"Error: {str(e)}", 500, {'Content-Type': 'text/plain; charset=utf-8'}
 
 
+def usage_block(prompt_tokens, completion_tokens):
+    """OpenAI-compatible usage object"""
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens
+    }
+
+
+def wants_json_body():
+    """True when the client prefers JSON over plain text (e.g. OpenAI SDKs send Accept: application/json)"""
+    return request.accept_mimetypes.best_match(['text/plain', 'application/json']) == 'application/json'
+
+
+def chat_completion_body(answer, model, usage):
+    """OpenAI-compatible chat.completion object for a non-streaming answer"""
+    return {
+        'id': f"chatcmpl-{secrets.token_hex(12)}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': answer},
+            'finish_reason': 'stop'
+        }],
+        'usage': usage
+    }
+
+
+def stream_chat_completion(deltas, key_id, model, prompt_tokens, token_counters, include_usage=False):
+    """
+    Relay processed answer deltas as OpenAI-style chat.completion.chunk events
+
+    With include_usage (the request's stream_options.include_usage) a final
+    chunk carries the usage block, as OpenAI does. If the client disconnects
+    the generator is closed, which closes the upstream response as well.
+    """
+    completion_id = f"chatcmpl-{secrets.token_hex(12)}"
+    created = int(time.time())
+
+    def event(delta=None, finish_reason=None, usage=None):
+        payload = {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [] if usage else [{'index': 0, 'delta': delta or {}, 'finish_reason': finish_reason}]
+        }
+        if include_usage:
+            payload['usage'] = usage
+        return f"data: {json.dumps(payload)}\n\n"
+
+    start_time = time.time()
+    try:
+        with inflight.track():
+            yield event({'role': 'assistant'})
+            for delta in deltas:
+                yield event({'content': delta})
+
+            completion_tokens = token_counters[-1].tokens if token_counters else 0
+            yield event(finish_reason='stop')
+            if include_usage:
+                yield event(usage=usage_block(prompt_tokens, completion_tokens))
+            yield "data: [DONE]\n\n"
+            print(f"✅ Response streamed in {time.time() - start_time:.2f}s")
+
+    except Draining:
+        yield f"data: {json.dumps({'error': {'message': 'Server is shutting down'}})}\n\n"
+    except RequestCancelled:
+        print(f"🔌 Client disconnected, upstream request cancelled")
+    except Exception as e:
+        print(f"❌ Stream error: {e}")
+        yield f"data: {json.dumps({'error': {'message': str(e)}})}\n\n"
+    finally:
+        deltas.close()
+        # Account for whatever was produced, even if the stream ended early
+        completion_tokens = token_counters[-1].tokens if token_counters else 0
+        track_api_key_tokens(key_id, prompt_tokens, completion_tokens)
+
+
+# Persistent WebSocket sessions: one auth per connection, many concurrent
+# queries multiplexed by id (protocol in ws_sessions.py)
+WS_MAX_CONCURRENT = int(os.environ.get('WS_MAX_CONCURRENT', 8))
+ws_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('WS_MAX_WORKERS', 32)),
+                                 thread_name_prefix='ws-query')
+
+
+def start_ws_query(api_key, message, should_cancel):
+    """
+    Start one query from a WebSocket session
+
+    Args:
+        api_key: Key the connection authenticated with
+        message: The "query" frame (same fields as a /chat/completions body)
+        should_cancel: Callable that returns True once the query is cancelled
+
+    Returns:
+        (deltas, finish) - generator of processed answer deltas, and a callable
+        that records token usage and returns the usage block
+    """
+    query = extract_user_query(message.get('messages')) or message.get('query')
+    if not query or not isinstance(query, str):
+        raise QueryRejected("No user message found in messages array")
+
+    # Verification is an in-memory lookup, so re-checking per query is cheap
+    # and a key disabled mid-session stops working immediately
+    key_id = validate_api_key(api_key)
+    if not key_id:
+        raise QueryRejected("API key is no longer active", 401)
+    increment_api_key_usage(key_id)
+
+    mode = MODEL_MODES.get(str(message.get('model', 'sonar')).lower(), 'auto')
+    json_mode = bool(message.get('json_mode'))
+    strip_citations = bool(message.get('strip_citations'))
+    token_counters = []
+
+    def make_pipeline():
+        pipeline, counter = build_pipeline(json_mode=json_mode, strip_citations=strip_citations)
+        token_counters.append(counter)
+        return pipeline
+
+    prompt_tokens = estimate_tokens(query)
+    sources = message.get('sources', ['web'])
+    cached = cached_answer(query, mode, sources)
+
+    def deltas():
+        with inflight.track():
+            if cached is not None:
+                yield from make_pipeline().process([cached])
+                return
+            yield from router.search(
+                query=query,
+                mode=mode,
+                sources=sources,
+                stream=True,
+                should_cancel=should_cancel,
+                pipeline_factory=make_pipeline
+            )
+
+    def finish():
+        completion_tokens = token_counters[-1].tokens if token_counters else 0
+        track_api_key_tokens(key_id, prompt_tokens, completion_tokens)
+        return usage_block(prompt_tokens, completion_tokens)
+
+    return deltas(), finish
+
+
+def ws_error_status(error):
+    """Status reported in a WebSocket error frame"""
+    if isinstance(error, Draining):
+        return 503
+    return upstream_error_status(error)
+
+
+if Sock is not None:
+    sock = Sock(app)
+
+    @sock.route('/ws')
+    def query_session(ws):
+        """Multiplexed query session (auth via Authorization header or an auth frame)"""
+        print(f"🔌 WebSocket session opened")
+        QuerySession(
+            ws,
+            authenticate=validate_api_key,
+            start_query=start_ws_query,
+            executor=ws_executor,
+            api_key=get_api_key_from_request(),
+            error_status=ws_error_status,
+            max_concurrent=WS_MAX_CONCURRENT
+        ).run()
+        print(f"🔌 WebSocket session closed")
+else:
+    print(f"ℹ️  flask-sock not installed, /ws sessions disabled")
+
+
 @app.route('/api/cost-savings', methods=['GET'])
 def get_cost_savings():
     """Calculate cost savings vs official Perplexity Sonar-Pro pricing"""
-    keys_dict = load_api_keys()
+    totals = live_stats.snapshot()
+    return jsonify({'success': True, **calculate_cost_savings(totals['input_tokens'], totals['output_tokens'])})
 
-    total_input_tokens = 0
-    total_output_tokens = 0
-
-    # Sum up all token usage across all keys
-    for key_data in keys_dict.values():
-        if isinstance(key_data, dict):
-            total_input_tokens += key_data.get('total_input_tokens', 0)
-            total_output_tokens += key_data.get('total_output_tokens', 0)
 
+def calculate_cost_savings(total_input_tokens, total_output_tokens):
+    """Cost of the given token usage at official Perplexity API pricing"""
     # Official Perplexity Sonar-Pro pricing (as of 2025)
     # $3/1M input tokens, $15/1M output tokens
     input_cost = (total_input_tokens / 1_000_000) * 3
@@ -285,7 +696,7 @@ def get_cost_savings():
             'output_tokens': total_output_tokens
         }
 
-    return jsonify({
+    return {
         'total_saved': round(total_cost, 2),
         'total_tokens': total_tokens,
         'total_tokens_formatted': format_tokens(total_tokens),
@@ -294,18 +705,80 @@ def get_cost_savings():
         'input_tokens_formatted': format_tokens(total_input_tokens),
         'output_tokens_formatted': format_tokens(total_output_tokens),
         'breakdown': breakdown
-    })
+    }
+
+
+@app.route('/api/stats/stream', methods=['GET'])
+def stats_stream():
+    """
+    Server-Sent Events feed of live dashboard stats
+    Pushes totals plus changed keys from in-memory counters once per tick
+    """
+    return Response(
+        stream_with_context(live_stats.subscribe(should_stop=lambda: inflight.draining)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/api/providers', methods=['GET'])
 def get_providers():
-    """Stub endpoint for providers - Perplexity only"""
+    """List providers with circuit state and rolling p50/p95 latency per mode"""
+    providers = router.status()
     return jsonify({
-        'providers': ['perplexity'],
-        'active': ['perplexity']
+        'success': True,
+        'providers': providers,
+        'active': [p['id'] for p in providers if p['enabled']]
     })
 
 
+@app.route('/api/prewarm', methods=['GET'])
+def get_prewarm_status():
+    """Scheduled prewarm entries (warm/age/refreshes) and result cache counters"""
+    if prewarmer is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **prewarmer.status(), 'cache': result_cache.stats()})
+
+
+@app.route('/api/request-log', methods=['GET'])
+def get_request_log_stats():
+    """Request log writer counters"""
+    if request_logger is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, **request_logger.stats()})
+
+
+profile_lock = threading.Lock()
+
+@app.route('/api/admin/profile', methods=['POST'])
+def profile_endpoint():
+    """
+    Sample all server threads for N seconds under live load
+    Returns folded stacks (flamegraph.pl / speedscope compatible)
+    Opt-in: requires ENABLE_PROFILER=1 and a matching X-Admin-Token
+    """
+    if os.environ.get('ENABLE_PROFILER') != '1':
+        return jsonify({'success': False, 'error': 'Profiler disabled'}), 404
+    if not is_admin_request():
+        return jsonify({'success': False, 'error': 'Unauthorized - Admin token required'}), 401
+
+    try:
+        seconds = min(float(request.args.get('seconds', 10)), 60.0)
+        interval = max(float(request.args.get('interval', 0.005)), 0.001)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid seconds/interval'}), 400
+
+    if not profile_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'error': 'A profile is already running'}), 409
+    try:
+        print(f"🔬 Profiling for {seconds}s")
+        stacks = sample_stacks(seconds, interval)
+    finally:
+        profile_lock.release()
+
+    return stacks, 200, {'Content-Type': 'text/plain; charset=utf-8'}
+
+
 @app.route('/api/version', methods=['GET'])
 def get_version():
     """Return server version"""
@@ -318,56 +791,105 @@ def get_version():
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for Docker and monitoring"""
-    has_cookie = client is not None
+    has_cookie = bool(cookies)
     return jsonify({
-        'status': 'healthy',
+        'status': 'draining' if inflight.draining else 'healthy',
         'service': 'perplexity-api-simple',
         'authenticated': has_cookie,
+        'in_flight': inflight.active,
+        'accounts': pool.status(),
+        'providers': {p['id']: p['circuit'] for p in router.status()},
         'version': '1.0.0'
-    }), 200
+    }), 503 if inflight.draining else 200
 
 
 @app.route('/api/toggle-provider', methods=['POST'])
 def toggle_provider():
-    """Stub endpoint - Perplexity is always enabled"""
-    return jsonify({
-        'success': True,
-        'message': 'Perplexity is the only provider and cannot be disabled'
-    })
+    """Enable/disable a provider"""
+    data = request.json or {}
+    provider_id = data.get('provider_id')
+    enabled = bool(data.get('enabled', True))
+
+    if not provider_id:
+        return jsonify({'success': False, 'error': 'No provider specified'}), 400
+
+    try:
+        changed = router.set_enabled(provider_id, enabled)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Provider not found'}), 404
+
+    if not changed:
+        return jsonify({'success': False, 'error': 'At least one provider must stay enabled'}), 400
+
+    print(f"🔀 Provider {provider_id} {'enabled' if enabled else 'disabled'}")
+    return jsonify({'success': True, 'provider_id': provider_id, 'enabled': enabled})
+
+
+def serve_static_asset(name):
+    """Serve a cached static asset with ETag/304 and content-encoding negotiation"""
+    body, headers, status = static_cache.respond(
+        name,
+        accept_encoding=request.headers.get('Accept-Encoding'),
+        if_none_match=request.headers.get('If-None-Match')
+    )
+    return body, status, headers
 
 
 @app.route('/', methods=['GET'])
 def home():
     """Redirect to dashboard"""
-    web_dir = Path(__file__).parent.parent / 'web'
-    return send_from_directory(web_dir, 'index.html')
+    return serve_static_asset('dashboard')
 
 
 @app.route('/dashboard')
 @app.route('/web')
 def serve_dashboard():
     """Serve the web dashboard"""
-    web_dir = Path(__file__).parent.parent / 'web'
-    return send_from_directory(web_dir, 'index.html')
+    return serve_static_asset('dashboard')
 
 
 # API Key Management Routes
+def key_id_from_body(data):
+    """Key id from a request body: "id", or a full "key" (hashed, for older clients)"""
+    if data.get('id'):
+        return data['id']
+    if data.get('key'):
+        return hash_key(data['key'])
+    return None
+
+
+def parse_bool_arg(value):
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes', 'active')
+
+
 @app.route('/api/list-keys', methods=['GET'])
 def list_api_keys():
-    """List all API keys"""
-    keys_dict = load_api_keys()
+    """
+    List API keys, one page at a time
 
-    # Convert dictionary format to array format for frontend
-    keys_array = []
-    if isinstance(keys_dict, dict):
-        for full_key, metadata in keys_dict.items():
-            key_obj = metadata.copy() if isinstance(metadata, dict) else {}
-            key_obj['full_key'] = full_key
-            keys_array.append(key_obj)
-    elif isinstance(keys_dict, list):
-        keys_array = keys_dict
+    Query parameters: offset, limit (max 200), active (true/false), name
+    (substring), used_after / used_before (unix seconds), sort (created,
+    last_used, name, usage_count), order (asc/desc). Keys are shown by
+    prefix only; the full key is returned once, by /api/generate-key.
+    """
+    args = request.args
+    try:
+        page = key_store.list(
+            offset=args.get('offset', 0),
+            limit=args.get('limit', 50),
+            active=parse_bool_arg(args.get('active')),
+            name=args.get('name') or None,
+            used_after=args.get('used_after') or None,
+            used_before=args.get('used_before') or None,
+            sort=args.get('sort', 'created'),
+            order=args.get('order', 'desc')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
 
-    return jsonify({'success': True, 'keys': keys_array})
+    return jsonify({'success': True, **page})
 
 
 @app.route('/api/generate-key', methods=['POST'])
@@ -376,46 +898,42 @@ def generate_api_key():
     data = request.json or {}
     name = data.get('name', 'Unnamed Key')
 
-    # Generate a secure random key
-    api_key = f"pplx_{secrets.token_urlsafe(32)}"
+    # Only the hash is stored; this response is the only time the key is shown
+    api_key, record = key_store.create(name)
+    live_stats.key_added(record['id'], record)
 
-    # Load existing keys
-    keys_dict = load_api_keys()
+    return jsonify({'success': True, 'api_key': api_key, 'id': record['id'], 'prefix': record['prefix']})
 
-    # Ensure dictionary format
-    if not isinstance(keys_dict, dict):
-        keys_dict = {}
 
-    # Create new key entry
-    keys_dict[api_key] = {
-        'name': name,
-        'created': time.time(),
-        'last_used': None,
-        'usage_count': 0,
-        'active': True
-    }
+@app.route('/api/update-key', methods=['POST'])
+def update_api_key():
+    """Rename and/or enable/disable an API key"""
+    data = request.json or {}
+    key_id = key_id_from_body(data)
+
+    if not key_id:
+        return jsonify({'success': False, 'error': 'No key specified'}), 400
 
-    save_api_keys(keys_dict)
+    active = data.get('active')
+    record = key_store.update(key_id, name=data.get('name'), active=None if active is None else bool(active))
+    if record is None:
+        return jsonify({'success': False, 'error': 'Key not found'}), 404
 
-    return jsonify({'success': True, 'api_key': api_key})
+    live_stats.key_toggled(key_id, record['active'])
+    return jsonify({'success': True, 'key': record})
 
 
 @app.route('/api/delete-key', methods=['POST'])
 def delete_api_key():
     """Delete an API key"""
     data = request.json or {}
-    key_to_delete = data.get('key')
+    key_id = key_id_from_body(data)
 
-    if not key_to_delete:
+    if not key_id:
         return jsonify({'success': False, 'error': 'No key specified'}), 400
 
-    keys_dict = load_api_keys()
-
-    # Ensure dictionary format
-    if isinstance(keys_dict, dict):
-        if key_to_delete in keys_dict:
-            del keys_dict[key_to_delete]
-        save_api_keys(keys_dict)
+    if key_store.delete(key_id):
+        live_stats.key_removed(key_id)
 
     return jsonify({'success': True})
 
@@ -424,21 +942,17 @@ def delete_api_key():
 def toggle_api_key():
     """Enable/disable an API key"""
     data = request.json or {}
-    key_to_toggle = data.get('key')
+    key_id = key_id_from_body(data)
 
-    if not key_to_toggle:
+    if not key_id:
         return jsonify({'success': False, 'error': 'No key specified'}), 400
 
-    keys_dict = load_api_keys()
-
-    # Ensure dictionary format
-    if isinstance(keys_dict, dict):
-        if key_to_toggle in keys_dict:
-            keys_dict[key_to_toggle]['active'] = not keys_dict[key_to_toggle].get('active', True)
-            save_api_keys(keys_dict)
-            return jsonify({'success': True, 'active': keys_dict[key_to_toggle]['active']})
+    record = key_store.toggle(key_id)
+    if record is None:
+        return jsonify({'success': False, 'error': 'Key not found'}), 404
 
-    return jsonify({'success': False, 'error': 'Key not found'}), 404
+    live_stats.key_toggled(key_id, record['active'])
+    return jsonify({'success': True, 'active': record['active']})
 
 
 # Cookie Management Routes
@@ -490,16 +1004,11 @@ def save_cookie_endpoint():
     print(f"✅ Cookie saved to .env file")
 
     # Hot-reload the cookie without restarting
-    global cookies, client
-    cookies = {}
-    for cookie_pair in cookie_value.split(';'):
-        cookie_pair = cookie_pair.strip()
-        if '=' in cookie_pair:
-            name, value = cookie_pair.split('=', 1)
-            cookies[name.strip()] = value.strip()
+    global cookies
+    cookies = parse_cookie_string(cookie_value)
 
-    # Recreate client with new cookies
-    client = PerplexityFixed(cookies=cookies)
+    # Recreate the PERPLEXITY_COOKIE account's client with new cookies
+    pool.replace_primary(PerplexityFixed(cookies=cookies))
 
     print(f"✅ Cookie hot-reloaded! Server still running.")
 
@@ -536,42 +1045,13 @@ def clear_cookie_endpoint():
 def download_extension():
     """Download Chrome extension as ZIP file"""
     try:
-        # Get extension directory path
-        extension_dir = Path(__file__).parent.parent / 'extension'
-
-        if not extension_dir.exists():
+        if not EXTENSION_DIR.exists():
             return "Error: Extension directory not found", 404
 
-        # Create ZIP file in memory
-        memory_file = io.BytesIO()
-
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Walk through extension directory and add all files
-            for root, dirs, files in os.walk(extension_dir):
-                # Skip hidden directories
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
-
-                for file in files:
-                    # Skip hidden files
-                    if file.startswith('.'):
-                        continue
-
-                    file_path = Path(root) / file
-                    # Create archive name relative to extension directory
-                    arcname = Path('extension') / file_path.relative_to(extension_dir)
-                    zipf.write(file_path, arcname)
-
-        # Seek to beginning of file
-        memory_file.seek(0)
-
-        print("📦 Chrome extension downloaded")
-
-        return send_file(
-            memory_file,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='perplexity-extension.zip'
-        )
+        response = serve_static_asset('extension')
+        if response[1] == 200:
+            print("📦 Chrome extension downloaded")
+        return response
 
     except Exception as e:
         print(f"❌ Error creating extension ZIP: {e}")
@@ -590,6 +1070,8 @@ if __name__ == '__main__':
     print(f"✅ Server running at: http://localhost:{port}")
     print(f"📊 Web Dashboard: http://localhost:{port}/")
     print(f"🔗 API Endpoint: http://localhost:{port}/chat/completions")
+    if Sock is not None:
+        print(f"🔗 WebSocket Sessions: ws://localhost:{port}/ws")
     print(f"")
     print(f"🎯 Quick Start:")
     print(f"   1. Open http://localhost:{port}/ to generate an API key")
@@ -607,4 +1089,22 @@ if __name__ == '__main__':
     print(f"Press Ctrl+C to stop")
     print("="*80 + "\n")
 
-    app.run(host='0.0.0.0', port=port, debug=False)
+    from werkzeug.serving import make_server
+
+    server = make_server('0.0.0.0', port, app, threaded=True)
+
+    # SIGTERM/Ctrl+C: stop taking work, drain in-flight requests, flush counters.
+    # Once closed, the usage buffer writes straight through, so requests still
+    # running past the deadline are counted; the key store stays open for them
+    # until the server has stopped.
+    shutdown_hooks = [prewarmer.close] if prewarmer else []
+    shutdown_hooks += [live_stats.close, usage_buffer.close,
+                       lambda: ws_executor.shutdown(wait=False)]
+    if request_logger:
+        shutdown_hooks.append(request_logger.close)
+    install_signal_handlers(inflight, server.shutdown, shutdown_hooks, timeout=SHUTDOWN_DRAIN_SECONDS)
+
+    server.serve_forever()
+    usage_buffer.flush()
+    key_store.close()
+    print("👋 Server stopped")
@@ -7,26 +7,90 @@ Usage:
     from perplexity_fixed import PerplexityFixed
     client = PerplexityFixed()
     answer = client.search("What is Python?")
+
+Environment:
+    PERPLEXITY_UPSTREAM_URL  Base URL of the Perplexity web API (default
+                             https://www.perplexity.ai; point it at
+                             scripts/fake_upstream.py for load tests)
+    UPSTREAM_READ_TIMEOUT    Seconds the SSE stream may stay silent before it is
+                             aborted (default 60), so a stalled upstream never
+                             holds a worker thread forever
 """
 
+import os
+import re
 import json
+import time
 from uuid import uuid4
 from curl_cffi import requests
 
+from tracing import NULL_TIMER
+
+
+class RequestCancelled(Exception):
+    """Raised when a search is abandoned (e.g. the caller disconnected)"""
+
+
+class UpstreamError(Exception):
+    """Perplexity returned an error instead of an answer"""
+
+
+class UpstreamThrottled(UpstreamError):
+    """Perplexity is rate limiting this account"""
+
+
+class UpstreamAuthError(UpstreamError):
+    """Perplexity rejected this account's cookies"""
+
+
+# Shown to users when upstream returns no answer text (never returned by search())
+NO_ANSWER = "No answer received"
+
+# Error codes / phrases, matched as whole words ("RATE_LIMITED", "rate limit
+# exceeded", but not "generate" or "moderated"); "_" counts as a separator
+THROTTLED_PATTERN = re.compile(
+    r'(?<![a-z])(?:rate[\W_]*limit\w*|throttl\w*|too[\W_]+many[\W_]+requests|quota[\W_]+exceeded)(?![a-z])'
+)
+AUTH_PATTERN = re.compile(
+    r'(?<![a-z])(?:unauthori[sz]ed|unauthenticated|forbidden|not[\W_]+(?:logged[\W_]+in|authenticated)'
+    r'|auth(?:entication)?[\W_]*(?:required|failed|error|invalid|expired)'
+    r'|log[\W_]*in[\W_]+required|invalid[\W_]+(?:session|cookies?|token))(?![a-z])'
+)
+
+
+def classify_upstream_error(status_code=None, message=''):
+    """Map an HTTP status / error text to the matching UpstreamError subclass"""
+    text = str(message).lower()
+    if status_code == 429 or THROTTLED_PATTERN.search(text):
+        return UpstreamThrottled
+    if status_code in (401, 403) or AUTH_PATTERN.search(text):
+        return UpstreamAuthError
+    return UpstreamError
+
+
+DEFAULT_UPSTREAM_URL = 'https://www.perplexity.ai'
+CONNECT_TIMEOUT = 30
+
 
 class PerplexityFixed:
-    def __init__(self, cookies=None):
+    def __init__(self, cookies=None, base_url=None, read_timeout=None):
         """
         Initialize the Perplexity client
 
         Args:
             cookies: Optional cookies dict for authenticated requests
+            base_url: Upstream base URL (default: PERPLEXITY_UPSTREAM_URL or perplexity.ai)
+            read_timeout: Seconds without any data before the stream is aborted
+                (default: UPSTREAM_READ_TIMEOUT or 60)
         """
+        self.base_url = (base_url or os.environ.get('PERPLEXITY_UPSTREAM_URL') or DEFAULT_UPSTREAM_URL).rstrip('/')
+        self.read_timeout = float(read_timeout or os.environ.get('UPSTREAM_READ_TIMEOUT', 60))
         self.session = requests.Session(impersonate='chrome')
         if cookies:
             self.session.cookies.update(cookies)
 
-    def search(self, query, mode='auto', model=None, sources=None, stream=False):
+    def search(self, query, mode='auto', model=None, sources=None, stream=False, timer=None,
+               should_cancel=None):
         """
         Search using Perplexity AI
 
@@ -36,12 +100,18 @@ class PerplexityFixed:
             model: Model to use (None for default, or specify like 'gpt-4o', 'claude 3.7 sonnet', etc.)
             sources: List of sources (['web'], ['scholar'], ['social']) or None for default
             stream: Whether to stream responses (generator)
+            timer: Optional tracing.PhaseTimer to record connect/ttfb/stream/sse_parse phases
+            should_cancel: Optional callable checked between SSE events; when it returns
+                True the upstream response is closed and RequestCancelled is raised
+                (an exception it raises closes the response and propagates instead)
 
         Returns:
             Answer text (or generator if stream=True)
         """
         if sources is None:
             sources = ['web']
+        if timer is None:
+            timer = NULL_TIMER
 
         # Map model preferences based on mode
         model_mapping = {
@@ -85,20 +155,69 @@ class PerplexityFixed:
             }
         }
 
-        resp = self.session.post(
-            'https://www.perplexity.ai/rest/sse/perplexity_ask',
-            json=json_data,
-            stream=True
-        )
+        with timer.phase('connect'):
+            resp = self.session.post(
+                f'{self.base_url}/rest/sse/perplexity_ask',
+                json=json_data,
+                stream=True,
+                timeout=(CONNECT_TIMEOUT, self.read_timeout)
+            )
+
+        if resp.status_code >= 400:
+            resp.close()
+            error_class = classify_upstream_error(resp.status_code)
+            raise error_class(f"Perplexity returned HTTP {resp.status_code}")
 
         if stream:
-            return self._stream_response(resp)
+            return self._stream_response(resp, timer, should_cancel)
         else:
-            return self._get_full_response(resp)
+            return self._get_full_response(resp, timer, should_cancel)
 
-    def _stream_response(self, resp):
+    def _iter_events(self, resp, timer=NULL_TIMER, should_cancel=None):
+        """
+        Yield raw SSE events, timing upstream waits vs. local processing
+
+        Time until the first event is recorded as 'ttfb', later waits as
+        'stream', and time spent by the consumer between events as 'sse_parse'.
+        The upstream response is closed when iteration ends for any reason,
+        including the consumer closing the generator early. Error events
+        (throttling, auth failures) are raised as UpstreamError subclasses.
+        """
+        first = True
+        start = time.perf_counter()
+        try:
+            for chunk in resp.iter_lines(delimiter=b'\r\n\r\n'):
+                received = time.perf_counter()
+                timer.add('ttfb' if first else 'stream', received - start)
+                first = False
+                if should_cancel and should_cancel():
+                    raise RequestCancelled()
+                if chunk.startswith(b'event: error') or b'"error_code"' in chunk:
+                    self._check_stream_error(chunk)
+                yield chunk
+                start = time.perf_counter()
+                timer.add('sse_parse', start - received)
+        finally:
+            resp.close()
+
+    def _check_stream_error(self, chunk):
+        """Raise the UpstreamError described by an SSE error event, if it is one"""
+        content = chunk.decode('utf-8', 'replace')
+        is_error_event = content.startswith('event: error')
+        message = content if is_error_event else None
+        try:
+            payload = json.loads(content.split('data: ', 1)[1])
+            if isinstance(payload, dict) and (payload.get('error_code') or is_error_event):
+                message = payload.get('error_code') or payload.get('error') or payload.get('message') or content
+        except (IndexError, ValueError):
+            pass
+
+        if message:
+            raise classify_upstream_error(message=message)(f"Perplexity stream error: {message}")
+
+    def _stream_response(self, resp, timer=NULL_TIMER, should_cancel=None):
         """Stream response chunks"""
-        for chunk in resp.iter_lines(delimiter=b'\r\n\r\n'):
+        for chunk in self._iter_events(resp, timer, should_cancel):
             content = chunk.decode('utf-8')
 
             if content.startswith('event: message\r\n'):
@@ -123,12 +242,12 @@ class PerplexityFixed:
             elif content.startswith('event: end_of_stream\r\n'):
                 return
 
-    def _get_full_response(self, resp):
+    def _get_full_response(self, resp, timer=NULL_TIMER, should_cancel=None):
         """Get the complete response"""
         final_text = ""
         last_chunk = None
 
-        for chunk in resp.iter_lines(delimiter=b'\r\n\r\n'):
+        for chunk in self._iter_events(resp, timer, should_cancel):
             content = chunk.decode('utf-8')
 
             if content.startswith('event: message\r\n'):
@@ -158,9 +277,11 @@ class PerplexityFixed:
                         pass
 
                 # Otherwise return what we got from blocks
-                return final_text if final_text else "No answer received"
+                return final_text
 
-        return final_text if final_text else "No answer received"
+        # Empty when upstream sent nothing usable, so callers never mistake
+        # a placeholder for an answer (and never cache one)
+        return final_text
 
     def _extract_answer_from_steps(self, steps):
         """Extract the answer text from the steps data structure"""
@@ -205,5 +326,5 @@ if __name__ == "__main__":
     print("=" * 80)
     print("ANSWER:")
     print("=" * 80)
-    print(answer)
+    print(answer or NO_ANSWER)
     print("=" * 80)
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Perplexity MCP Server
+MCP stdio server that calls PerplexityFixed in-process (no HTTP proxy hop)
+
+Searches run directly on the account pool, so a tool call costs about as
+much as the upstream request itself: no local HTTP round trip and no API-key
+file lookup per call. Finished answers are kept in the result cache, and
+answers stream back as MCP progress notifications while they are generated
+(for clients that send a progress token); the tool result is the full answer.
+
+Tools:
+    perplexity_search         Fast web search (auto mode)
+    perplexity_pro            In-depth search (pro mode)
+    perplexity_reasoning      Step-by-step reasoning (reasoning mode)
+    perplexity_deep_research  Long-form research report (deep research mode)
+
+Usage:
+    python src/perplexity_mcp_server.py
+
+    MCP client config:
+    {
+      "mcpServers": {
+        "perplexity-free": {
+          "command": "/path/to/perplexity-api-free/.venv/bin/python",
+          "args": ["/path/to/perplexity-api-free/src/perplexity_mcp_server.py"]
+        }
+      }
+    }
+
+Environment:
+    PERPLEXITY_COOKIE, PERPLEXITY_COOKIE_<N>  Account cookies (defaults from .env)
+    RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES  Answer cache (see result_cache.py)
+    PREWARM_FILE, PREWARM_*                    Scheduled cache prewarming (see prewarm.py)
+    MCP_MAX_CONCURRENT                         Searches run at once (default 8)
+"""
+
+import os
+import sys
+import builtins
+import asyncio
+import threading
+from typing import Annotated
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from pydantic import Field
+from mcp.server.fastmcp import FastMCP, Context
+
+# Add current directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from account_pool import AccountPool
+from perplexity_fixed import NO_ANSWER
+from pipeline import build_pipeline
+from result_cache import ResultCache
+from prewarm import Prewarmer
+
+ENV_FILE = Path(__file__).parent.parent / '.env'
+
+# tool name -> (mode, description)
+MODE_TOOLS = {
+    'perplexity_search': (
+        'auto',
+        "Search the web with Perplexity (fast). Best for quick facts and current information."
+    ),
+    'perplexity_pro': (
+        'pro',
+        "In-depth Perplexity search using more sources. Best for complex or technical questions."
+    ),
+    'perplexity_reasoning': (
+        'reasoning',
+        "Perplexity with step-by-step reasoning. Best for comparisons, analysis and trade-offs."
+    ),
+    'perplexity_deep_research': (
+        'deep research',
+        "Comprehensive Perplexity research report. Slow (minutes); use for broad research questions."
+    ),
+}
+
+
+class SearchService:
+    """Account pool, result cache and the thread/async bridge shared by all tools"""
+
+    def __init__(self, pool, cache=None, max_concurrent=8):
+        """
+        Initialize the service
+
+        Args:
+            pool: AccountPool (or anything with the same search() signature)
+            cache: Optional ResultCache
+            max_concurrent: Worker threads for blocking upstream searches
+        """
+        self.pool = pool
+        self.cache = cache
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='mcp-search')
+        self.active = 0   # tool searches currently waiting on upstream
+
+    async def search(self, query, mode='auto', sources=None, on_delta=None):
+        """
+        Run one search, streaming deltas to on_delta as they arrive
+
+        Deltas are progress only: the streamed snapshots are drafts, and the
+        answer returned (and cached) is the final one upstream settles on,
+        the same text a non-streaming search returns.
+
+        Args:
+            query: Question to ask
+            mode: Perplexity mode
+            sources: Source list (default ['web'])
+            on_delta: Optional async callable(delta, chars_so_far)
+
+        Returns:
+            The final answer text
+        """
+        sources = sources or ['web']
+        key = ResultCache.key(query, mode, sources)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                if on_delta:
+                    await on_delta(cached, len(cached))
+                return cached
+
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def emit(kind, value):
+            try:
+                loop.call_soon_threadsafe(events.put_nowait, (kind, value))
+            except RuntimeError:
+                cancelled.set()  # event loop is gone
+
+        def run():
+            try:
+                pipeline, _ = build_pipeline()
+                chunks = self.pool.search(query, mode=mode, sources=sources, stream=True,
+                                          should_cancel=cancelled.is_set)
+                last = ['']
+
+                def remember(chunks):
+                    for chunk in chunks:
+                        if chunk:
+                            last[0] = chunk  # the FINAL answer comes last, like _get_full_response
+                        yield chunk
+
+                for delta in pipeline.process(remember(chunks)):
+                    emit('delta', delta)
+                emit('done', build_pipeline()[0].collect([last[0]]))
+            except BaseException as e:
+                emit('error', e)
+
+        self.active += 1
+        self.executor.submit(run)
+
+        answer = ''
+        received = 0
+        try:
+            while True:
+                kind, value = await events.get()
+                # Coalesce whatever else is already queued into one notification
+                batch = []
+                while kind == 'delta':
+                    batch.append(value)
+                    if events.empty():
+                        break
+                    kind, value = events.get_nowait()
+
+                if batch:
+                    delta = ''.join(batch)
+                    received += len(delta)
+                    if on_delta:
+                        await on_delta(delta, received)
+
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    answer = value
+                    break
+        finally:
+            # Tool call cancelled or failed: stop the upstream stream as well
+            cancelled.set()
+            self.active -= 1
+
+        if self.cache is not None and answer:
+            self.cache.put(key, answer)
+        return answer
+
+    def fetch(self, query, mode='auto', sources=None, should_cancel=None):
+        """Blocking search that returns the final answer (used by the prewarmer)"""
+        return self.pool.search(query, mode=mode, sources=sources or ['web'], should_cancel=should_cancel)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_server(service):
+    """Build the FastMCP server with one search tool per mode"""
+    server = FastMCP('perplexity-free')
+
+    for name, (mode, description) in MODE_TOOLS.items():
+        server.tool(name=name, description=description)(make_search_tool(service, mode))
+
+    return server
+
+
+def make_search_tool(service, mode):
+    async def search_tool(
+        query: Annotated[str, Field(description="The question to research")],
+        sources: Annotated[list[str] | None, Field(description="Sources: web, scholar, social (default: web)")] = None,
+        ctx: Context = None
+    ) -> str:
+        async def on_delta(delta, received):
+            if ctx is not None:
+                await ctx.report_progress(received, None, delta)
+
+        answer = await service.search(query, mode=mode, sources=sources, on_delta=on_delta)
+        return answer or NO_ANSWER
+
+    return search_tool
+
+
+def load_env_defaults(path=ENV_FILE):
+    """Fill unset environment variables from the project .env file"""
+    if not path.exists():
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+
+def start_prewarmer(service, environ=None):
+    """Start scheduled prewarming of the service cache (None when PREWARM_FILE is unset)"""
+    environ = os.environ if environ is None else environ
+    max_inflight = int(environ.get('PREWARM_MAX_INFLIGHT', 4))
+
+    all_ejected = getattr(service.pool, 'all_ejected', None)
+
+    def busy():
+        if all_ejected is not None and all_ejected():
+            return True
+        return max_inflight > 0 and service.active >= max_inflight
+
+    try:
+        prewarmer = Prewarmer.from_env(service.fetch, service.cache, busy=busy, environ=environ)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Prewarming disabled: {e}")
+        return None
+    if prewarmer is None:
+        return None
+    if service.cache is None:
+        print(f"⚠️  Prewarming disabled: RESULT_CACHE_TTL is 0")
+        return None
+    print(f"✅ Prewarming {len(prewarmer.entries)} scheduled quer{'y' if len(prewarmer.entries) == 1 else 'ies'}")
+    return prewarmer.start()
+
+
+def log_to_stderr():
+    """
+    Send print() to stderr
+
+    Everything in this process logs with print(); on stdout those lines would
+    corrupt the JSON-RPC stream.
+    """
+    stdout_print = builtins.print
+
+    def print_to_stderr(*args, **kwargs):
+        kwargs.setdefault('file', sys.stderr)
+        stdout_print(*args, **kwargs)
+
+    builtins.print = print_to_stderr
+
+
+def main():
+    log_to_stderr()
+
+    load_env_defaults()
+    print("✅ Perplexity MCP Server")
+
+    service = SearchService(
+        AccountPool.from_env(),
+        cache=ResultCache.from_env(),
+        max_concurrent=int(os.environ.get('MCP_MAX_CONCURRENT', 8))
+    )
+    print(f"✅ Accounts: {len(service.pool.accounts)} | "
+          f"Cache: {'on' if service.cache else 'off'} | Tools: {', '.join(MODE_TOOLS)}")
+
+    prewarmer = start_prewarmer(service)
+
+    try:
+        create_server(service).run('stdio')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if prewarmer is not None:
+            prewarmer.close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
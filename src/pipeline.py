@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Streaming Answer Pipeline
+Composable post-processing stages that run incrementally on answer deltas
+
+Each stage takes text deltas in feed() and returns the text it is ready to
+pass on; finish() returns whatever it was still holding back. A Pipeline
+chains stages over the chunks coming out of PerplexityFixed._stream_response,
+so streaming and non-streaming responses go through exactly the same code
+and nothing is re-scanned after the answer has arrived.
+
+Usage:
+    from pipeline import Pipeline, SnapshotDeltas, StripCitations, TokenCounter
+    counter = TokenCounter()
+    pipeline = Pipeline([SnapshotDeltas(), StripCitations(), counter])
+    for delta in pipeline.process(client.search(query, stream=True)):
+        ...
+    counter.tokens
+"""
+
+import re
+import json
+
+
+class Stage:
+    """Base stage: passes text through unchanged"""
+
+    def feed(self, text):
+        return text
+
+    def finish(self):
+        return ''
+
+
+class SnapshotDeltas(Stage):
+    """
+    Turn cumulative answer snapshots into deltas
+
+    Perplexity re-sends the whole answer-so-far in each event. Only the new
+    suffix is passed on; snapshots that are not an extension of what was
+    already emitted (older, shorter or rewritten) are dropped, because text
+    that was already streamed cannot be taken back.
+    """
+
+    def __init__(self):
+        self.emitted = ''
+
+    def feed(self, text):
+        if not text or not text.startswith(self.emitted):
+            return ''
+        delta = text[len(self.emitted):]
+        self.emitted = text
+        return delta
+
+
+class StripCitations(Stage):
+    """Remove numeric citation markers like [1] or [2][14]"""
+
+    MARKER = re.compile(r'\[\d+\]')
+    PARTIAL = re.compile(r'\[\d*$')
+
+    def __init__(self):
+        self.pending = ''
+
+    def feed(self, text):
+        text = self.MARKER.sub('', self.pending + text)
+        # Hold back a possibly unfinished marker at the end ("... [1")
+        partial = self.PARTIAL.search(text)
+        if partial:
+            self.pending = text[partial.start():]
+            return text[:partial.start()]
+        self.pending = ''
+        return text
+
+    def finish(self):
+        tail, self.pending = self.pending, ''
+        return tail
+
+
+class JsonExtract(Stage):
+    """
+    Pass on only the JSON object/array in the answer
+
+    Text is scanned once as it arrives, tracking bracket depth and strings.
+    A candidate is held until its brackets balance, then validated; the
+    conversational text around it is dropped. Objects win over arrays: the
+    first valid object is passed on as soon as it is complete, while an
+    array is only used if no object follows. Citation markers such as [1]
+    never count as JSON. If the whole answer is itself a JSON object/array it
+    is returned as is, and if no valid JSON is found the original text is
+    returned unchanged.
+    """
+
+    START = re.compile(r'[{\[]')
+    CITATION = re.compile(r'\[\s*\d+\s*\]')
+
+    def __init__(self):
+        self.skipped = []       # text before the current candidate (fallback output)
+        self.pending = ''       # current candidate, or unscanned text
+        self.array = None       # first valid array, used if no object turns up
+        self.started = False
+        self.done = False
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text):
+        if self.done or not text:
+            return ''
+        self.pending += text
+
+        while True:
+            if not self.started:
+                match = self.START.search(self.pending)
+                if not match:
+                    self.skipped.append(self.pending)
+                    self.pending = ''
+                    return ''
+                self.skipped.append(self.pending[:match.start()])
+                self.pending = self.pending[match.start():]
+                self.started = True
+                self.pos = 0
+                self.depth = 0
+                self.in_string = False
+                self.escaped = False
+
+            end = self._scan()
+            if end is None:
+                return ''
+
+            candidate = self.pending[:end]
+            try:
+                json.loads(candidate)
+            except ValueError:
+                # Not JSON after all; keep looking after this bracket
+                self.skipped.append(self.pending[0])
+                self.pending = self.pending[1:]
+                self.started = False
+                continue
+
+            if candidate.startswith('{'):
+                self.done = True
+                self.pending = ''
+                return candidate
+
+            # An array: remember it (unless it is a citation marker) and keep
+            # looking for an object after it
+            if self.array is None and not self.CITATION.fullmatch(candidate):
+                self.array = candidate
+            self.skipped.append(candidate)
+            self.pending = self.pending[end:]
+            self.started = False
+
+    def _scan(self):
+        """Advance through pending text; return the end index once brackets balance"""
+        pending = self.pending
+        for i in range(self.pos, len(pending)):
+            char = pending[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        self.pos = len(pending)
+        return None
+
+    def finish(self):
+        if self.done:
+            return ''
+        text = ''.join(self.skipped) + self.pending
+        self.skipped, self.pending = [], ''
+        try:
+            whole = json.loads(text)
+        except ValueError:
+            whole = None
+        if isinstance(whole, (dict, list)):
+            return text.strip()
+        return self.array if self.array is not None else text
+
+
+class TokenCounter(Stage):
+    """Count completion tokens incrementally (1 word ≈ 1.3 tokens)"""
+
+    def __init__(self):
+        self.words = 0
+        self.in_word = False
+
+    def feed(self, text):
+        for char in text:
+            if char.isspace():
+                self.in_word = False
+            elif not self.in_word:
+                self.in_word = True
+                self.words += 1
+        return text
+
+    @property
+    def tokens(self):
+        return estimate_tokens_from_words(self.words)
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def feed(self, text, start=0):
+        """Push text through stages[start:]"""
+        for stage in self.stages[start:]:
+            if not text:
+                return ''
+            text = stage.feed(text)
+        return text
+
+    def finish(self):
+        """Flush every stage, passing each one's tail through the stages after it"""
+        out = []
+        for i, stage in enumerate(self.stages):
+            tail = stage.finish()
+            if tail:
+                out.append(self.feed(tail, i + 1))
+        return ''.join(out)
+
+    def process(self, chunks):
+        """Yield processed deltas for an iterable of raw chunks"""
+        for chunk in chunks:
+            delta = self.feed(chunk)
+            if delta:
+                yield delta
+        tail = self.finish()
+        if tail:
+            yield tail
+
+    def collect(self, chunks):
+        """Run the whole stream and return the processed answer"""
+        return ''.join(self.process(chunks))
+
+
+def estimate_tokens_from_words(words):
+    return int(words * 1.3)
+
+
+def estimate_tokens(text):
+    """Rough token estimate for short texts such as the prompt"""
+    return estimate_tokens_from_words(len(text.split()))
+
+
+def build_pipeline(json_mode=False, strip_citations=False):
+    """
+    Standard answer pipeline
+
+    Returns:
+        (pipeline, token_counter)
+    """
+    stages = [SnapshotDeltas()]
+    if strip_citations:
+        stages.append(StripCitations())
+    if json_mode:
+        stages.append(JsonExtract())
+    counter = TokenCounter()
+    stages.append(counter)
+    return Pipeline(stages), counter
+
+
+def extract_json_from_text(text):
+    """Extract JSON object or array from conversational text (original text if none)"""
+    return Pipeline([JsonExtract()]).collect([text])
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Result Cache Prewarming
+Keeps recurring queries warm in the result cache on a schedule
+
+Each schedule entry is a (query, mode, sources) triple with a refresh
+interval. A single background thread refreshes one entry at a time, so
+prewarming never takes more than one upstream slot away from callers:
+  - entries whose cached answer is younger than their interval are skipped
+  - nothing runs while the caller-supplied busy() check is true (e.g. too
+    many requests in flight, or every account ejected for throttling)
+  - refreshes are spaced at least min_gap seconds apart
+  - when upstream throttles, all prewarming pauses with exponential backoff
+
+Answers are stored with a TTL of twice the interval, so a scheduled query is
+still served warm if one refresh runs late or fails.
+
+Schedule file (JSON list):
+    [
+      {"query": "Daily market summary", "mode": "pro", "interval": 86400},
+      {"query": "Latest Django release", "sources": ["web"], "interval": 3600}
+    ]
+
+Usage:
+    from prewarm import Prewarmer, load_schedule
+    prewarmer = Prewarmer(load_schedule('prewarm.json'), search, cache,
+                          busy=lambda: inflight.active >= 4)
+    prewarmer.start()
+
+Environment:
+    PREWARM_FILE          Schedule file (prewarming is off when unset)
+    PREWARM_MIN_GAP       Seconds between prewarm requests (default 10)
+    PREWARM_MAX_INFLIGHT  Wait while this many caller requests are in flight (default 4, 0 = never wait)
+    PREWARM_MAX_BACKOFF   Longest pause after upstream throttling, seconds (default 900)
+"""
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+from perplexity_fixed import NO_ANSWER, RequestCancelled, UpstreamThrottled
+from result_cache import ResultCache
+
+MODES = ('auto', 'pro', 'reasoning', 'deep research')
+MIN_INTERVAL = 60
+
+
+class PrewarmEntry:
+    """One scheduled query and its refresh history"""
+
+    def __init__(self, query, mode='auto', sources=None, interval=3600):
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Prewarm entry needs a non-empty query")
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r} (expected one of {', '.join(MODES)})")
+        interval = float(interval)
+        if interval < MIN_INTERVAL:
+            raise ValueError(f"Refresh interval must be at least {MIN_INTERVAL}s, got {interval:g}")
+
+        self.query = query
+        self.mode = mode
+        self.sources = list(sources or ['web'])
+        self.interval = interval
+        self.key = ResultCache.key(query, mode, self.sources)
+
+        self.refreshes = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_refreshed = None
+        self.last_duration = None
+        self.last_error = None
+
+    def status(self, age=None):
+        return {
+            'query': self.query,
+            'mode': self.mode,
+            'sources': self.sources,
+            'interval': self.interval,
+            'warm': age is not None,
+            'age': round(age, 1) if age is not None else None,
+            'refreshes': self.refreshes,
+            'failures': self.failures,
+            'last_refreshed': self.last_refreshed,
+            'last_duration': round(self.last_duration, 2) if self.last_duration is not None else None,
+            'last_error': self.last_error,
+        }
+
+
+def load_schedule(path):
+    """
+    Read a schedule file
+
+    Returns:
+        List of PrewarmEntry (raises ValueError on a malformed file)
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"{Path(path).name}: expected a JSON list of entries")
+
+    entries = []
+    for i, item in enumerate(data):
+        if not isinstance(item, dict):
+            raise ValueError(f"{Path(path).name}: entry {i} is not an object")
+        try:
+            entries.append(PrewarmEntry(item.get('query'), item.get('mode', 'auto'),
+                                        item.get('sources'), item.get('interval', 3600)))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{Path(path).name}: entry {i}: {e}") from e
+    return entries
+
+
+def is_throttled(error):
+    """True for upstream rate limiting, also when wrapped by the provider router"""
+    return isinstance(error, UpstreamThrottled) or isinstance(error.__cause__, UpstreamThrottled)
+
+
+class Prewarmer:
+    def __init__(self, entries, search, cache, busy=None, min_gap=10.0, base_backoff=30.0,
+                 max_backoff=900.0, poll_interval=1.0, max_sleep=60.0):
+        """
+        Initialize the prewarmer (call start() to run it in the background)
+
+        Args:
+            entries: List of PrewarmEntry
+            search: Blocking callable(query, mode, sources, should_cancel) -> answer
+            cache: ResultCache the answers are stored in
+            busy: Optional callable; prewarming waits while it returns True
+            min_gap: Seconds between the end of one refresh and the start of the next
+            base_backoff: First pause after throttling / first retry delay after an error
+            max_backoff: Upper bound on both
+            poll_interval: Seconds between busy() checks
+            max_sleep: Longest idle wait (re-checks the cache, e.g. after an LRU eviction)
+        """
+        self.entries = list(entries)
+        self.search = search
+        self.cache = cache
+        self.busy = busy
+        self.min_gap = min_gap
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self.max_sleep = max_sleep
+
+        self.backoff = 0.0
+        self.paused_until = 0.0
+        self.skipped = 0
+        self._last_finished = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_env(cls, search, cache, busy=None, environ=None):
+        """Build a prewarmer from PREWARM_* (None when PREWARM_FILE is unset or empty)"""
+        environ = os.environ if environ is None else environ
+        path = environ.get('PREWARM_FILE')
+        if not path:
+            return None
+        entries = load_schedule(path)
+        if not entries:
+            return None
+        return cls(entries, search, cache, busy=busy,
+                   min_gap=float(environ.get('PREWARM_MIN_GAP', 10)),
+                   max_backoff=float(environ.get('PREWARM_MAX_BACKOFF', 900)))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='cache-prewarmer', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                print(f"⚠️  Prewarm error: {type(e).__name__}: {e}")
+                delay = self.poll_interval
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def due(self, now=None):
+        """
+        The entry to refresh next
+
+        Returns:
+            (entry, seconds until it is due), or (None, None) without entries
+        """
+        now = time.time() if now is None else now
+        best, best_wait = None, None
+        for entry in self.entries:
+            age = self.cache.age(entry.key)
+            wait = 0.0 if age is None else entry.interval - age
+            wait = max(wait, entry.retry_at - now, 0.0)
+            if best is None or wait < best_wait:
+                best, best_wait = entry, wait
+        return best, best_wait
+
+    def run_once(self):
+        """
+        Refresh the most overdue entry if the schedule and rate limits allow it
+
+        Returns:
+            Seconds to wait before the next call
+        """
+        now = time.time()
+        hold = max(self.paused_until, self._last_finished + self.min_gap) - now
+        if hold > 0:
+            return hold
+
+        entry, wait = self.due(now)
+        if entry is None:
+            return self.max_sleep
+        if wait > 0:
+            return min(wait, self.max_sleep)
+        if self.busy is not None and self.busy():
+            return self.poll_interval
+
+        self.refresh(entry)
+        return 0.0
+
+    def refresh(self, entry):
+        """Fetch one entry now and store it for two intervals"""
+        age = self.cache.age(entry.key)
+        if age is not None and age < entry.interval:
+            self.skipped += 1  # already fresh (e.g. a caller asked the same question)
+            return False
+
+        start = time.time()
+        try:
+            answer = self.search(entry.query, entry.mode, entry.sources, should_cancel=self._stop.is_set)
+        except RequestCancelled:
+            return False
+        except Exception as e:
+            entry.failures += 1
+            entry.last_error = f"{type(e).__name__}: {e}"
+            if is_throttled(e):
+                self.backoff = min(self.max_backoff, self.backoff * 2 or self.base_backoff)
+                self.paused_until = time.time() + self.backoff
+                print(f"⚠️  Prewarm throttled upstream, pausing for {self.backoff:.0f}s")
+            else:
+                retry = min(entry.interval, self.base_backoff * (2 ** (entry.failures - 1)), self.max_backoff)
+                entry.retry_at = time.time() + retry
+                print(f"⚠️  Prewarm failed for {entry.query[:60]!r} ({entry.last_error}), retrying in {retry:.0f}s")
+            return False
+        finally:
+            self._last_finished = time.time()
+
+        if not answer or not answer.strip() or answer == NO_ANSWER:
+            entry.failures += 1
+            entry.last_error = NO_ANSWER
+            entry.retry_at = time.time() + min(entry.interval, self.base_backoff)
+            return False
+
+        self.cache.put(entry.key, answer, ttl=entry.interval * 2)
+        entry.refreshes += 1
+        entry.failures = 0
+        entry.retry_at = 0.0
+        entry.last_error = None
+        entry.last_refreshed = time.time()
+        entry.last_duration = entry.last_refreshed - start
+        self.backoff = 0.0
+        print(f"🔥 Prewarmed {entry.mode} {entry.query[:60]!r} in {entry.last_duration:.1f}s")
+        return True
+
+    def status(self):
+        now = time.time()
+        return {
+            'entries': [entry.status(self.cache.age(entry.key)) for entry in self.entries],
+            'paused_for': round(max(0.0, self.paused_until - now), 1),
+            'skipped': self.skipped,
+            'min_gap': self.min_gap,
+        }
+
+    def close(self):
+        """Stop the thread; a refresh in progress is cancelled at its next upstream event"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
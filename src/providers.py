@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+"""
+Search Providers
+Provider abstraction with latency-aware routing, circuit breakers and failover
+
+A Provider answers searches with the same arguments as PerplexityFixed.search.
+ProviderRouter keeps a rolling latency window per (provider, mode) and a
+circuit breaker per provider. Each request goes to the enabled provider with
+the best rolling p50 among those whose circuit is closed and whose p95 is
+within the mode's SLO; if that provider fails or stalls past the mode's
+timeout, the router fails over to the next one. Streams fail over until
+their first chunk arrives; after that a failure or a gap between chunks
+longer than the mode's timeout ends the stream with an error.
+
+Built-in provider types:
+    perplexity   PerplexityFixed through the multi-account AccountPool
+    local        Local stand-in that echoes the query (for testing)
+
+Other backends plug in with register_provider_type(), or by listing a
+"module:ClassName" entry in PROVIDERS.
+
+Usage:
+    from providers import ProviderRouter, PerplexityProvider
+    router = ProviderRouter([PerplexityProvider(pool)])
+    answer = router.search("What is Python?", mode='pro')
+
+Non-streaming calls run on a worker thread so a stall can be abandoned. By
+default each call gets its own thread, matching the threaded server (one
+thread per request, no cap); PROVIDER_MAX_WORKERS bounds them with a shared
+pool instead, and calls beyond the bound wait for a free worker.
+
+Environment:
+    PROVIDERS                Comma-separated provider types in preference order (default: perplexity)
+    LOCAL_PROVIDER_LATENCY   Seconds the local stand-in waits before answering (default: 0)
+    PROVIDER_MAX_WORKERS     Worker threads for non-streaming calls (default: 0 = one thread per call)
+"""
+
+import os
+import time
+import queue
+import threading
+import importlib
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from perplexity_fixed import RequestCancelled, UpstreamError
+
+# Rolling p95 above this (seconds) counts as an SLO breach for the mode
+MODE_SLO_SECONDS = {
+    'auto': 20,
+    'pro': 60,
+    'reasoning': 120,
+    'deep research': 900,
+}
+
+# A call that takes longer than this, or a stream that goes this long without
+# a chunk, is treated as stalled
+MODE_TIMEOUT_SECONDS = {
+    'auto': 90,
+    'pro': 240,
+    'reasoning': 400,
+    'deep research': 1800,
+}
+
+
+class ProviderUnavailable(UpstreamError):
+    """No provider could answer the request"""
+
+
+class ProviderTimeout(UpstreamError):
+    """A provider stalled past the mode's timeout"""
+
+
+class Provider(ABC):
+    """Base class for search backends (subclasses implement search)"""
+
+    id = 'provider'
+    name = 'Provider'
+    icon = '🔌'
+    description = ''
+    models = ()
+
+    @abstractmethod
+    def search(self, query, mode='auto', model=None, sources=None, stream=False, timer=None,
+               should_cancel=None):
+        """Same contract as PerplexityFixed.search"""
+
+    def status(self):
+        """Extra provider-specific details for /api/providers"""
+        return {}
+
+
+class PerplexityProvider(Provider):
+    id = 'perplexity'
+    name = 'Perplexity'
+    icon = '🔮'
+    description = 'Search-focused AI with real-time web access'
+    models = ('sonar', 'sonar-pro', 'sonar-reasoning', 'sonar-reasoning-pro', 'sonar-deep-research')
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def search(self, query, **kwargs):
+        return self.pool.search(query, **kwargs)
+
+    def status(self):
+        return {'accounts': self.pool.status()}
+
+
+class LocalProvider(Provider):
+    """Local stand-in: answers by echoing the query after a fixed delay"""
+
+    id = 'local'
+    name = 'Local Stand-in'
+    icon = '🧪'
+    description = 'Echoes queries locally; for testing routing and failover'
+    models = ('local',)
+
+    def __init__(self, latency=0.0, answer=None):
+        self.latency = latency
+        self.answer = answer
+
+    def search(self, query, mode='auto', model=None, sources=None, stream=False, timer=None,
+               should_cancel=None):
+        if self.latency:
+            time.sleep(self.latency)
+        if should_cancel and should_cancel():
+            raise RequestCancelled()
+        answer = self.answer if self.answer is not None else f"[local:{mode}] {query}"
+        return iter([answer]) if stream else answer
+
+
+class LatencyWindow:
+    """Rolling window of recent latencies"""
+
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half-open after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.time() - self.opened_at >= self.reset_seconds:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        return state == 'closed' or (state == 'half-open' and not self.probe_in_flight)
+
+    def on_attempt(self):
+        if self.state == 'half-open':
+            self.probe_in_flight = True
+
+    def on_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_in_flight = False
+
+    def on_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.time()
+
+
+class RoutedStream:
+    """
+    A provider stream read on its own thread, with a stall timeout between chunks
+
+    The reader thread opens the provider stream and queues its chunks, so the
+    caller waits at most `timeout` seconds for each one and a stream that stops
+    mid-way fails with ProviderTimeout instead of hanging. upstream_seconds
+    counts only time spent waiting on the provider, not time the caller spends
+    with each chunk. on_finish(upstream_seconds, error) is called exactly once
+    when the stream ends, fails or is closed (closing counts as cancellation).
+    """
+
+    def __init__(self, open_stream, should_cancel=None, timeout=None, label='provider', buffer=16):
+        """
+        Start reading
+
+        Args:
+            open_stream: Callable(should_cancel) -> iterable of chunks
+            should_cancel: Optional caller disconnect check
+            timeout: Longest wait for any chunk, including the first (None = no limit)
+            label: Provider name for error messages
+            buffer: Chunks read ahead of the caller before the reader waits
+        """
+        self.timeout = timeout
+        self.label = label
+        self.upstream_seconds = 0.0
+        self.finished = False
+        self.on_finish = None
+        self._should_cancel = should_cancel
+        self._queue = queue.Queue(maxsize=buffer)
+        self._abandoned = threading.Event()
+        self._closed = threading.Event()
+        self._first = None
+        self._output = self._chunks()
+        threading.Thread(target=self._read, args=(open_stream,), name='provider-stream', daemon=True).start()
+
+    def first(self):
+        """Wait for the first chunk, raising whatever the provider raised before it"""
+        try:
+            self._first = self._get()
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    def pipe(self, pipeline):
+        """Post-process the chunks with a pipeline.Pipeline"""
+        self._output = pipeline.process(self._output)
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.finished:
+            raise StopIteration
+        try:
+            return next(self._output)
+        except StopIteration:
+            self._finish()
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+        except BaseException:
+            self._finish(RequestCancelled())
+            raise
+
+    def close(self):
+        if self.finished:
+            return
+        try:
+            self._output.close()
+        finally:
+            self._finish(RequestCancelled())
+
+    def __del__(self):
+        self.close()
+
+    def _chunks(self):
+        kind, value = self._first or self._get()
+        self._first = None
+        while kind == 'chunk':
+            yield value
+            kind, value = self._get()
+
+    def _get(self):
+        try:
+            kind, value = self._queue.get(timeout=self.timeout)
+        except queue.Empty:
+            # The reader stops at the provider's next event, or its read timeout
+            self._abandoned.set()
+            raise ProviderTimeout(f"{self.label} sent nothing for more than {self.timeout}s")
+        if kind == 'error':
+            raise value
+        return kind, value
+
+    def _cancel_check(self):
+        if self._abandoned.is_set():
+            raise ProviderTimeout(f"{self.label} sent nothing for more than {self.timeout}s")
+        return self._closed.is_set() or bool(self._should_cancel and self._should_cancel())
+
+    def _read(self, open_stream):
+        chunks = None
+        try:
+            waited = time.time()
+            chunks = open_stream(self._cancel_check)
+            for chunk in chunks:
+                self.upstream_seconds += time.time() - waited
+                if not self._put(('chunk', chunk)):
+                    return
+                waited = time.time()
+            self.upstream_seconds += time.time() - waited
+            self._put(('done', None))
+        except BaseException as e:
+            self._put(('error', e))
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+    def _put(self, item):
+        """Queue an item for the caller; False once the caller has gone"""
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _finish(self, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        self._closed.set()
+        if self.on_finish is not None:
+            self.on_finish(self.upstream_seconds, error)
+
+
+class ProviderRouter:
+    def __init__(self, providers, slo=None, timeouts=None, failure_threshold=5, reset_seconds=30.0,
+                 max_workers=0):
+        """
+        Initialize the router
+
+        Args:
+            providers: Providers in preference order (first is the primary)
+            slo: Per-mode p95 SLO in seconds (defaults to MODE_SLO_SECONDS)
+            timeouts: Per-mode stall timeout in seconds (defaults to MODE_TIMEOUT_SECONDS)
+            failure_threshold: Consecutive failures that open a provider's circuit
+            reset_seconds: How long a circuit stays open before a half-open probe
+            max_workers: Threads shared by timed (non-streaming) calls (0 = one thread per call)
+        """
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = list(providers)
+        self.slo = dict(MODE_SLO_SECONDS, **(slo or {}))
+        self.timeouts = dict(MODE_TIMEOUT_SECONDS, **(timeouts or {}))
+        self.enabled = {p.id: True for p in self.providers}
+        self.breakers = {p.id: CircuitBreaker(failure_threshold, reset_seconds) for p in self.providers}
+        self.latency = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        if max_workers:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='provider-call')
+
+    def window(self, provider_id, mode):
+        key = (provider_id, mode)
+        if key not in self.latency:
+            self.latency[key] = LatencyWindow()
+        return self.latency[key]
+
+    def route(self, mode='auto'):
+        """
+        Providers to try for a mode, best first
+
+        Providers within SLO come first ordered by rolling p50 (unmeasured ones
+        first, so they get sampled), then SLO breachers; open circuits are skipped.
+        """
+        slo = self.slo.get(mode)
+        ranked = []
+        with self._lock:
+            for rank, provider in enumerate(self.providers):
+                if not self.enabled[provider.id] or not self.breakers[provider.id].allow():
+                    continue
+                window = self.window(provider.id, mode)
+                p50, p95 = window.percentile(50), window.percentile(95)
+                breached = slo is not None and p95 is not None and p95 > slo
+                ranked.append(((breached, p50 if p50 is not None else 0.0, rank), provider))
+        ranked.sort(key=lambda item: item[0])
+        return [provider for _, provider in ranked]
+
+    def search(self, query, mode='auto', stream=False, should_cancel=None, pipeline_factory=None, **kwargs):
+        """
+        Search via the best provider, failing over on errors and stalls
+
+        Accepts the same arguments as PerplexityFixed.search, plus
+        pipeline_factory: a callable returning a fresh pipeline.Pipeline per
+        attempt. Streams are post-processed incrementally as deltas arrive;
+        non-streaming calls run the pipeline over the provider's final answer
+        (which may differ from the last streamed snapshot).
+        """
+        candidates = self.route(mode)
+        if not candidates:
+            raise ProviderUnavailable("No provider available (all disabled or circuits open)")
+
+        last_error = None
+        for provider in candidates:
+            with self._lock:
+                self.breakers[provider.id].on_attempt()
+            try:
+                if stream:
+                    return self._start_stream(provider, query, mode, should_cancel, kwargs, pipeline_factory)
+                answer, elapsed = self._call_with_timeout(provider, query, mode, should_cancel, kwargs,
+                                                          pipeline_factory)
+            except RequestCancelled:
+                with self._lock:
+                    self.breakers[provider.id].probe_in_flight = False
+                raise
+            except Exception as e:
+                self._record(provider, mode, None, e)
+                print(f"⚠️  Provider {provider.id} failed ({type(e).__name__}: {e}), failing over")
+                last_error = e
+                continue
+
+            self._record(provider, mode, elapsed)
+            return answer
+
+        raise ProviderUnavailable(f"All providers failed: {last_error}") from last_error
+
+    def _call_with_timeout(self, provider, query, mode, should_cancel, kwargs, pipeline_factory=None):
+        """
+        Run a non-streaming search, abandoning it if it stalls past the mode timeout
+
+        The timeout (and the recorded latency) start when a worker picks the
+        call up, so waiting for a free worker is never blamed on the provider.
+
+        Returns:
+            (answer, seconds the call ran)
+        """
+        started = threading.Event()
+        started_at = []
+
+        def call(cancel_check):
+            started_at.append(time.time())
+            started.set()
+            answer = provider.search(query, mode=mode, stream=False, should_cancel=cancel_check, **kwargs)
+            if pipeline_factory is not None:
+                answer = pipeline_factory().collect([answer])
+            return answer, time.time() - started_at[0]
+
+        timeout = self.timeouts.get(mode)
+        if not timeout:
+            return call(should_cancel)
+
+        abandoned = threading.Event()
+
+        def cancel_check():
+            if abandoned.is_set():
+                # Raised inside the provider, so the stall counts against the
+                # account that stalled (a cancellation would be ignored)
+                raise ProviderTimeout(f"{provider.id} stalled for more than {timeout}s")
+            return bool(should_cancel and should_cancel())
+
+        future = self._submit(call, cancel_check)
+        while not started.wait(0.1):
+            if should_cancel and should_cancel() and future.cancel():
+                raise RequestCancelled()
+        try:
+            return future.result(timeout=max(0.0, started_at[0] + timeout - time.time()))
+        except FutureTimeout:
+            # Upstream is closed at its next event, or by the client's read timeout
+            abandoned.set()
+            raise ProviderTimeout(f"{provider.id} stalled for more than {timeout}s")
+
+    def _submit(self, fn, *args):
+        """Run fn on the shared pool, or on a thread of its own when there is none"""
+        if self._executor is not None:
+            return self._executor.submit(fn, *args)
+
+        future = Future()
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='provider-call', daemon=True).start()
+        return future
+
+    def _start_stream(self, provider, query, mode, should_cancel, kwargs, pipeline_factory=None):
+        """
+        Open a stream and wait for its first chunk
+
+        Errors and stalls before the first chunk fail over like a
+        non-streaming call; the stream's outcome is recorded when it ends,
+        with its upstream time as the latency sample.
+        """
+        stream = RoutedStream(
+            lambda cancel_check: provider.search(query, mode=mode, stream=True, should_cancel=cancel_check,
+                                                 **kwargs),
+            should_cancel=should_cancel, timeout=self.timeouts.get(mode), label=provider.id
+        ).first()
+        if pipeline_factory is not None:
+            stream.pipe(pipeline_factory())
+        stream.on_finish = lambda seconds, error: self._finish_stream(provider, mode, seconds, error)
+        return stream
+
+    def _finish_stream(self, provider, mode, upstream_seconds, error=None):
+        if isinstance(error, RequestCancelled):
+            # Caller went away: a truncated stream says nothing about the provider
+            with self._lock:
+                self.breakers[provider.id].probe_in_flight = False
+        else:
+            self._record(provider, mode, upstream_seconds, error)
+
+    def _record(self, provider, mode, elapsed, error=None):
+        with self._lock:
+            breaker = self.breakers[provider.id]
+            if error is None:
+                breaker.on_success()
+                if elapsed is not None:
+                    self.window(provider.id, mode).add(elapsed)
+            else:
+                breaker.on_failure()
+                if isinstance(error, ProviderTimeout):
+                    self.window(provider.id, mode).add(self.timeouts.get(mode, 0))
+
+    def set_enabled(self, provider_id, enabled):
+        """Enable/disable a provider (the last enabled provider cannot be disabled)"""
+        with self._lock:
+            if provider_id not in self.enabled:
+                raise KeyError(provider_id)
+            if not enabled and sum(self.enabled.values()) == 1 and self.enabled[provider_id]:
+                return False
+            self.enabled[provider_id] = enabled
+            return True
+
+    def status(self):
+        """Provider list for /api/providers"""
+        result = []
+        with self._lock:
+            for provider in self.providers:
+                latency = {}
+                for (provider_id, mode), window in self.latency.items():
+                    if provider_id == provider.id and window.samples:
+                        latency[mode] = {
+                            'p50': round(window.percentile(50), 3),
+                            'p95': round(window.percentile(95), 3),
+                            'samples': len(window.samples),
+                            'slo_p95': self.slo.get(mode),
+                        }
+                breaker = self.breakers[provider.id]
+                result.append({
+                    'id': provider.id,
+                    'name': provider.name,
+                    'icon': provider.icon,
+                    'status': 'active',
+                    'enabled': self.enabled[provider.id],
+                    'model_count': len(provider.models),
+                    'description': provider.description,
+                    'circuit': breaker.state,
+                    'consecutive_failures': breaker.failures,
+                    'latency': latency,
+                })
+        for entry, provider in zip(result, self.providers):
+            entry.update(provider.status())
+        return result
+
+
+_PROVIDER_TYPES = {}
+
+
+def register_provider_type(name, factory):
+    """Register a provider factory: factory(context) -> Provider"""
+    _PROVIDER_TYPES[name] = factory
+
+
+register_provider_type('perplexity', lambda context: PerplexityProvider(context['pool']))
+register_provider_type('local', lambda context: LocalProvider(
+    latency=float(context.get('environ', os.environ).get('LOCAL_PROVIDER_LATENCY', 0))))
+
+
+def build_providers(spec, context):
+    """
+    Build providers from a comma-separated spec
+
+    Each entry is a registered type name or "module:ClassName"; the class is
+    called with the context dict (which holds the account pool as 'pool').
+    """
+    providers = []
+    for entry in (e.strip() for e in spec.split(',')):
+        if not entry:
+            continue
+        if entry in _PROVIDER_TYPES:
+            providers.append(_PROVIDER_TYPES[entry](context))
+        elif ':' in entry:
+            module_name, class_name = entry.split(':', 1)
+            providers.append(getattr(importlib.import_module(module_name), class_name)(context))
+        else:
+            raise ValueError(f"Unknown provider '{entry}'")
+    return providers
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Structured Request Log
+Append-only JSONL log of proxy requests/responses
+
+Records are handed to a bounded in-memory buffer and written to disk by a
+background thread, so the request path never waits on file I/O. When the
+buffer is full new records are dropped (and counted) instead of blocking.
+
+Usage:
+    from request_log import RequestLogger
+    logger = RequestLogger('logs/requests.jsonl')
+    logger.log({'path': '/chat/completions', 'status': 200})
+
+Environment (see RequestLogger.from_env):
+    REQUEST_LOG_PATH            Log file path (unset = logging disabled)
+    REQUEST_LOG_SAMPLE_RATE     Fraction of requests to keep (default: 1.0)
+    REQUEST_LOG_REDACT          Comma-separated fields to redact
+    REQUEST_LOG_MAX_BYTES       Rotate when the file exceeds this size
+    REQUEST_LOG_ROTATE_SECONDS  Rotate when the file is older than this (age survives restarts)
+    REQUEST_LOG_BUFFER_SIZE     Max records waiting to be written
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import threading
+from pathlib import Path
+
+REDACTED = '[REDACTED]'
+
+# Secrets that reach the log in headers or admin request bodies (e.g. the
+# legacy {"key": "pplx_..."} body of /api/delete-key)
+DEFAULT_REDACT_FIELDS = ('authorization', 'cookie', 'api_key', 'key', 'token', 'password', 'secret')
+
+
+class RequestLogger:
+    def __init__(self, path, sample_rate=1.0, redact_fields=DEFAULT_REDACT_FIELDS,
+                 max_bytes=50 * 1024 * 1024, rotate_seconds=24 * 3600,
+                 buffer_size=10000, backup_count=10, flush_interval=1.0):
+        """
+        Initialize the request logger and start its writer thread
+
+        Args:
+            path: JSONL file to append to
+            sample_rate: Fraction of records to keep (0.0 - 1.0)
+            redact_fields: Field names (case-insensitive) whose values are replaced
+            max_bytes: Rotate once the file reaches this size (0 disables)
+            rotate_seconds: Rotate once the file is this old (0 disables)
+            buffer_size: Max records queued for the writer before dropping
+            backup_count: Rotated files to keep (0 keeps all)
+            flush_interval: Seconds between flushes while idle
+        """
+        self.path = Path(path)
+        self.sample_rate = float(sample_rate)
+        self.redact_fields = {f.lower() for f in redact_fields}
+        self.max_bytes = int(max_bytes)
+        self.rotate_seconds = float(rotate_seconds)
+        self.backup_count = int(backup_count)
+        self.flush_interval = float(flush_interval)
+
+        self.dropped = 0
+        self.written = 0
+        self.rotations = 0
+
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._file = None
+        self._opened_at = 0.0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Build a logger from REQUEST_LOG_* variables (None if no path is set)"""
+        environ = os.environ if environ is None else environ
+        path = environ.get('REQUEST_LOG_PATH')
+        if not path:
+            return None
+
+        redact = environ.get('REQUEST_LOG_REDACT')
+        redact_fields = DEFAULT_REDACT_FIELDS
+        if redact is not None:
+            redact_fields = tuple(f.strip() for f in redact.split(',') if f.strip())
+
+        return cls(
+            path,
+            sample_rate=float(environ.get('REQUEST_LOG_SAMPLE_RATE', 1.0)),
+            redact_fields=redact_fields,
+            max_bytes=int(environ.get('REQUEST_LOG_MAX_BYTES', 50 * 1024 * 1024)),
+            rotate_seconds=float(environ.get('REQUEST_LOG_ROTATE_SECONDS', 24 * 3600)),
+            buffer_size=int(environ.get('REQUEST_LOG_BUFFER_SIZE', 10000)),
+        )
+
+    def log(self, record):
+        """
+        Queue a record for writing (never blocks)
+
+        Returns:
+            True if the record was queued, False if sampled out or dropped
+        """
+        if self._closed:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+
+        try:
+            self._queue.put_nowait(self._redact(record))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Wait until every queued record has been written"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return self._queue.unfinished_tasks == 0
+
+    def close(self, timeout=5.0):
+        """Flush pending records and stop the writer thread"""
+        if self._closed:
+            return
+        self.flush(timeout)
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self):
+        """Return writer counters"""
+        return {
+            'path': str(self.path),
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'rotations': self.rotations,
+            'sample_rate': self.sample_rate,
+        }
+
+    def _redact(self, value):
+        """Recursively replace values of redacted fields"""
+        if isinstance(value, dict):
+            return {
+                k: REDACTED if str(k).lower() in self.redact_fields else self._redact(v)
+                for k, v in value.items()
+            }
+        if isinstance(value, list):
+            return [self._redact(v) for v in value]
+        return value
+
+    def _run(self):
+        """Writer thread: drain the queue to disk"""
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._file:
+                    self._file.flush()
+                self._maybe_rotate()
+                continue
+
+            if record is None:
+                self._queue.task_done()
+                break
+
+            handled = 1
+            stop = False
+            try:
+                self._write(record)
+                # Drain whatever else is waiting before flushing once
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    handled += 1
+                    if record is None:
+                        stop = True
+                        break
+                    self._write(record)
+                self._file.flush()
+            except Exception as e:
+                print(f"❌ Request log write failed: {e}")
+            finally:
+                for _ in range(handled):
+                    self._queue.task_done()
+
+            if stop:
+                break
+
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write(self, record):
+        if self._file is None:
+            self._open()  # may pick up an old file from an earlier run
+        self._maybe_rotate()
+        if self._file is None:
+            self._open()
+        self._file.write(json.dumps(record, default=str) + '\n')
+        self.written += 1
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if not self._opened_at:
+            self._opened_at = self._started_at() if self._file.tell() else time.time()
+
+    def _started_at(self):
+        """
+        When the existing log file was started, so its age survives restarts
+
+        Uses the creation time where the OS reports one, else the first
+        record's "ts", else the last modification time.
+        """
+        stat = self.path.stat()
+        born = getattr(stat, 'st_birthtime', None)
+        if born:
+            return born
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return float(json.loads(f.readline())['ts'])
+        except (ValueError, TypeError, KeyError):
+            return stat.st_mtime
+
+    def _maybe_rotate(self):
+        """Rotate on size or age"""
+        if self._file is None:
+            return
+
+        size = self._file.tell()
+        too_big = self.max_bytes and size >= self.max_bytes
+        too_old = self.rotate_seconds and size > 0 and time.time() - self._opened_at >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+
+        self._file.close()
+        self._file = None
+
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}.{self.rotations}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self.rotations += 1
+        self._opened_at = 0.0
+
+        if self.backup_count:
+            backups = sorted(self.path.parent.glob(f"{self.path.stem}.*{self.path.suffix}"),
+                             key=lambda p: p.stat().st_mtime)
+            for old in backups[:-self.backup_count]:
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
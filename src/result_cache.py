@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Search Result Cache
+In-memory LRU cache of finished answers, keyed by (query, mode, sources)
+
+Entries expire after a TTL and the least recently used entry is evicted once
+the cache is full. Only complete answers are stored, so a cached hit is
+exactly what the upstream returned for the same question. Entries may carry
+their own TTL (prewarmed answers are kept until their next scheduled refresh).
+
+Usage:
+    from result_cache import ResultCache
+    cache = ResultCache.from_env()
+    key = ResultCache.key("What is Python?", mode='pro')
+    answer = cache.get(key)
+    if answer is None:
+        answer = client.search("What is Python?", mode='pro')
+        cache.put(key, answer)
+
+Environment:
+    RESULT_CACHE_TTL          Seconds an answer stays fresh (default 900, 0 disables)
+    RESULT_CACHE_MAX_ENTRIES  Maximum cached answers (default 512)
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    def __init__(self, max_entries=512, ttl=900.0):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Maximum number of answers kept
+            ttl: Seconds an answer stays fresh
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (stored_at, answer, ttl)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """Build a cache from RESULT_CACHE_* (None when RESULT_CACHE_TTL is 0)"""
+        environ = os.environ if environ is None else environ
+        ttl = float(environ.get('RESULT_CACHE_TTL', 900))
+        if ttl <= 0:
+            return None
+        return cls(max_entries=int(environ.get('RESULT_CACHE_MAX_ENTRIES', 512)), ttl=ttl)
+
+    @staticmethod
+    def key(query, mode='auto', sources=None):
+        """Normalized cache key (whitespace/case-insensitive query, unordered sources)"""
+        return (' '.join(query.split()).lower(), mode, tuple(sorted(sources or ['web'])))
+
+    def get(self, key):
+        """Cached answer, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= entry[2]:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, answer, ttl=None):
+        """
+        Store a finished answer (empty answers are not cached)
+
+        Args:
+            key: Cache key from ResultCache.key()
+            answer: Full answer text
+            ttl: Seconds this entry stays fresh; by default the entry keeps the
+                TTL it already had (e.g. from the prewarmer), else the cache TTL
+        """
+        if not answer:
+            return
+        with self._lock:
+            if ttl is None:
+                previous = self._entries.get(key)
+                ttl = previous[2] if previous is not None else self.ttl
+            self._entries[key] = (time.time(), answer, ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def age(self, key):
+        """Seconds since the entry was stored, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.time() - entry[0]
+        return age if age < entry[2] else None
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'entries': size,
+            'max_entries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+        }
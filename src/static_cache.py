@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Static Asset Cache
+Builds dashboard/extension payloads once and serves them with validators
+
+Each asset is produced from one or more source files, then stored together
+with gzip (and brotli, if the `brotli` package is installed) variants and a
+strong ETag per encoding. The cache is rebuilt only when the sources' mtimes
+change, so repeat downloads cost a stat() instead of a compress.
+
+Usage:
+    from static_cache import StaticCache
+    cache = StaticCache()
+    cache.register_file('index', 'web/index.html', 'text/html; charset=utf-8')
+    body, headers, status = cache.respond('index', accept_encoding, if_none_match)
+"""
+
+import io
+import os
+import gzip
+import time
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # brotli is optional
+    brotli = None
+
+# Don't bother compressing tiny payloads
+MIN_COMPRESS_SIZE = 256
+
+
+class CachedAsset:
+    """One built asset with its encoded variants"""
+
+    def __init__(self, content, content_type, signature, compress=True, download_name=None):
+        self.content_type = content_type
+        self.signature = signature
+        self.download_name = download_name
+
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        self.variants = {'identity': (content, f'"{digest}"')}
+
+        if compress and len(content) >= MIN_COMPRESS_SIZE:
+            self.variants['gzip'] = (gzip.compress(content, compresslevel=9, mtime=0), f'"{digest}-gz"')
+            if brotli is not None:
+                self.variants['br'] = (brotli.compress(content, quality=11), f'"{digest}-br"')
+
+
+class StaticCache:
+    def __init__(self, check_interval=1.0):
+        """
+        Initialize an empty cache
+
+        Args:
+            check_interval: Minimum seconds between source mtime checks per asset
+        """
+        self.check_interval = check_interval
+        self._builders = {}
+        self._assets = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def register_file(self, name, path, content_type, compress=True):
+        """Register a single file asset"""
+        path = Path(path)
+
+        def sources():
+            return [path]
+
+        def build():
+            return path.read_bytes()
+
+        self._builders[name] = (sources, build, content_type, compress, None)
+
+    def register_zip(self, name, directory, arc_root, download_name):
+        """Register a ZIP of a directory tree (hidden files/dirs skipped)"""
+        directory = Path(directory)
+
+        def sources():
+            files = []
+            for root, dirs, names in os.walk(directory):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                files.extend(Path(root) / n for n in sorted(names) if not n.startswith('.'))
+            return files
+
+        def build():
+            memory_file = io.BytesIO()
+            with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for file_path in sources():
+                    arcname = Path(arc_root) / file_path.relative_to(directory)
+                    zipf.write(file_path, arcname)
+            return memory_file.getvalue()
+
+        # Already deflated; re-compressing the ZIP gains nothing
+        self._builders[name] = (sources, build, 'application/zip', False, download_name)
+
+    def get(self, name):
+        """Return the CachedAsset for name, rebuilding it if sources changed"""
+        now = time.time()
+        asset = self._assets.get(name)
+        if asset and now - self._checked.get(name, 0) < self.check_interval:
+            return asset
+
+        sources, build, content_type, compress, download_name = self._builders[name]
+        signature = self._signature(sources())
+        if asset and asset.signature == signature:
+            self._checked[name] = now
+            return asset
+
+        with self._lock:
+            asset = self._assets.get(name)
+            if not asset or asset.signature != signature:
+                asset = CachedAsset(build(), content_type, signature,
+                                    compress=compress, download_name=download_name)
+                self._assets[name] = asset
+                print(f"📦 Built static asset '{name}' ({', '.join(asset.variants)})")
+            self._checked[name] = now
+        return asset
+
+    def respond(self, name, accept_encoding=None, if_none_match=None):
+        """
+        Build a response for an asset
+
+        Returns:
+            (body, headers, status) - body is b'' for 304 Not Modified
+        """
+        asset = self.get(name)
+        encoding = negotiate_encoding(accept_encoding, asset.variants)
+        body, etag = asset.variants[encoding]
+
+        headers = {
+            'Content-Type': asset.content_type,
+            'ETag': etag,
+            'Cache-Control': 'no-cache',
+        }
+        if len(asset.variants) > 1:
+            headers['Vary'] = 'Accept-Encoding'
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        if asset.download_name:
+            headers['Content-Disposition'] = f'attachment; filename={asset.download_name}'
+
+        if if_none_match and etag_matches(if_none_match, etag):
+            return b'', headers, 304
+
+        headers['Content-Length'] = str(len(body))
+        return body, headers, 200
+
+    @staticmethod
+    def _signature(files):
+        """Cheap change detector: (path, mtime_ns, size) for every source"""
+        signature = []
+        for f in files:
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+            signature.append((str(f), st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+
+def negotiate_encoding(accept_encoding, available):
+    """Pick the best available encoding from an Accept-Encoding header"""
+    if not accept_encoding:
+        return 'identity'
+
+    weights = {}
+    for part in accept_encoding.split(','):
+        token, _, params = part.strip().partition(';')
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            weights[token] = q
+
+    best = 'identity'
+    best_q = 0.0
+    # Preference order on ties: brotli, gzip, identity
+    for encoding in ('br', 'gzip'):
+        if encoding not in available:
+            continue
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Request Tracing
+Per-request phase timers and a sampling stack profiler
+
+PhaseTimer accumulates wall time per named phase and renders it as a
+`Server-Timing` header. sample_stacks() periodically snapshots every
+thread's stack and returns them in the folded format understood by
+flamegraph.pl and speedscope.
+
+Usage:
+    from tracing import PhaseTimer
+    timer = PhaseTimer()
+    with timer.phase('auth'):
+        validate()
+    response.headers['Server-Timing'] = timer.header()
+"""
+
+import sys
+import time
+import threading
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+    def __init__(self):
+        """Start an empty timer; total time is measured from construction"""
+        self.started = time.perf_counter()
+        self.phases = {}
+
+    def add(self, name, seconds):
+        """Add elapsed seconds to a phase"""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block as part of a phase"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def header(self):
+        """Render phases (plus total) as a Server-Timing header value"""
+        parts = [f"{name.replace(' ', '_')};dur={seconds * 1000:.2f}" for name, seconds in self.phases.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.2f}")
+        return ', '.join(parts)
+
+
+class NullTimer:
+    """Timer that records nothing (used when tracing is not requested)"""
+
+    def add(self, name, seconds):
+        pass
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+
+NULL_TIMER = NullTimer()
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Sample all thread stacks (except the caller's) for a period
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+
+    Returns:
+        Folded stacks ("frame;frame;frame count" per line), hottest first
+    """
+    own_id = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    counts = {}
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            key = ';'.join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+
+    lines = sorted(counts.items(), key=lambda item: item[1], reverse=True)
+    return ''.join(f"{stack} {count}\n" for stack, count in lines)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Buffered Usage Accounting
+Accumulates per-key usage in memory and flushes it to the key store in batches
+
+Every proxied request used to rewrite `.api_keys.json` twice (usage count,
+then tokens). UsageBuffer collects those deltas under a lock and a
+background thread hands them to the key store (KeyStore.apply_usage) as one
+batch every `flush_interval` seconds; flush() is also called on graceful
+shutdown so no accounting is lost. A batch whose write fails is merged back
+and retried with the next flush, and once the buffer is closed every record
+is written straight through (requests that outlive the shutdown deadline
+still get counted).
+
+Usage:
+    from usage import UsageBuffer
+    usage = UsageBuffer(apply_usage=key_store.apply_usage)
+    usage.record_request(key_id)
+    usage.record_tokens(key_id, 12, 340)
+"""
+
+import time
+import threading
+
+
+class UsageBuffer:
+    def __init__(self, apply_usage, flush_interval=2.0):
+        """
+        Initialize the buffer and start the flush thread
+
+        Args:
+            apply_usage: Callable(pending) that adds a batch of deltas to the store
+            flush_interval: Seconds between background flushes (0 = flush on every record)
+        """
+        self.apply_usage = apply_usage
+        self.flush_interval = flush_interval
+
+        self._pending = {}
+        self.closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._thread = None
+        if flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='usage-flusher', daemon=True)
+            self._thread.start()
+
+    def record_request(self, api_key):
+        """Count one request and update last_used"""
+        with self._lock:
+            entry = self._entry(api_key)
+            entry['usage_count'] += 1
+            entry['last_used'] = time.time()
+        self._maybe_flush_now()
+
+    def record_tokens(self, api_key, input_tokens, output_tokens):
+        """Add token usage for a key"""
+        with self._lock:
+            entry = self._entry(api_key)
+            entry['total_input_tokens'] += input_tokens
+            entry['total_output_tokens'] += output_tokens
+        self._maybe_flush_now()
+
+    def pending(self):
+        """Return a copy of the not-yet-flushed deltas"""
+        with self._lock:
+            return {k: dict(v) for k, v in self._pending.items()}
+
+    def flush(self):
+        """Merge pending deltas into the key store (on failure they stay pending)"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                self.apply_usage(pending)
+            except Exception:
+                self._restore(pending)
+                raise
+            return len(pending)
+
+    def _restore(self, pending):
+        """Merge a batch that could not be written back into the pending deltas"""
+        with self._lock:
+            for api_key, delta in pending.items():
+                entry = self._entry(api_key)
+                entry['usage_count'] += delta['usage_count']
+                entry['total_input_tokens'] += delta['total_input_tokens']
+                entry['total_output_tokens'] += delta['total_output_tokens']
+                if delta['last_used']:
+                    entry['last_used'] = max(entry['last_used'] or 0, delta['last_used'])
+
+    def close(self):
+        """
+        Stop the flush thread and write everything still pending
+
+        Records that arrive afterwards are written immediately, so the store
+        must stay open until the process is done recording.
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.closed = True
+        self.flush()
+
+    def _entry(self, api_key):
+        entry = self._pending.get(api_key)
+        if entry is None:
+            entry = self._pending[api_key] = {
+                'usage_count': 0,
+                'last_used': None,
+                'total_input_tokens': 0,
+                'total_output_tokens': 0,
+            }
+        return entry
+
+    def _maybe_flush_now(self):
+        if self.flush_interval <= 0 or self.closed:
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Usage flush failed: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Usage flush failed: {e}")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Multiplexed WebSocket Query Sessions
+Many concurrent queries over one persistent, authenticated connection
+
+A session authenticates once (Authorization header on the upgrade request,
+or an "auth" message first), then accepts any number of "query" messages,
+each tagged with a client-chosen id. Queries run concurrently on a shared
+worker pool and their answer deltas are interleaved on the socket, every
+frame carrying the id it belongs to. A "cancel" message stops one query
+(the upstream response is closed); closing the socket cancels them all.
+
+Protocol (JSON text frames):
+    -> {"type": "auth", "api_key": "sk-..."}
+    <- {"type": "ready"}
+    -> {"type": "query", "id": "q1", "model": "sonar-pro",
+        "messages": [{"role": "user", "content": "..."}]}
+    <- {"type": "delta", "id": "q1", "content": "..."}
+    <- {"type": "done", "id": "q1", "usage": {...}}
+    -> {"type": "cancel", "id": "q1"}
+    <- {"type": "cancelled", "id": "q1"}
+    <- {"type": "error", "id": "q1", "error": "...", "status": 502}
+    -> {"type": "ping"}                 <- {"type": "pong"}
+
+Usage:
+    from ws_sessions import QuerySession
+    QuerySession(ws, authenticate, start_query, executor).run()
+"""
+
+import json
+import time
+import threading
+
+from perplexity_fixed import RequestCancelled
+
+
+class QueryRejected(Exception):
+    """A query that cannot be started; carries the status reported to the client"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class QuerySession:
+    def __init__(self, ws, authenticate, start_query, executor, api_key=None, error_status=None,
+                 max_concurrent=8, auth_timeout=10.0, poll_interval=1.0):
+        """
+        Initialize a session on an accepted WebSocket
+
+        Args:
+            ws: Connection with send(text) and receive(timeout) -> text or None
+            authenticate: Callable(api_key) -> bool, called once per connection
+            start_query: Callable(api_key, message, should_cancel) -> (deltas, finish);
+                deltas is a generator of answer text, finish() records usage and
+                returns the usage block. May raise QueryRejected.
+            executor: Shared concurrent.futures executor the queries run on
+            api_key: Key taken from the upgrade request, if any (still validated)
+            error_status: Callable(exception) -> HTTP-style status for query errors
+            max_concurrent: Queries allowed in flight on this connection
+            auth_timeout: Seconds a client has to authenticate
+            poll_interval: Receive timeout used to check the auth deadline
+        """
+        self.ws = ws
+        self.authenticate = authenticate
+        self.start_query = start_query
+        self.executor = executor
+        self.pending_key = api_key
+        self.error_status = error_status or (lambda e: 502)
+        self.api_key = None
+        self.max_concurrent = max_concurrent
+        self.auth_timeout = auth_timeout
+        self.poll_interval = poll_interval
+
+        self.queries = {}          # id -> cancel Event
+        self._queued = set()       # cancel Events of queries still waiting for a worker
+        self.closed = threading.Event()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def run(self):
+        """Serve the connection until the client goes away (blocks the calling thread)"""
+        started = time.time()
+        try:
+            if self.pending_key and not self._authenticate(self.pending_key):
+                return
+
+            while not self.closed.is_set():
+                if self.api_key is None and time.time() - started > self.auth_timeout:
+                    self.send({'type': 'error', 'error': 'Authentication timed out', 'status': 401})
+                    return
+
+                try:
+                    raw = self.ws.receive(timeout=self.poll_interval)
+                except Exception:
+                    return  # connection closed
+                if raw is None:
+                    continue
+                self.handle(raw)
+        finally:
+            self.close()
+
+    def handle(self, raw):
+        """Dispatch one client frame"""
+        try:
+            message = json.loads(raw)
+            if not isinstance(message, dict):
+                raise ValueError
+        except ValueError:
+            self.send({'type': 'error', 'error': 'Frames must be JSON objects', 'status': 400})
+            return
+
+        kind = message.get('type')
+        if kind == 'ping':
+            self.send({'type': 'pong'})
+        elif kind == 'auth':
+            self._authenticate(message.get('api_key'))
+        elif self.api_key is None:
+            self.send({'type': 'error', 'id': message.get('id'), 'error': 'Not authenticated', 'status': 401})
+        elif kind == 'query':
+            self._submit(message)
+        elif kind == 'cancel':
+            self.cancel(message.get('id'))
+        else:
+            self.send({'type': 'error', 'id': message.get('id'), 'error': f"Unknown message type: {kind}", 'status': 400})
+
+    def _authenticate(self, api_key):
+        if self.api_key is not None:
+            self.send({'type': 'ready'})
+            return True
+        if not api_key or not self.authenticate(api_key):
+            self.send({'type': 'error', 'error': 'Invalid API key', 'status': 401})
+            self.closed.set()
+            return False
+        self.api_key = api_key
+        self.send({'type': 'ready'})
+        return True
+
+    def _submit(self, message):
+        query_id = message.get('id')
+        if not isinstance(query_id, (str, int)) or query_id == '':
+            self.send({'type': 'error', 'error': 'Query id is required', 'status': 400})
+            return
+
+        with self._lock:
+            if query_id in self.queries:
+                error, status = f"Query {query_id} is already running", 409
+            elif len(self.queries) >= self.max_concurrent:
+                error, status = f"Too many concurrent queries (max {self.max_concurrent})", 429
+            else:
+                error, status = None, None
+                cancel_event = self.queries[query_id] = threading.Event()
+                self._queued.add(cancel_event)
+        if error:
+            self.send({'type': 'error', 'id': query_id, 'error': error, 'status': status})
+            return
+
+        try:
+            self.executor.submit(self._run_query, query_id, message, cancel_event)
+        except RuntimeError:
+            # Executor shut down (server stopping)
+            with self._lock:
+                self._queued.discard(cancel_event)
+            self._finish_query(query_id)
+            self.send({'type': 'error', 'id': query_id, 'error': 'Server is shutting down', 'status': 503})
+
+    def cancel(self, query_id):
+        """
+        Cancel one in-flight query; unknown ids are ignored
+
+        A query still waiting for a worker is dropped and reported as
+        cancelled right away; it never reaches start_query.
+        """
+        with self._lock:
+            cancel_event = self.queries.get(query_id)
+            queued = cancel_event in self._queued
+            if queued:
+                self._queued.discard(cancel_event)
+                self.queries.pop(query_id, None)
+        if cancel_event is not None:
+            cancel_event.set()
+        if queued:
+            self.send({'type': 'cancelled', 'id': query_id})
+
+    def close(self):
+        """Cancel everything still running on this connection"""
+        self.closed.set()
+        with self._lock:
+            events = list(self.queries.values())
+        for cancel_event in events:
+            cancel_event.set()
+
+    def send(self, payload):
+        """Send one frame (frames from concurrent queries never interleave mid-frame)"""
+        if self.closed.is_set() and payload.get('type') != 'error':
+            return False
+        try:
+            with self._send_lock:
+                self.ws.send(json.dumps(payload))
+            return True
+        except Exception:
+            self.close()
+            return False
+
+    def _run_query(self, query_id, message, cancel_event):
+        with self._lock:
+            if cancel_event not in self._queued:
+                return  # cancelled while queued (already reported)
+            self._queued.discard(cancel_event)
+
+        deltas = None
+        finish = None
+        cancelled = False
+        try:
+            if cancel_event.is_set():
+                raise RequestCancelled()  # connection closed while queued: no usage, no upstream request
+            deltas, finish = self.start_query(self.api_key, message, cancel_event.is_set)
+            for delta in deltas:
+                if cancel_event.is_set():
+                    raise RequestCancelled()
+                if not self.send({'type': 'delta', 'id': query_id, 'content': delta}):
+                    raise RequestCancelled()
+        except RequestCancelled:
+            cancelled = True
+        except QueryRejected as e:
+            self.send({'type': 'error', 'id': query_id, 'error': str(e), 'status': e.status})
+        except Exception as e:
+            if cancel_event.is_set():
+                cancelled = True
+            else:
+                self.send({'type': 'error', 'id': query_id, 'error': str(e), 'status': self.error_status(e)})
+        else:
+            usage = finish() if finish else None
+            finish = None
+            self.send({'type': 'done', 'id': query_id, 'usage': usage})
+        finally:
+            if deltas is not None:
+                deltas.close()
+            if finish is not None:
+                # Account for whatever was produced before the query ended early
+                finish()
+            self._finish_query(query_id)
+
+        if cancelled:
+            self.send({'type': 'cancelled', 'id': query_id})
+
+    def _finish_query(self, query_id):
+        with self._lock:
+            self.queries.pop(query_id, None)
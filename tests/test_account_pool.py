@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test health-scored routing across multiple upstream accounts
+"""
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from account_pool import (
+    AccountPool, Account, cookie_strings_from_env, cookie_sources_from_env, HEALTHY, EJECTED, PROBING
+)
+from perplexity_fixed import (
+    PerplexityFixed, UpstreamThrottled, UpstreamAuthError, UpstreamError, RequestCancelled, classify_upstream_error
+)
+
+
+class ScriptedClient:
+    """Client whose search() returns or raises what it is told to"""
+
+    def __init__(self, name, outcome='ok'):
+        self.name = name
+        self.outcome = outcome
+        self.calls = 0
+
+    def search(self, query, stream=False, **kwargs):
+        self.calls += 1
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        if stream:
+            return iter([self.name, '!'])
+        return self.name
+
+
+def make_pool(*clients, **kwargs):
+    return AccountPool([Account(c.name, c) for c in clients], **kwargs)
+
+
+def test_cookie_strings_from_env_orders_accounts():
+    env = {'PERPLEXITY_COOKIE_10': 'c=10', 'PERPLEXITY_COOKIE': 'c=1', 'PERPLEXITY_COOKIE_2': 'c=2',
+           'PERPLEXITY_COOKIE_3': ''}
+    assert cookie_strings_from_env(env) == ['c=1', 'c=2', 'c=10']
+
+
+def test_hot_reload_replaces_the_account_from_perplexity_cookie():
+    env = {'PERPLEXITY_COOKIE_2': 'c=2', 'PERPLEXITY_COOKIE_3': 'c=3'}
+    pool = AccountPool.from_cookie_sources(cookie_sources_from_env(env),
+                                           client_factory=lambda cookies: ScriptedClient(cookies['c']))
+    assert [a.name for a in pool.accounts] == ['account-2', 'account-3']
+
+    first = ScriptedClient('1')
+    pool.replace_primary(first)
+    assert [a.name for a in pool.accounts] == ['account-1', 'account-2', 'account-3']
+    assert [a.client.name for a in pool.accounts] == ['1', '2', '3']
+
+    pool.accounts[0].consecutive_failures = 2
+    pool.replace_primary(ScriptedClient('1b'))
+    assert [a.client.name for a in pool.accounts] == ['1b', '2', '3']
+    assert pool.accounts[0].consecutive_failures == 0
+
+
+def test_from_cookie_strings_falls_back_to_anonymous():
+    pool = AccountPool.from_cookie_strings([], client_factory=lambda cookies: ScriptedClient('anon'))
+    assert [a.name for a in pool.accounts] == ['anonymous']
+
+    pool.replace_primary(ScriptedClient('1'))
+    assert [a.name for a in pool.accounts] == ['account-1']
+
+
+def test_throttled_account_is_ejected_and_traffic_moves():
+    a = ScriptedClient('a', UpstreamThrottled('429'))
+    b = ScriptedClient('b')
+    pool = make_pool(a, b)
+    pool.accounts[1].latency = 100.0  # make b look worse so a is tried first
+
+    with pytest.raises(UpstreamThrottled):
+        pool.search('q')
+    assert pool.accounts[0].state == EJECTED
+
+    for _ in range(5):
+        assert pool.search('q') == 'b'
+    assert a.calls == 1
+
+
+def test_auth_failure_uses_long_ejection():
+    pool = make_pool(ScriptedClient('a', UpstreamAuthError('401')), auth_ejection=300, base_ejection=1)
+    with pytest.raises(UpstreamAuthError):
+        pool.search('q')
+    assert pool.accounts[0].ejected_until - time.time() > 200
+
+
+def test_generic_failures_eject_after_threshold():
+    pool = make_pool(ScriptedClient('a', UpstreamError('boom')), ScriptedClient('b'), eject_after=2)
+    pool.accounts[1].latency = 100.0
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            pool.search('q')
+    assert pool.accounts[0].state == EJECTED
+
+
+def test_probe_readmits_recovered_account():
+    a = ScriptedClient('a', UpstreamThrottled('429'))
+    pool = make_pool(a, base_ejection=0.01)
+    with pytest.raises(UpstreamThrottled):
+        pool.search('q')
+    time.sleep(0.02)
+
+    a.outcome = 'ok'
+    account = pool.acquire()
+    assert account.state == PROBING
+    pool.release(account, elapsed=0.1)
+    assert account.state == HEALTHY
+
+
+def test_failed_probe_backs_off():
+    pool = make_pool(ScriptedClient('a', UpstreamError('boom')), base_ejection=0.01, eject_after=1)
+    with pytest.raises(UpstreamError):
+        pool.search('q')
+    first = pool.accounts[0].ejected_until - time.time()
+    time.sleep(0.02)
+    with pytest.raises(UpstreamError):
+        pool.search('q')
+    assert pool.accounts[0].ejected_until - time.time() > first
+
+
+def test_cancellation_does_not_hurt_health():
+    pool = make_pool(ScriptedClient('a', RequestCancelled()))
+    for _ in range(5):
+        with pytest.raises(RequestCancelled):
+            pool.search('q')
+    assert pool.accounts[0].state == HEALTHY
+    assert pool.accounts[0].error_rate == 0.0
+
+
+def test_streaming_outcome_recorded_on_completion():
+    pool = make_pool(ScriptedClient('a'))
+    chunks = pool.search('q', stream=True)
+    assert pool.accounts[0].active == 1
+    assert list(chunks) == ['a', '!']
+    assert pool.accounts[0].active == 0
+    assert pool.accounts[0].latency is not None
+
+
+def test_unstarted_stream_releases_account_on_close():
+    pool = make_pool(ScriptedClient('a'))
+    pool.search('q', stream=True).close()
+    assert pool.accounts[0].active == 0
+
+    pool.search('q', stream=True)   # dropped without being iterated
+    assert pool.accounts[0].active == 0
+    assert pool.accounts[0].error_rate == 0.0
+
+
+def test_sse_error_event_is_classified():
+    client = PerplexityFixed.__new__(PerplexityFixed)
+    with pytest.raises(UpstreamThrottled):
+        client._check_stream_error(b'event: message\r\ndata: {"error_code": "RATE_LIMITED"}')
+    # A null error_code is a normal message
+    client._check_stream_error(b'event: message\r\ndata: {"error_code": null, "text": "hi"}')
+
+
+def test_error_text_is_matched_on_whole_words():
+    assert classify_upstream_error(message='RATE_LIMITED') is UpstreamThrottled
+    assert classify_upstream_error(message='Too many requests') is UpstreamThrottled
+    assert classify_upstream_error(message='AUTH_REQUIRED') is UpstreamAuthError
+    assert classify_upstream_error(message='Unauthorized') is UpstreamAuthError
+    for text in ('failed to generate answer', 'content was moderated', 'unknown author', 'output limit'):
+        assert classify_upstream_error(message=text) is UpstreamError
+    assert classify_upstream_error(429, 'anything') is UpstreamThrottled
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Test /chat/completions response bodies and usage reporting
+"""
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+import perplexity_api_server as server
+from providers import ProviderRouter, LocalProvider
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, 'router', ProviderRouter([LocalProvider(answer='Python is a language.')]))
+    monkeypatch.setattr(server, 'validate_api_key', lambda api_key: 'key-id')
+    monkeypatch.setattr(server, 'increment_api_key_usage', lambda key_id: None)
+    monkeypatch.setattr(server, 'track_api_key_tokens', lambda key_id, prompt, completion: None)
+    return server.app.test_client()
+
+
+def ask(client, headers=None, **body):
+    body.setdefault('messages', [{'role': 'user', 'content': 'What is Python?'}])
+    return client.post('/chat/completions', json=body, headers=headers or {})
+
+
+def test_plain_text_by_default(client):
+    response = ask(client)
+    assert response.mimetype == 'text/plain'
+    assert response.get_data(as_text=True) == 'Python is a language.'
+    assert json.loads(response.headers['X-Usage'])['completion_tokens'] > 0
+
+
+def test_json_clients_get_usage_in_the_body(client):
+    response = ask(client, headers={'Accept': 'application/json'}, model='sonar-pro')
+    body = response.get_json()
+    assert body['object'] == 'chat.completion' and body['model'] == 'sonar-pro'
+    assert body['choices'][0]['message'] == {'role': 'assistant', 'content': 'Python is a language.'}
+    assert body['usage']['total_tokens'] == body['usage']['prompt_tokens'] + body['usage']['completion_tokens']
+
+
+def test_stream_usage_chunk_only_when_requested(client):
+    def chunks(response):
+        lines = response.get_data(as_text=True).split('\n\n')
+        return [json.loads(line[6:]) for line in lines if line.startswith('data: {')]
+
+    plain = chunks(ask(client, stream=True))
+    assert all('usage' not in chunk for chunk in plain)
+
+    with_usage = chunks(ask(client, stream=True, stream_options={'include_usage': True}))
+    assert with_usage[-1]['choices'] == [] and with_usage[-1]['usage']['completion_tokens'] > 0
+    assert all(chunk['usage'] is None for chunk in with_usage[:-1])
+
+
+def test_streamed_requests_are_logged_after_the_last_byte(client, monkeypatch):
+    class Logger:
+        records = []
+
+        def log(self, record):
+            self.records.append(record)
+
+    monkeypatch.setattr(server, 'request_logger', Logger())
+    response = ask(client, stream=True)
+    assert Logger.records == []   # nothing logged while the body is still being sent
+    body = response.get_data()
+    response.close()
+
+    record = Logger.records[0]
+    assert record['path'] == '/chat/completions' and record['status'] == 200
+    assert record['response_bytes'] == len(body)
+    assert record['duration_ms'] > 0
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test the hashed API key store
+"""
+import sys
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from key_store import KeyStore, hash_key
+from usage import UsageBuffer
+
+
+def test_keys_are_stored_hashed(tmp_path):
+    store = KeyStore(tmp_path / 'keys.db')
+    api_key, record = store.create('laptop')
+    store.close()
+
+    assert record['id'] == hash_key(api_key)
+    assert record['prefix'] == api_key[:12]
+    raw = b''.join(p.read_bytes() for p in tmp_path.iterdir())
+    assert api_key.encode() not in raw
+
+    reopened = KeyStore(tmp_path / 'keys.db')
+    assert reopened.verify(api_key) == record['id']
+    assert reopened.verify(api_key + 'x') is None
+    assert reopened.verify(None) is None
+
+
+def test_update_toggle_delete_in_place(tmp_path):
+    store = KeyStore(tmp_path / 'keys.db')
+    api_key, record = store.create('old name')
+    key_id = record['id']
+
+    assert store.update(key_id, name='new name')['name'] == 'new name'
+    assert store.toggle(key_id)['active'] is False
+    assert store.verify(api_key) is None       # disabled keys stop verifying immediately
+    assert store.update(key_id, active=True)['active'] is True
+    assert store.verify(api_key) == key_id
+
+    assert store.update('missing', name='x') is None
+    assert store.delete(key_id)
+    assert not store.delete(key_id)
+    assert store.verify(api_key) is None
+
+
+def test_list_pages_filters_and_sorts(tmp_path):
+    store = KeyStore(tmp_path / 'keys.db')
+    ids = []
+    for i in range(7):
+        _, record = store.create(f"{'team' if i % 2 else 'personal'}-{i}")
+        ids.append(record['id'])
+    store.toggle(ids[0])
+    store.apply_usage({ids[3]: {'usage_count': 5, 'last_used': 2000.0,
+                                'total_input_tokens': 1, 'total_output_tokens': 2}})
+
+    page = store.list(limit=3, sort='name', order='asc')
+    assert page['total'] == 7
+    assert page['next_offset'] == 3
+    assert [k['name'] for k in page['keys']] == ['personal-0', 'personal-2', 'personal-4']
+    last = store.list(offset=6, limit=3, sort='name', order='asc')
+    assert len(last['keys']) == 1 and last['next_offset'] is None
+
+    assert store.list(name='TEAM')['total'] == 3
+    assert store.list(active=False)['keys'][0]['id'] == ids[0]
+    assert store.list(active=True)['total'] == 6
+    used = store.list(used_after=1000)
+    assert [k['id'] for k in used['keys']] == [ids[3]]
+    assert store.list(used_before=1000)['total'] == 0
+    assert store.list(sort='usage_count')['keys'][0]['usage_count'] == 5
+    assert store.list(name='100%_')['total'] == 0   # LIKE wildcards are escaped
+    with pytest.raises(ValueError):
+        store.list(sort='id; DROP TABLE api_keys')
+
+
+def test_usage_buffer_applies_batches(tmp_path):
+    store = KeyStore(tmp_path / 'keys.db')
+    _, record = store.create('busy')
+    usage = UsageBuffer(apply_usage=store.apply_usage, flush_interval=60)
+
+    usage.record_request(record['id'])
+    usage.record_request(record['id'])
+    usage.record_tokens(record['id'], 10, 20)
+    usage.record_request('deleted-key-id')
+    usage.close()
+
+    stored = store.get(record['id'])
+    assert stored['usage_count'] == 2
+    assert stored['total_input_tokens'] == 10
+    assert stored['total_output_tokens'] == 20
+    assert stored['last_used'] > time.time() - 60
+
+
+def test_legacy_file_imported_once(tmp_path):
+    legacy = tmp_path / '.api_keys.json'
+    legacy.write_text(json.dumps({
+        'pplx_legacy_key': {'name': 'old', 'created': 1.0, 'usage_count': 9, 'active': False},
+        'pplx_other_key': {'name': 'other'},
+    }))
+
+    store = KeyStore(tmp_path / 'keys.db', legacy_path=legacy)
+    assert not legacy.exists()
+    assert (tmp_path / '.api_keys.json.migrated').exists()
+    assert store.verify('pplx_other_key') == hash_key('pplx_other_key')
+    assert store.verify('pplx_legacy_key') is None   # imported as inactive
+    assert store.get(hash_key('pplx_legacy_key'))['usage_count'] == 9
+
+    # A deleted key must not come back if the legacy file reappears
+    store.delete(hash_key('pplx_other_key'))
+    store.close()
+    legacy.write_text(json.dumps({'pplx_other_key': {'name': 'other'}}))
+    reopened = KeyStore(tmp_path / 'keys.db', legacy_path=legacy)
+    assert reopened.verify('pplx_other_key') is None
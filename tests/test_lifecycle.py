@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test in-flight draining, disconnect cancellation and buffered usage accounting
+"""
+import sys
+import socket
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src and tests directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from lifecycle import InFlightTracker, Draining, client_disconnected, graceful_shutdown
+from usage import UsageBuffer
+from perplexity_fixed import PerplexityFixed, RequestCancelled
+from test_tracing import FakeResponse, sse_message
+
+
+def test_drain_waits_for_in_flight_and_rejects_new_work():
+    """drain() blocks until tracked requests finish, then new work is refused"""
+    inflight = InFlightTracker()
+    release = threading.Event()
+
+    def request():
+        with inflight.track():
+            release.wait()
+
+    worker = threading.Thread(target=request)
+    worker.start()
+    while inflight.active == 0:
+        time.sleep(0.001)
+
+    threading.Timer(0.05, release.set).start()
+    assert inflight.drain(timeout=5) == 0
+    worker.join()
+
+    with pytest.raises(Draining):
+        with inflight.track():
+            pass
+
+
+def test_drain_gives_up_at_deadline():
+    inflight = InFlightTracker()
+    with inflight.track():
+        assert inflight.drain(timeout=0.05) == 1
+
+
+def test_graceful_shutdown_runs_hooks_then_stops():
+    calls = []
+    graceful_shutdown(InFlightTracker(), lambda: calls.append('stop'),
+                      hooks=[lambda: calls.append('flush')], timeout=0.1)
+    assert calls == ['flush', 'stop']
+
+
+def test_client_disconnected():
+    """A peer that closed its end is detected without consuming data"""
+    server_side, client_side = socket.socketpair()
+    try:
+        assert client_disconnected(server_side) is False
+        client_side.sendall(b'x')
+        assert client_disconnected(server_side) is False
+        assert server_side.recv(1) == b'x'  # data was only peeked
+        client_side.close()
+        assert client_disconnected(server_side) is True
+    finally:
+        server_side.close()
+    assert client_disconnected(None) is False
+
+
+def test_cancel_closes_upstream_response():
+    """should_cancel aborts the SSE read and closes the upstream response"""
+    resp = FakeResponse([sse_message({'blocks': [{'text': 'partial'}]})] * 5)
+    client = PerplexityFixed.__new__(PerplexityFixed)
+
+    with pytest.raises(RequestCancelled):
+        client._get_full_response(resp, should_cancel=lambda: True)
+    assert resp.closed
+
+
+def test_closing_stream_closes_upstream_response():
+    resp = FakeResponse([sse_message({'blocks': [{'text': 'partial'}]})] * 5)
+    stream = PerplexityFixed.__new__(PerplexityFixed)._stream_response(resp)
+    next(stream)
+    stream.close()
+    assert resp.closed
+
+
+def test_usage_buffer_batches_and_flushes():
+    """Deltas accumulate in memory and reach the store as one batch on flush"""
+    batches = []
+    usage = UsageBuffer(apply_usage=batches.append, flush_interval=60)
+
+    usage.record_request('k1')
+    usage.record_request('k1')
+    usage.record_tokens('k1', 3, 7)
+    usage.record_request('k2')
+    assert batches == []
+
+    usage.close()
+    assert len(batches) == 1
+    assert batches[0]['k1']['usage_count'] == 2
+    assert batches[0]['k1']['total_input_tokens'] == 3
+    assert batches[0]['k1']['total_output_tokens'] == 7
+    assert batches[0]['k1']['last_used'] is not None
+    assert batches[0]['k2']['usage_count'] == 1
+    assert usage.pending() == {}
+
+
+def test_usage_batch_is_kept_when_the_write_fails():
+    applied = []
+    failures = [RuntimeError('database is locked')]
+
+    def apply_usage(pending):
+        if failures:
+            raise failures.pop()
+        applied.append(pending)
+
+    usage = UsageBuffer(apply_usage=apply_usage, flush_interval=60)
+    usage.record_request('k1')
+    usage.record_tokens('k1', 3, 7)
+    with pytest.raises(RuntimeError):
+        usage.flush()
+
+    usage.record_request('k1')
+    usage.close()
+    assert applied[0]['k1']['usage_count'] == 2
+    assert applied[0]['k1']['total_output_tokens'] == 7
+
+
+def test_usage_recorded_after_close_is_written_through():
+    """Requests that outlive the shutdown deadline still get counted"""
+    applied = []
+    usage = UsageBuffer(apply_usage=applied.append, flush_interval=60)
+    usage.close()
+    assert applied == []
+
+    usage.record_tokens('late', 5, 9)
+    assert applied == [{'late': {'usage_count': 0, 'last_used': None,
+                                 'total_input_tokens': 5, 'total_output_tokens': 9}}]
+    assert usage.pending() == {}
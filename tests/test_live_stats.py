@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory live stats counters and SSE frame feed
+"""
+import sys
+import json
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from live_stats import LiveStats
+
+
+def parse_frame(event):
+    assert event.startswith('data: ')
+    return json.loads(event[len('data: '):])
+
+
+def make_stats(**kwargs):
+    stats = LiveStats(tick=0.01, **kwargs)
+    stats.load({
+        'k1': {'active': True, 'usage_count': 3, 'total_input_tokens': 10, 'total_output_tokens': 20},
+        'k2': {'active': False, 'usage_count': 1},
+    })
+    return stats
+
+
+def test_load_and_incremental_updates():
+    """Totals start from the key store and move with each event"""
+    stats = make_stats(in_flight=lambda: 2)
+    try:
+        totals = stats.snapshot()
+        assert totals == {'keys': 2, 'active_keys': 1, 'requests': 4,
+                          'input_tokens': 10, 'output_tokens': 20, 'in_flight': 2}
+
+        stats.record_request('k1')
+        stats.record_tokens('k1', 5, 7)
+        stats.record_request('unknown')  # ignored
+        stats.key_added('k3', {'active': True})
+        stats.key_toggled('k2', True)
+        stats.key_removed('k1')
+
+        totals = stats.snapshot()
+        assert totals['requests'] == 5
+        assert totals['input_tokens'] == 15
+        assert totals['keys'] == 2
+        assert totals['active_keys'] == 2
+    finally:
+        stats.close()
+
+
+def test_subscribe_pushes_only_changed_keys():
+    """Subscribers get current totals first, then frames with just the changed keys"""
+    stats = make_stats(cost_calculator=lambda i, o: {'total_saved': i + o})
+    try:
+        feed = stats.subscribe()
+        first = parse_frame(next(feed))
+        assert first['totals']['total_saved'] == 30
+        assert first['keys'] == {}
+
+        stats.record_request('k1')
+        frame = parse_frame(next(feed))
+        assert list(frame['keys']) == ['k1']
+        assert frame['keys']['k1']['usage_count'] == 4
+        assert frame['totals']['requests'] == 5
+        assert frame['seq'] > first['seq']
+
+        stats.key_removed('k2')
+        frame = parse_frame(next(feed))
+        assert frame['keys'] == {'k2': None}
+    finally:
+        stats.close()
+
+
+def test_subscribe_stops_when_asked():
+    stats = make_stats()
+    try:
+        feed = stats.subscribe(should_stop=lambda: True)
+        next(feed)
+        assert list(feed) == []
+    finally:
+        stats.close()
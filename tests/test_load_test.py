@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the fake upstream and load-test helpers
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src and scripts directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+from fake_upstream import FakeUpstream, parse_mode_values
+from load_test import parse_mix, level_report
+from account_pool import AccountPool, Account
+from pipeline import build_pipeline
+from providers import ProviderRouter, PerplexityProvider
+from perplexity_fixed import PerplexityFixed, UpstreamThrottled
+
+
+def test_client_parses_fake_upstream():
+    """PerplexityFixed reads the fake SSE stream like the real one"""
+    upstream = FakeUpstream(latency='0', words='40', chunks='4', chunk_interval='0').start()
+    try:
+        client = PerplexityFixed(base_url=upstream.url)
+        answer = client.search('anything')
+        snapshots = list(client.search('anything', mode='pro', stream=True))
+    finally:
+        upstream.stop()
+
+    assert len(answer.split()) == 40
+    assert len(snapshots) == 5  # 4 growing snapshots + final answer
+    assert all(b.startswith(a) for a, b in zip(snapshots, snapshots[1:]))
+    assert upstream.requests == 2
+
+
+def test_non_streaming_pipeline_uses_final_answer():
+    """A FINAL answer that rewrites the streamed draft wins for non-streaming calls"""
+    upstream = FakeUpstream(latency='0', words='12', chunks='3', chunk_interval='0',
+                            rewrite_final=True).start()
+    try:
+        client = PerplexityFixed(base_url=upstream.url)
+        router = ProviderRouter([PerplexityProvider(AccountPool([Account('a', client)]))])
+        answer = router.search('anything', pipeline_factory=lambda: build_pipeline()[0])
+        snapshots = list(client.search('anything', stream=True))
+    finally:
+        upstream.stop()
+
+    assert answer.endswith(' [1]') and answer[0].isupper()
+    assert not snapshots[-2].endswith(' [1]')
+
+
+def test_fake_upstream_errors_by_mode():
+    upstream = FakeUpstream(latency='0', error_rate='0,pro=1').start()
+    try:
+        client = PerplexityFixed(base_url=upstream.url)
+        assert client.search('fine')
+        with pytest.raises(UpstreamThrottled):
+            client.search('throttled', mode='pro')
+    finally:
+        upstream.stop()
+
+
+def test_mode_values_and_mix():
+    assert parse_mode_values('0.1,pro=0.5') == {None: 0.1, 'pro': 0.5}
+    assert parse_mix('auto=3,pro=1') == [('auto', 0.75), ('pro', 0.25)]
+    with pytest.raises(ValueError):
+        parse_mix('turbo=1')
+
+
+def test_level_report():
+    results = [(200, 0.1)] * 8 + [(502, 0.3), (None, 1.0)]
+    report = level_report(4, 'auto=1', results, 2.0, {'cpu_percent': 10.0, 'rss_mb': None})
+
+    assert report['requests'] == 10
+    assert report['error_rate'] == 0.2
+    assert report['throughput_rps'] == 5.0
+    assert report['latency_ms']['p50'] == 100.0
+    assert report['latency_ms']['max'] == 1000.0
+    assert report['cpu_percent'] == 10.0
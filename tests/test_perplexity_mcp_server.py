@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Test the in-process MCP server and the search result cache
+"""
+import sys
+import time
+from pathlib import Path
+
+import anyio
+from mcp.shared.memory import create_connected_server_and_client_session
+
+# Add src and scripts directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+from fake_upstream import FakeUpstream
+from account_pool import Account, AccountPool
+from perplexity_fixed import PerplexityFixed
+from result_cache import ResultCache
+from perplexity_mcp_server import SearchService, create_server, start_prewarmer, MODE_TOOLS
+
+
+class FakePool:
+    """Streams cumulative snapshots like PerplexityFixed(stream=True)"""
+
+    def __init__(self, words=('Python', 'is', 'a', 'language.')):
+        self.words = list(words)
+        self.calls = []
+
+    def search(self, query, mode='auto', sources=None, stream=False, should_cancel=None):
+        self.calls.append((query, mode, sources))
+
+        def snapshots():
+            for i in range(1, len(self.words) + 1):
+                time.sleep(0.01)
+                yield ' '.join(self.words[:i])
+
+        return snapshots() if stream else ' '.join(self.words)
+
+
+def test_result_cache_ttl_lru_and_keys():
+    cache = ResultCache(max_entries=2, ttl=0.2)
+    assert ResultCache.key(' What  is Python? ', 'pro') == ResultCache.key('what is python?', 'pro', ['web'])
+    assert ResultCache.key('q', sources=['web', 'scholar']) == ResultCache.key('q', sources=['scholar', 'web'])
+
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    cache.put('empty', '')
+    assert cache.get('a') == 'A'     # a is now most recent
+    cache.put('c', 'C')              # evicts b
+    assert cache.get('b') is None
+    assert cache.age('a') is not None
+
+    time.sleep(0.25)
+    assert cache.get('a') is None
+    assert cache.age('c') is None
+    assert cache.stats()['hits'] == 1
+    assert ResultCache.from_env({'RESULT_CACHE_TTL': '0'}) is None
+
+
+def test_tools_stream_progress_and_cache():
+    pool = FakePool()
+    service = SearchService(pool, cache=ResultCache())
+    server = create_server(service)
+
+    async def scenario():
+        progress = []
+
+        async def on_progress(value, total, message):
+            progress.append((value, message))
+
+        async with create_connected_server_and_client_session(server) as client:
+            tools = {t.name for t in (await client.list_tools()).tools}
+            assert tools == set(MODE_TOOLS)
+
+            result = await client.call_tool('perplexity_pro', {'query': 'What is Python?'},
+                                            progress_callback=on_progress)
+            assert result.content[0].text == 'Python is a language.'
+
+            again = await client.call_tool('perplexity_pro', {'query': 'what is python?'})
+            assert again.content[0].text == 'Python is a language.'
+        return progress
+
+    progress = anyio.run(scenario)
+    service.close()
+
+    # Deltas arrive as progress notifications, with increasing progress
+    assert ''.join(message for _, message in progress) == 'Python is a language.'
+    assert [value for value, _ in progress] == sorted(value for value, _ in progress)
+    # Second call was served from the cache
+    assert pool.calls == [('What is Python?', 'pro', ['web'])]
+
+
+def test_final_answer_is_returned_and_cached():
+    """A FINAL answer that rewrites the streamed draft is the tool result"""
+    upstream = FakeUpstream(latency='0', words='12', chunks='3', chunk_interval='0',
+                            rewrite_final=True).start()
+    try:
+        pool = AccountPool([Account('a', PerplexityFixed(base_url=upstream.url))])
+        service = SearchService(pool, cache=ResultCache())
+        deltas = []
+
+        async def on_delta(delta, received):
+            deltas.append(delta)
+
+        answer = anyio.run(lambda: service.search('anything', on_delta=on_delta))
+        service.close()
+    finally:
+        upstream.stop()
+
+    assert answer.endswith(' [1]') and answer[0].isupper()
+    assert service.cache.get(ResultCache.key('anything', 'auto')) == answer
+    assert deltas and not ''.join(deltas).endswith(' [1]')
+
+
+def test_tool_errors_are_reported():
+    class FailingPool:
+        def search(self, *args, **kwargs):
+            raise RuntimeError("upstream down")
+
+    service = SearchService(FailingPool(), cache=ResultCache())
+
+    async def scenario():
+        async with create_connected_server_and_client_session(create_server(service)) as client:
+            return await client.call_tool('perplexity_search', {'query': 'anything'})
+
+    result = anyio.run(scenario)
+    service.close()
+
+    assert result.isError
+    assert 'upstream down' in result.content[0].text
+
+
+def test_prewarmed_answers_are_served_from_cache(tmp_path):
+    schedule = tmp_path / 'prewarm.json'
+    schedule.write_text('[{"query": "What is Python?", "mode": "pro", "interval": 3600}]')
+    pool = FakePool()
+    service = SearchService(pool, cache=ResultCache())
+    prewarmer = start_prewarmer(service, {'PREWARM_FILE': str(schedule), 'PREWARM_MIN_GAP': '0'})
+    try:
+        deadline = time.time() + 2
+        while service.cache.age(ResultCache.key('What is Python?', 'pro')) is None and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        prewarmer.close()
+
+    answer = anyio.run(lambda: service.search('what is python?', mode='pro'))
+    service.close()
+    assert answer == 'Python is a language.'
+    assert len(pool.calls) == 1
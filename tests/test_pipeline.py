@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test the incremental answer post-processing pipeline
+"""
+import sys
+import json
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from pipeline import (
+    Pipeline, SnapshotDeltas, StripCitations, JsonExtract, TokenCounter, build_pipeline, estimate_tokens
+)
+
+
+def split_every(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_snapshot_deltas():
+    """Cumulative snapshots become suffix deltas; non-extensions are dropped"""
+    stage = SnapshotDeltas()
+    assert [stage.feed(s) for s in ['He', 'Hello', 'Hello', 'Hi', 'Hello world']] == \
+        ['He', 'llo', '', '', ' world']
+
+
+def test_strip_citations_across_chunk_boundaries():
+    text = 'Python is great[1][12]. It is popular [3] and fast[4'
+    for size in (1, 2, 3, 7, len(text)):
+        assert Pipeline([StripCitations()]).collect(split_every(text, size)) == \
+            'Python is great. It is popular  and fast[4'
+
+
+def test_json_extract_streaming_matches_whole_text():
+    text = 'Here you go:\n{"title": "a {b}", "tags": ["x", "y\\"]"], "n": {"m": 1}}\nHope that helps!'
+    expected = '{"title": "a {b}", "tags": ["x", "y\\"]"], "n": {"m": 1}}'
+    for size in (1, 4, 9, len(text)):
+        assert Pipeline([JsonExtract()]).collect(split_every(text, size)) == expected
+    assert json.loads(expected)['n'] == {'m': 1}
+
+
+def test_json_extract_without_json_returns_text():
+    assert Pipeline([JsonExtract()]).collect(['plain ', 'text']) == 'plain text'
+    assert Pipeline([JsonExtract()]).collect(['see [note', '] here']) == 'see [note] here'
+
+
+def test_json_extract_skips_invalid_bracketed_text():
+    """Bracketed prose like [local] is not mistaken for JSON"""
+    text = '[source] says: {"a": 1} [2]'
+    for size in (1, 3, len(text)):
+        assert Pipeline([JsonExtract()]).collect(split_every(text, size)) == '{"a": 1}'
+
+
+def test_json_extract_skips_citation_markers():
+    """Citation markers before the JSON are not returned as arrays"""
+    text = 'According to practice [1], here is the task:\n{"title": "x", "dependencies": [1, 2]}'
+    for size in (1, 5, len(text)):
+        assert Pipeline([JsonExtract()]).collect(split_every(text, size)) == \
+            '{"title": "x", "dependencies": [1, 2]}'
+    assert Pipeline([JsonExtract()]).collect(['Sure [2] here {"a"', ': 1}']) == '{"a": 1}'
+
+
+def test_json_extract_prefers_objects_and_whole_text():
+    assert Pipeline([JsonExtract()]).collect(['Steps [1, 2] then ', '{"a": 1}']) == '{"a": 1}'
+    assert Pipeline([JsonExtract()]).collect(['Ids: [1, 2]', ' [3].']) == '[1, 2]'
+    assert Pipeline([JsonExtract()]).collect([' [{"a": 1},', ' {"b": 2}]\n']) == '[{"a": 1}, {"b": 2}]'
+    assert Pipeline([JsonExtract()]).collect(['Only a citation [4].']) == 'Only a citation [4].'
+
+
+def test_token_counter_matches_whole_text_estimate():
+    text = 'one two  three\nfour five six seven'
+    for size in (1, 2, 5):
+        counter = TokenCounter()
+        Pipeline([counter]).collect(split_every(text, size))
+        assert counter.tokens == estimate_tokens(text)
+
+
+def test_build_pipeline_over_snapshots():
+    """Full pipeline on cumulative snapshots, as produced by _stream_response"""
+    pipeline, counter = build_pipeline(json_mode=True, strip_citations=True)
+    snapshots = ['Sure[1]', 'Sure[1]: {"a": ', 'Sure[1]: {"a": [1, 2]}', 'Sure[1]: {"a": [1, 2]} done']
+    deltas = list(pipeline.process(snapshots))
+    assert deltas == ['{"a": [1, 2]}']
+    assert counter.tokens == estimate_tokens('{"a": [1, 2]}')
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Test scheduled result cache prewarming
+"""
+import sys
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from prewarm import Prewarmer, PrewarmEntry, load_schedule
+from providers import ProviderUnavailable
+from result_cache import ResultCache
+from perplexity_fixed import UpstreamError, UpstreamThrottled
+
+
+class FakeSearch:
+    def __init__(self, errors=(), answers=()):
+        self.calls = []
+        self.errors = list(errors)
+        self.answers = list(answers)
+
+    def __call__(self, query, mode, sources, should_cancel=None):
+        self.calls.append((query, mode, tuple(sources)))
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.answers:
+            return self.answers.pop(0)
+        return f"answer to {query}"
+
+
+def test_load_schedule(tmp_path):
+    path = tmp_path / 'prewarm.json'
+    path.write_text(json.dumps([
+        {'query': 'Daily market summary', 'mode': 'pro', 'interval': 86400},
+        {'query': 'Latest Django release', 'sources': ['web', 'social']},
+    ]))
+    entries = load_schedule(path)
+    assert [(e.mode, e.interval) for e in entries] == [('pro', 86400.0), ('auto', 3600.0)]
+    assert entries[1].key == ResultCache.key('latest django release', 'auto', ['social', 'web'])
+
+    path.write_text(json.dumps([{'query': 'x', 'mode': 'turbo'}]))
+    with pytest.raises(ValueError):
+        load_schedule(path)
+    with pytest.raises(ValueError):
+        PrewarmEntry('x', interval=5)
+
+
+def test_refreshes_cold_entries_and_skips_fresh_ones():
+    cache = ResultCache(ttl=60)
+    search = FakeSearch()
+    fresh = PrewarmEntry('already cached', interval=600)
+    cold = PrewarmEntry('market summary', mode='pro', interval=600)
+    cache.put(fresh.key, 'cached by a caller')
+    prewarmer = Prewarmer([fresh, cold], search, cache, min_gap=0)
+
+    assert prewarmer.run_once() == 0.0
+    assert search.calls == [('market summary', 'pro', ('web',))]
+    assert cache.get(cold.key) == 'answer to market summary'
+
+    # Both are warm now; the next refresh is roughly one interval away
+    assert prewarmer.run_once() == prewarmer.max_sleep
+    assert len(search.calls) == 1
+    assert prewarmer.refresh(fresh) is False and prewarmer.skipped == 1
+
+
+def test_prewarmed_entries_outlive_the_cache_ttl():
+    cache = ResultCache(ttl=0.05)
+    entry = PrewarmEntry('release check', interval=60)
+    Prewarmer([entry], FakeSearch(), cache, min_gap=0).run_once()
+
+    cache.put(entry.key, 'a caller refreshed it')  # keeps the prewarm TTL
+    time.sleep(0.1)
+    assert cache.get(entry.key) == 'a caller refreshed it'
+
+
+def test_waits_while_busy_and_spaces_requests():
+    cache = ResultCache()
+    search = FakeSearch()
+    busy = [True]
+    entries = [PrewarmEntry('one', interval=600), PrewarmEntry('two', interval=600)]
+    prewarmer = Prewarmer(entries, search, cache, busy=lambda: busy[0], min_gap=5, poll_interval=0.5)
+
+    assert prewarmer.run_once() == 0.5
+    assert search.calls == []
+
+    busy[0] = False
+    prewarmer.run_once()
+    assert 4 < prewarmer.run_once() <= 5   # min_gap before the second entry
+    assert len(search.calls) == 1
+
+
+def test_throttling_pauses_everything_with_backoff():
+    cache = ResultCache()
+    throttled = ProviderUnavailable('All providers failed')
+    throttled.__cause__ = UpstreamThrottled('rate limited')
+    search = FakeSearch(errors=[throttled, UpstreamThrottled('again')])
+    entry = PrewarmEntry('deep topic', mode='deep research', interval=3600)
+    prewarmer = Prewarmer([entry], search, cache, min_gap=0, base_backoff=30, max_backoff=45)
+
+    prewarmer.run_once()
+    assert 29 < prewarmer.run_once() <= 30
+    prewarmer.paused_until = 0
+    prewarmer.run_once()
+    assert prewarmer.backoff == 45
+    prewarmer.paused_until = 0
+    prewarmer.run_once()
+    assert cache.get(entry.key) == 'answer to deep topic'
+    assert prewarmer.backoff == 0 and entry.failures == 0
+
+
+def test_errors_retry_the_entry_later():
+    cache = ResultCache()
+    search = FakeSearch(errors=[UpstreamError('boom')])
+    entry = PrewarmEntry('flaky', interval=600)
+    prewarmer = Prewarmer([entry], search, cache, min_gap=0, base_backoff=30)
+
+    prewarmer.run_once()
+    assert entry.failures == 1 and 'boom' in entry.last_error
+    assert 29 < prewarmer.run_once() <= 30
+    assert prewarmer.status()['entries'][0]['warm'] is False
+
+
+def test_missing_answers_are_not_cached():
+    cache = ResultCache()
+    search = FakeSearch(answers=['', 'No answer received'])
+    entry = PrewarmEntry('quiet topic', interval=600)
+    prewarmer = Prewarmer([entry], search, cache, min_gap=0, base_backoff=30)
+
+    for _ in range(2):
+        entry.retry_at = 0
+        prewarmer.run_once()
+        assert cache.age(entry.key) is None
+    assert entry.failures == 2 and entry.last_error == 'No answer received'
+
+
+def test_background_thread_warms_the_cache():
+    cache = ResultCache()
+    entry = PrewarmEntry('background', interval=600)
+    prewarmer = Prewarmer([entry], FakeSearch(), cache, min_gap=0).start()
+    try:
+        deadline = time.time() + 2
+        while cache.age(entry.key) is None and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        prewarmer.close()
+    assert prewarmer.status()['entries'][0]['warm'] is True
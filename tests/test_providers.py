@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Test latency-aware provider routing, circuit breakers and failover
+"""
+import sys
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from providers import (
+    ProviderRouter, Provider, LocalProvider, PerplexityProvider, CircuitBreaker, ProviderUnavailable,
+    ProviderTimeout, build_providers, register_provider_type
+)
+from account_pool import Account, AccountPool
+from perplexity_fixed import UpstreamError, RequestCancelled
+
+
+class FailingProvider(Provider):
+    id = 'failing'
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, **kwargs):
+        self.calls += 1
+        raise UpstreamError('down')
+
+
+class NamedLocal(LocalProvider):
+    def __init__(self, provider_id, latency=0.0):
+        super().__init__(latency=latency, answer=provider_id)
+        self.id = provider_id
+
+
+def test_fails_over_and_opens_circuit():
+    """A failing primary falls through to the next provider, then gets skipped"""
+    failing = FailingProvider()
+    router = ProviderRouter([failing, NamedLocal('backup')], failure_threshold=2, reset_seconds=60)
+
+    assert router.search('q') == 'backup'
+    assert router.search('q') == 'backup'
+    assert router.breakers['failing'].state == 'open'
+
+    assert router.search('q') == 'backup'
+    assert failing.calls == 2
+
+
+def test_half_open_probe_closes_circuit():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.01)
+    breaker.on_failure()
+    assert not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.on_attempt()
+    assert not breaker.allow()  # one probe at a time
+    breaker.on_success()
+    assert breaker.state == 'closed'
+
+
+def test_routes_by_rolling_p50_and_skips_slo_breachers():
+    fast, slow = NamedLocal('fast'), NamedLocal('slow')
+    router = ProviderRouter([slow, fast], slo={'auto': 1.0})
+    for _ in range(10):
+        router.window('slow', 'auto').add(0.5)
+        router.window('fast', 'auto').add(0.1)
+    assert [p.id for p in router.route('auto')] == ['fast', 'slow']
+
+    # fast breaches the SLO at p95 -> slow is preferred despite a better p50
+    for _ in range(3):
+        router.window('fast', 'auto').add(5.0)
+    assert [p.id for p in router.route('auto')] == ['slow', 'fast']
+
+
+def test_stalled_provider_times_out_and_fails_over():
+    router = ProviderRouter([NamedLocal('stalled', latency=0.5), NamedLocal('backup')],
+                            timeouts={'auto': 0.05})
+    assert router.search('q') == 'backup'
+    assert router.breakers['stalled'].failures == 1
+
+
+def test_single_stalled_provider_raises_timeout_cause():
+    router = ProviderRouter([NamedLocal('stalled', latency=0.5)], timeouts={'auto': 0.05})
+    with pytest.raises(ProviderUnavailable) as info:
+        router.search('q')
+    assert isinstance(info.value.__cause__, ProviderTimeout)
+
+
+def test_stall_counts_against_the_account():
+    """An abandoned call fails inside the account pool instead of looking cancelled"""
+    class SlowClient:
+        def search(self, query, stream=False, should_cancel=None, **kwargs):
+            time.sleep(0.2)
+            if should_cancel and should_cancel():
+                raise RequestCancelled()
+            return 'late'
+
+    pool = AccountPool([Account('slow', SlowClient())])
+    router = ProviderRouter([PerplexityProvider(pool)], timeouts={'auto': 0.05})
+    with pytest.raises(ProviderUnavailable):
+        router.search('q')
+
+    deadline = time.time() + 2
+    while not pool.accounts[0].last_error and time.time() < deadline:
+        time.sleep(0.01)
+    assert pool.accounts[0].consecutive_failures == 1
+    assert 'ProviderTimeout' in pool.accounts[0].last_error
+
+
+def test_queue_wait_does_not_count_toward_the_timeout():
+    """Calls waiting for a free worker are not timed out or blamed on the provider"""
+    router = ProviderRouter([NamedLocal('slow', latency=0.2)], timeouts={'auto': 0.3}, max_workers=1)
+    with ThreadPoolExecutor(max_workers=2) as callers:
+        results = list(callers.map(lambda _: router.search('q'), range(2)))
+    assert results == ['slow', 'slow']
+    assert router.breakers['slow'].failures == 0
+    assert max(router.window('slow', 'auto').samples) < 0.3
+
+
+def test_calls_get_their_own_thread_without_a_worker_cap():
+    router = ProviderRouter([NamedLocal('slow', latency=0.2)])
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=8) as callers:
+        results = list(callers.map(lambda _: router.search('q'), range(8)))
+    assert results == ['slow'] * 8
+    assert time.time() - start < 1.0
+
+
+def test_cancellation_is_not_a_failure():
+    router = ProviderRouter([LocalProvider()])
+    with pytest.raises(RequestCancelled):
+        router.search('q', should_cancel=lambda: True)
+    assert router.breakers['local'].failures == 0
+
+
+def test_last_enabled_provider_cannot_be_disabled():
+    router = ProviderRouter([NamedLocal('a'), NamedLocal('b')])
+    assert router.set_enabled('a', False) is True
+    assert router.set_enabled('b', False) is False
+    assert [p.id for p in router.route()] == ['b']
+    with pytest.raises(KeyError):
+        router.set_enabled('missing', False)
+
+
+def test_streaming_records_latency():
+    router = ProviderRouter([LocalProvider()])
+    assert list(router.search('hi', stream=True)) == ['[local:auto] hi']
+    assert router.window('local', 'auto').samples
+
+
+def test_stream_closed_early_is_not_recorded():
+    class TwoChunks(LocalProvider):
+        def search(self, query, stream=False, **kwargs):
+            return iter(['a', 'b'])
+
+    router = ProviderRouter([TwoChunks()])
+    stream = router.search('hi', stream=True)
+    assert next(stream) == 'a'
+    stream.close()
+    assert not router.window('local', 'auto').samples
+    assert router.breakers['local'].failures == 0
+
+
+def test_stream_stalling_mid_way_times_out():
+    class Stalls(LocalProvider):
+        def search(self, query, stream=False, should_cancel=None, **kwargs):
+            yield 'a'
+            time.sleep(0.3)
+            should_cancel()
+            yield 'b'
+
+    router = ProviderRouter([Stalls()], timeouts={'auto': 0.1})
+    stream = router.search('hi', stream=True)
+    assert next(stream) == 'a'
+    with pytest.raises(ProviderTimeout):
+        next(stream)
+    assert router.breakers['local'].failures == 1
+
+
+def test_stream_failing_before_the_first_chunk_fails_over():
+    class Stalled(NamedLocal):
+        def search(self, query, stream=False, **kwargs):
+            time.sleep(0.3)
+            return iter(['late'])
+
+    router = ProviderRouter([Stalled('stalled'), NamedLocal('backup')], timeouts={'auto': 0.1})
+    assert list(router.search('hi', stream=True)) == ['backup']
+    assert router.breakers['stalled'].failures == 1
+
+
+def test_stream_latency_excludes_time_spent_by_the_caller():
+    router = ProviderRouter([LocalProvider()])
+    for _ in router.search('hi', stream=True):
+        time.sleep(0.2)
+    assert max(router.window('local', 'auto').samples) < 0.1
+
+
+def test_build_providers_from_spec():
+    register_provider_type('failing', lambda context: FailingProvider())
+    providers = build_providers('failing, local', {'environ': {'LOCAL_PROVIDER_LATENCY': '0.25'}})
+    assert [p.id for p in providers] == ['failing', 'local']
+    assert providers[1].latency == 0.25
+    with pytest.raises(ValueError):
+        build_providers('nope', {})
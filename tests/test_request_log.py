@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Test the buffered JSONL request log and replay loader
+"""
+import sys
+import json
+import time
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Add src and scripts directories to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+from request_log import RequestLogger, REDACTED
+from replay_requests import load_records, replay
+
+
+def read_lines(path):
+    return [json.loads(line) for line in Path(path).read_text().splitlines() if line]
+
+
+def test_writes_and_redacts(tmp_path):
+    """Records are written as JSONL with redacted fields replaced"""
+    log_path = tmp_path / 'requests.jsonl'
+    logger = RequestLogger(log_path, redact_fields=('authorization', 'content'))
+
+    logger.log({'path': '/chat/completions', 'authorization': 'Bearer secret',
+                'body': {'messages': [{'role': 'user', 'content': 'hi'}]}})
+    logger.close()
+
+    records = read_lines(log_path)
+    assert len(records) == 1
+    assert records[0]['authorization'] == REDACTED
+    assert records[0]['body']['messages'][0]['content'] == REDACTED
+    assert records[0]['body']['messages'][0]['role'] == 'user'
+
+
+def test_default_redaction_hides_api_keys(tmp_path):
+    """Admin bodies that carry a full API key are redacted by default"""
+    log_path = tmp_path / 'requests.jsonl'
+    logger = RequestLogger(log_path)
+    logger.log({'method': 'POST', 'path': '/api/delete-key', 'body': {'key': 'pplx_abcdef0123456789'}})
+    logger.close()
+
+    record = read_lines(log_path)[0]
+    assert record['body'] == {'key': REDACTED}
+    assert 'pplx_abcdef' not in log_path.read_text()
+
+
+def test_sampling_zero_keeps_nothing(tmp_path):
+    """A sample rate of 0 drops every record"""
+    logger = RequestLogger(tmp_path / 'requests.jsonl', sample_rate=0.0)
+    for _ in range(10):
+        assert logger.log({'path': '/'}) is False
+    logger.close()
+    assert logger.written == 0
+
+
+def test_full_buffer_drops_instead_of_blocking(tmp_path):
+    """log() returns immediately and counts drops when the buffer is full"""
+    logger = RequestLogger(tmp_path / 'requests.jsonl', buffer_size=1)
+    logger.close()  # stop the writer so nothing drains the buffer
+    logger._closed = False
+    logger._queue = queue.Queue(maxsize=1)
+
+    assert logger.log({'i': 1}) is True
+    assert logger.log({'i': 2}) is False
+    assert logger.dropped == 1
+
+
+def test_size_rotation(tmp_path):
+    """The log rotates once it exceeds max_bytes"""
+    log_path = tmp_path / 'requests.jsonl'
+    logger = RequestLogger(log_path, max_bytes=200)
+    for i in range(20):
+        logger.log({'i': i, 'padding': 'x' * 50})
+    logger.close()
+
+    rotated = list(tmp_path.glob('requests.*.jsonl'))
+    assert logger.rotations > 0
+    assert rotated
+    total = sum(len(read_lines(p)) for p in rotated + [log_path] if p.exists())
+    assert total == 20
+
+
+def test_age_rotation_counts_from_when_the_file_was_started(tmp_path):
+    """A log file left by an earlier run keeps its age across a restart"""
+    log_path = tmp_path / 'requests.jsonl'
+    log_path.write_text(json.dumps({'ts': time.time() - 1000, 'i': 0}) + '\n')
+
+    logger = RequestLogger(log_path, rotate_seconds=500)
+    logger.log({'i': 1})
+    logger.close()
+
+    assert logger.rotations == 1
+    assert [r['i'] for r in read_lines(log_path)] == [1]
+
+
+def test_load_records_filters_and_orders(tmp_path):
+    """The replay loader keeps only requested paths, sorted by timestamp"""
+    log_path = tmp_path / 'requests.jsonl'
+    lines = [
+        {'ts': 3, 'method': 'POST', 'path': '/chat/completions'},
+        {'ts': 1, 'method': 'POST', 'path': '/chat/completions'},
+        {'ts': 2, 'method': 'GET', 'path': '/api/list-keys'},
+    ]
+    log_path.write_text('\n'.join(json.dumps(l) for l in lines) + '\nnot json\n')
+
+    records = load_records(log_path, paths=['/chat/completions'])
+    assert [r['ts'] for r in records] == [1, 3]
+
+
+def test_replay_sends_on_schedule_despite_slow_responses():
+    """Each request goes out at its own time, however long earlier ones take"""
+    class Slow(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(0.5)
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Slow)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        records = [{'ts': i * 0.05, 'method': 'GET', 'path': '/'} for i in range(4)]
+        summary = replay(records, f"http://127.0.0.1:{server.server_port}")
+    finally:
+        server.shutdown()
+
+    assert summary['statuses'] == {'200': 4}
+    assert summary['send_lag_max'] < 0.1
+    assert summary['wall_time'] < 1.0
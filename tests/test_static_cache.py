@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test the cached, precompressed static asset store
+"""
+import os
+import sys
+import gzip
+import zipfile
+import io
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from static_cache import StaticCache, negotiate_encoding, etag_matches
+
+
+def test_gzip_negotiation_and_304(tmp_path):
+    """gzip is served when accepted and a matching ETag yields 304"""
+    page = tmp_path / 'index.html'
+    page.write_text('<html>' + 'dashboard ' * 200 + '</html>')
+
+    cache = StaticCache(check_interval=0)
+    cache.register_file('index', page, 'text/html')
+
+    body, headers, status = cache.respond('index', accept_encoding='gzip')
+    assert status == 200
+    assert headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body) == page.read_bytes()
+
+    body, headers_304, status = cache.respond('index', accept_encoding='gzip',
+                                              if_none_match=headers['ETag'])
+    assert status == 304
+    assert body == b''
+
+    # A different encoding has a different strong ETag
+    _, identity_headers, _ = cache.respond('index')
+    assert identity_headers['ETag'] != headers['ETag']
+    assert 'Content-Encoding' not in identity_headers
+
+
+def test_rebuilds_when_source_changes(tmp_path):
+    """Changing a source mtime invalidates the cached asset"""
+    page = tmp_path / 'index.html'
+    page.write_text('first')
+    cache = StaticCache(check_interval=0)
+    cache.register_file('index', page, 'text/html')
+
+    first = cache.get('index')
+    assert cache.get('index') is first
+
+    page.write_text('second version')
+    st = page.stat()
+    os.utime(page, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    second = cache.get('index')
+    assert second is not first
+    assert second.variants['identity'][0] == b'second version'
+
+
+def test_zip_skips_hidden_files(tmp_path):
+    """Extension ZIP contains visible files under the archive root"""
+    ext = tmp_path / 'extension'
+    (ext / 'scripts').mkdir(parents=True)
+    (ext / 'manifest.json').write_text('{}')
+    (ext / 'scripts' / 'popup.js').write_text('// js')
+    (ext / '.secret').write_text('x')
+
+    cache = StaticCache()
+    cache.register_zip('ext', ext, 'extension', 'ext.zip')
+    body, headers, status = cache.respond('ext', accept_encoding='gzip, br')
+
+    assert status == 200
+    assert 'Content-Encoding' not in headers
+    assert 'ext.zip' in headers['Content-Disposition']
+    names = sorted(zipfile.ZipFile(io.BytesIO(body)).namelist())
+    assert names == ['extension/manifest.json', 'extension/scripts/popup.js']
+
+
+def test_negotiate_encoding():
+    available = {'identity': None, 'gzip': None, 'br': None}
+    assert negotiate_encoding(None, available) == 'identity'
+    assert negotiate_encoding('gzip, deflate, br', available) == 'br'
+    assert negotiate_encoding('br;q=0.5, gzip;q=0.8', available) == 'gzip'
+    assert negotiate_encoding('gzip;q=0', available) == 'identity'
+    assert negotiate_encoding('br', {'identity': None, 'gzip': None}) == 'identity'
+
+
+def test_etag_matches():
+    assert etag_matches('"abc", "def"', '"def"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('*', '"abc"')
+    assert not etag_matches('"abc"', '"abd"')
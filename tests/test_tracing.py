@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test per-request phase timers and the sampling profiler
+"""
+import sys
+import json
+import time
+import threading
+from pathlib import Path
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from tracing import PhaseTimer, sample_stacks
+from perplexity_fixed import PerplexityFixed
+
+
+class FakeResponse:
+    """Minimal stand-in for a curl_cffi streaming response"""
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def iter_lines(self, delimiter=None):
+        for event in self.events:
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+def sse_message(payload):
+    return ('event: message\r\ndata: ' + json.dumps(payload)).encode('utf-8')
+
+
+def test_server_timing_header():
+    """Phases accumulate and render with a total"""
+    timer = PhaseTimer()
+    with timer.phase('auth'):
+        time.sleep(0.01)
+    timer.add('auth', 0.005)
+    timer.add('deep research', 0.001)
+
+    header = timer.header()
+    assert header.startswith('auth;dur=')
+    assert float(header.split(',')[0].split('=')[1]) >= 15
+    assert 'deep_research;dur=' in header
+    assert header.split(', ')[-1].startswith('total;dur=')
+
+
+def test_full_response_records_phases():
+    """Parsing an SSE stream records ttfb, stream and sse_parse"""
+    resp = FakeResponse([
+        sse_message({'blocks': [{'text': 'partial'}]}),
+        sse_message({'blocks': [{'text': 'final answer'}]}),
+        b'event: end_of_stream\r\ndata: {}',
+    ])
+    timer = PhaseTimer()
+    answer = PerplexityFixed.__new__(PerplexityFixed)._get_full_response(resp, timer)
+
+    assert answer == 'final answer'
+    assert {'ttfb', 'stream', 'sse_parse'} <= set(timer.phases)
+
+
+def test_sample_stacks_sees_busy_thread():
+    """The sampler captures other threads in folded format"""
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name='busy')
+    worker.start()
+    try:
+        folded = sample_stacks(0.1, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = [l for l in folded.splitlines() if 'busy_worker' in l]
+    assert lines
+    stack, count = lines[0].rsplit(' ', 1)
+    assert stack.startswith('busy;')
+    assert int(count) > 0
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Test multiplexed WebSocket query sessions
+"""
+import sys
+import json
+import time
+import queue
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+
+from ws_sessions import QuerySession, QueryRejected
+from perplexity_fixed import RequestCancelled
+
+
+class FakeSocket:
+    """In-memory stand-in for a flask-sock connection"""
+
+    def __init__(self):
+        self.inbox = queue.Queue()
+        self.sent = []
+        self.closed = False
+
+    def client_send(self, payload):
+        self.inbox.put(json.dumps(payload))
+
+    def hang_up(self):
+        self.closed = True
+        self.inbox.put(None)
+
+    def receive(self, timeout=None):
+        try:
+            raw = self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if raw is None and self.closed:
+            raise ConnectionError("closed")
+        return raw
+
+    def send(self, text):
+        self.sent.append(json.loads(text))
+
+    def frames(self, kind, query_id=None):
+        return [f for f in self.sent if f['type'] == kind and (query_id is None or f.get('id') == query_id)]
+
+    def wait_for(self, kind, query_id=None, timeout=2.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.frames(kind, query_id):
+                return True
+            time.sleep(0.01)
+        return False
+
+
+def fake_start_query():
+    """start_query that streams the query's words, slowly for "slow" queries"""
+    usage_calls = []
+
+    def start_query(api_key, message, should_cancel):
+        query = message['messages'][0]['content']
+        if query == 'reject':
+            raise QueryRejected("bad query")
+
+        def deltas():
+            for word in query.split():
+                if should_cancel():
+                    raise RequestCancelled()
+                time.sleep(0.2 if query.startswith('slow') else 0.01)
+                yield word + ' '
+
+        def finish():
+            usage_calls.append(query)
+            return {'total_tokens': len(query.split())}
+
+        return deltas(), finish
+
+    return start_query, usage_calls
+
+
+def run_session(ws, start_query, api_key=None, **kwargs):
+    session = QuerySession(ws, authenticate=lambda key: key == 'sk-good', start_query=start_query,
+                           executor=ThreadPoolExecutor(max_workers=4), api_key=api_key,
+                           poll_interval=0.05, **kwargs)
+    thread = threading.Thread(target=session.run, daemon=True)
+    thread.start()
+    return session, thread
+
+
+def query_frame(query_id, content):
+    return {'type': 'query', 'id': query_id, 'messages': [{'role': 'user', 'content': content}]}
+
+
+def test_auth_once_then_interleaved_queries():
+    """Two queries on one connection both stream back, tagged by id"""
+    ws = FakeSocket()
+    start_query, usage_calls = fake_start_query()
+    session, thread = run_session(ws, start_query)
+
+    ws.client_send(query_frame('early', 'too soon'))
+    ws.client_send({'type': 'auth', 'api_key': 'sk-good'})
+    ws.client_send(query_frame('a', 'one two three'))
+    ws.client_send(query_frame('b', 'four five'))
+
+    assert ws.wait_for('done', 'a') and ws.wait_for('done', 'b')
+    assert ws.frames('error', 'early')[0]['status'] == 401
+    assert ws.frames('ready')
+    assert ''.join(f['content'] for f in ws.frames('delta', 'a')) == 'one two three '
+    assert ''.join(f['content'] for f in ws.frames('delta', 'b')) == 'four five '
+    assert ws.frames('done', 'a')[0]['usage'] == {'total_tokens': 3}
+    assert sorted(usage_calls) == ['four five', 'one two three']
+
+    ws.hang_up()
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_invalid_key_closes_session():
+    ws = FakeSocket()
+    start_query, _ = fake_start_query()
+    session, thread = run_session(ws, start_query, api_key='sk-bad')
+    thread.join(2)
+
+    assert not thread.is_alive()
+    assert ws.frames('error')[0]['status'] == 401
+
+
+def test_cancel_one_query_leaves_others_running():
+    ws = FakeSocket()
+    start_query, usage_calls = fake_start_query()
+    session, thread = run_session(ws, start_query, api_key='sk-good')
+
+    ws.client_send(query_frame('slow', 'slow a b c d e f g h'))
+    ws.client_send(query_frame('fast', 'x y'))
+    assert ws.wait_for('delta', 'slow')
+    ws.client_send({'type': 'cancel', 'id': 'slow'})
+
+    assert ws.wait_for('cancelled', 'slow')
+    assert ws.wait_for('done', 'fast')
+    assert not ws.frames('done', 'slow')
+    # Usage is still recorded for the cancelled query
+    assert 'slow a b c d e f g h' in usage_calls
+    assert not session.queries
+
+    ws.hang_up()
+    thread.join(2)
+
+
+def test_cancel_while_queued_never_starts_the_query():
+    ws = FakeSocket()
+    started = []
+    start_query, usage_calls = fake_start_query()
+
+    def tracking_start_query(api_key, message, should_cancel):
+        started.append(message['id'])
+        return start_query(api_key, message, should_cancel)
+
+    session = QuerySession(ws, authenticate=lambda key: True, start_query=tracking_start_query,
+                           executor=ThreadPoolExecutor(max_workers=1), api_key='sk-good', poll_interval=0.05)
+    thread = threading.Thread(target=session.run, daemon=True)
+    thread.start()
+
+    ws.client_send(query_frame('slow', 'slow a b c'))
+    ws.client_send(query_frame('queued', 'x y'))
+    assert ws.wait_for('delta', 'slow')
+    ws.client_send({'type': 'cancel', 'id': 'queued'})
+
+    assert ws.wait_for('cancelled', 'queued', timeout=0.3)   # before the slow query is done
+    assert not ws.frames('done', 'slow')
+    assert ws.wait_for('done', 'slow')
+    assert started == ['slow']
+    assert usage_calls == ['slow a b c']
+    assert len(ws.frames('cancelled', 'queued')) == 1
+
+    ws.hang_up()
+    thread.join(2)
+
+
+def test_duplicate_ids_limits_and_rejections():
+    ws = FakeSocket()
+    start_query, _ = fake_start_query()
+    session, thread = run_session(ws, start_query, api_key='sk-good', max_concurrent=1)
+
+    ws.client_send(query_frame('q', 'slow a b c'))
+    ws.client_send(query_frame('q', 'again'))
+    ws.client_send(query_frame('other', 'more'))
+    ws.client_send({'type': 'bogus', 'id': 'z'})
+    assert ws.wait_for('error', 'z')
+
+    assert ws.frames('error', 'q')[0]['status'] == 409
+    assert ws.frames('error', 'other')[0]['status'] == 429
+    assert ws.wait_for('done', 'q')
+
+    ws.client_send(query_frame('r', 'reject'))
+    assert ws.wait_for('error', 'r')
+    assert ws.frames('error', 'r')[0] == {'type': 'error', 'id': 'r', 'error': 'bad query', 'status': 400}
+
+    ws.hang_up()
+    thread.join(2)
+
+
+def test_hang_up_cancels_running_queries():
+    ws = FakeSocket()
+    start_query, usage_calls = fake_start_query()
+    session, thread = run_session(ws, start_query, api_key='sk-good')
+
+    ws.client_send(query_frame('slow', 'slow a b c d e f g h'))
+    assert ws.wait_for('delta', 'slow')
+    ws.hang_up()
+    thread.join(2)
+
+    deadline = time.time() + 2
+    while session.queries and time.time() < deadline:
+        time.sleep(0.01)
+    assert not session.queries
+    assert usage_calls == ['slow a b c d e f g h']